@@ -0,0 +1,4 @@
+import os
+
+# The benchmarks only call the fake LLM backend so do not need an OpenAI API key.
+os.environ.setdefault('OPENAI_API_KEY', 'fake')
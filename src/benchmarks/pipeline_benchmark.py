@@ -0,0 +1,335 @@
+import argparse
+import functools
+import json
+import logging
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+from data_models.benchmark import PipelineRunResult, PipelineSummary, BenchmarkResults
+from env import env, REPO_ROOT_DIR
+from pipelines.cpt_guideline_ingestion import pipeline as cpt_guideline_ingestion_module
+from pipelines.pre_authorization import pipeline as pre_authorization_module
+from services.db import Database, Collection
+from services.embedding_cache import get_embedding_cache
+from services.guideline_cache import get_guideline_cache
+from services.index_cache import get_index_cache
+from services.llm_cache import get_llm_cache
+from services.llm_provider import get_llm_provider
+from services.pdf_text_cache import get_pdf_text_cache
+from services.query_embeddings import get_prompt_embedding
+
+CPT_GUIDELINE_INGESTION = 'cpt_guideline_ingestion'
+PRE_AUTHORIZATION = 'pre_authorization'
+
+# The pipeline steps timed as stages, by the module of the pipeline which calls them.
+STAGES = {
+    CPT_GUIDELINE_INGESTION: (cpt_guideline_ingestion_module, [
+        'parse_cpt_guidelines_from_pdf',
+        'create_guideline_decision_tree',
+    ]),
+    PRE_AUTHORIZATION: (pre_authorization_module, [
+        'index_medical_record',
+        'extract_requested_cpt_codes',
+        'retrieve_record_context',
+        'extract_record_information',
+        'extract_prior_treatment_information',
+        'are_cpt_guideline_criteria_met',
+    ]),
+}
+
+SAMPLE_DATA_DIR = REPO_ROOT_DIR / 'data'
+SAMPLE_CPT_CODE = '45378'
+SAMPLE_GUIDELINES_FILE_PATH = SAMPLE_DATA_DIR / 'colonoscopy-guidelines.pdf'
+# The decision tree the fake LLM returns for the sample guidelines, so the criteria evaluated are realistic.
+SAMPLE_GUIDELINES_DOCUMENT_PATH = REPO_ROOT_DIR / f'database/mock_nosql_db/cpt_guidelines/{SAMPLE_CPT_CODE}.json'
+
+BENCHMARK_RESULTS_DIR = REPO_ROOT_DIR / 'benchmarks'
+
+
+def run_benchmark(
+        pipelines: list[str] | None = None,
+        repeats: int = 2,
+        llm_latency_seconds: float = 0.5,
+        embedding_latency_seconds: float = 0.1,
+) -> BenchmarkResults:
+    """
+    Runs the pipelines over the sample PDFs in `data/` against the fake LLM backend
+    and measures the latency of each stage, the number of LLM calls and peak memory.
+
+    Notes
+    -----
+    - The benchmark runs against a temporary database, vector DB and file storage with the
+      LLM cache disabled, so the results do not depend on the state of the `database` folder.
+    - The first run for each input is cold, later runs reuse the indexes and LLM clients
+      created by earlier runs in the same process, as the web app would.
+    - Peak memory is measured with `tracemalloc`, which slows down the pipelines slightly.
+
+    Parameters
+    ----------
+    pipelines: list[str] | None
+        The pipelines to benchmark, defaults to both.
+    repeats: int
+        The number of times each pipeline is run for each input.
+    llm_latency_seconds: float
+        The simulated latency of each chat completion.
+    embedding_latency_seconds: float
+        The simulated latency of each embedding request.
+
+    Returns
+    -------
+    BenchmarkResults
+    """
+    pipelines = pipelines or list(STAGES)
+    settings = {
+        'pipelines': pipelines,
+        'repeats': repeats,
+        'llm_latency_seconds': llm_latency_seconds,
+        'embedding_latency_seconds': embedding_latency_seconds,
+        'criteria_evaluation_mode': env.criteria_evaluation_mode,
+        'batched_extraction': env.batched_extraction,
+    }
+
+    runs = []
+    with tempfile.TemporaryDirectory() as temp_dir, _benchmark_env(Path(temp_dir), llm_latency_seconds, embedding_latency_seconds):
+        with open(SAMPLE_GUIDELINES_DOCUMENT_PATH) as file:
+            get_llm_provider().transport.canned_arguments['GuidelineDecisionTree'] = json.load(file)['decision_tree']
+
+        # The guidelines are always ingested as the pre-authorization pipeline needs them.
+        for run in range(repeats if CPT_GUIDELINE_INGESTION in pipelines else 1):
+            result = _run_pipeline(CPT_GUIDELINE_INGESTION, SAMPLE_GUIDELINES_FILE_PATH, run, _ingest_sample_guidelines)
+            if CPT_GUIDELINE_INGESTION in pipelines:
+                runs.append(result)
+
+        if PRE_AUTHORIZATION in pipelines:
+            for medical_record_file_path in sorted(SAMPLE_DATA_DIR.glob('medical-record-*.pdf')):
+                for run in range(repeats):
+                    runs.append(_run_pipeline(
+                        PRE_AUTHORIZATION,
+                        medical_record_file_path,
+                        run,
+                        functools.partial(pre_authorization_module.pre_authorization_pipeline, medical_record_file_path),
+                    ))
+
+    return BenchmarkResults(
+        commit=_current_commit(),
+        created_at=datetime.now(timezone.utc),
+        settings=settings,
+        runs=runs,
+        summaries={pipeline: _summarize([run for run in runs if run.pipeline == pipeline]) for pipeline in pipelines},
+    )
+
+
+def save_benchmark_results(results: BenchmarkResults, results_dir: Path = BENCHMARK_RESULTS_DIR) -> Path:
+    """Saves the results as `<results_dir>/<commit>.json` and returns the file path."""
+    results_dir.mkdir(parents=True, exist_ok=True)
+    file_path = results_dir / f'{results.commit}.json'
+    file_path.write_text(results.model_dump_json(indent=4))
+    return file_path
+
+
+def compare_benchmark_results(baseline: BenchmarkResults, results: BenchmarkResults, threshold: float = 0.1) -> list[str]:
+    """
+    Compares the mean latency of each pipeline and stage, and the mean number of LLM calls,
+    against a baseline and returns a line for each, marking any regression beyond `threshold`.
+    """
+    lines = []
+    for pipeline, summary in results.summaries.items():
+        baseline_summary = baseline.summaries.get(pipeline)
+        if not baseline_summary:
+            continue
+
+        metrics = [('duration_seconds', baseline_summary.mean_duration_seconds, summary.mean_duration_seconds)]
+        metrics += [
+            (f'stage.{stage}', baseline_summary.mean_stage_seconds.get(stage, 0.0), seconds)
+            for stage, seconds in summary.mean_stage_seconds.items()
+        ]
+        metrics += [
+            (f'llm_calls.{name}', baseline_summary.mean_llm_calls.get(name, 0.0), count)
+            for name, count in summary.mean_llm_calls.items()
+        ]
+        metrics.append(('peak_memory_bytes', baseline_summary.max_peak_memory_bytes, summary.max_peak_memory_bytes))
+
+        for name, baseline_value, value in metrics:
+            change = (value - baseline_value) / baseline_value if baseline_value else 0.0
+            flag = ' ❌ REGRESSION' if change > threshold else ' ✅' if change < -threshold else ''
+            lines.append(f'{pipeline} {name}: {baseline_value:.3f} -> {value:.3f} ({change:+.1%}){flag}')
+
+    return lines
+
+
+def _run_pipeline(pipeline: str, input_file_path: Path, run: int, run_pipeline: Callable) -> PipelineRunResult:
+    transport = get_llm_provider().transport
+    llm_calls_before = transport.stats()
+    stage_seconds = {}
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    error = None
+    try:
+        with _timed_stages(pipeline, stage_seconds):
+            run_pipeline()
+    except Exception as exc:
+        logging.exception(f'Benchmark run of {pipeline} failed for {input_file_path}')
+        error = f'{type(exc).__name__}: {exc}'
+    duration_seconds = time.perf_counter() - start_time
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    llm_calls = {name: count - llm_calls_before[name] for name, count in transport.stats().items()}
+    logging.info(f' - {pipeline} {input_file_path.name} run {run}: {duration_seconds:.2f}s, {llm_calls["chat_calls"]} chat calls ✅')
+
+    return PipelineRunResult(
+        pipeline=pipeline,
+        input_file=input_file_path.name,
+        run=run,
+        duration_seconds=duration_seconds,
+        stage_seconds=stage_seconds,
+        llm_calls=llm_calls,
+        peak_memory_bytes=peak_memory_bytes,
+        error=error,
+    )
+
+
+def _ingest_sample_guidelines():
+    guideline_document = cpt_guideline_ingestion_module.cpt_guideline_ingestion_pipeline(
+        cpt_guideline_file_path=SAMPLE_GUIDELINES_FILE_PATH,
+        cpt_code=SAMPLE_CPT_CODE,
+    )
+    Database().create(
+        collection=Collection.CPT_GUIDELINES,
+        document=guideline_document,
+        document_id=SAMPLE_CPT_CODE,
+        overwrite=True,
+    )
+
+
+@contextmanager
+def _timed_stages(pipeline: str, stage_seconds: dict[str, float]) -> Iterator[None]:
+    """Wraps each stage of the pipeline to add up the time spent in it."""
+    module, stage_names = STAGES[pipeline]
+
+    def timed(stage_name: str, stage: Callable) -> Callable:
+        @functools.wraps(stage)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return stage(*args, **kwargs)
+            finally:
+                stage_seconds[stage_name] = stage_seconds.get(stage_name, 0.0) + time.perf_counter() - start_time
+        return wrapper
+
+    stages = {stage_name: getattr(module, stage_name) for stage_name in stage_names}
+    for stage_name, stage in stages.items():
+        setattr(module, stage_name, timed(stage_name, stage))
+    try:
+        yield
+    finally:
+        for stage_name, stage in stages.items():
+            setattr(module, stage_name, stage)
+
+
+@contextmanager
+def _benchmark_env(temp_dir: Path, llm_latency_seconds: float, embedding_latency_seconds: float) -> Iterator[None]:
+    """Points the services at temporary storage and the fake LLM backend, then restores them."""
+    settings = {
+        'db_path': temp_dir / 'db.sqlite3',
+        'mock_nosql_db_dir': temp_dir / 'mock_nosql_db',
+        'vector_db_dir': temp_dir / 'vector_db',
+        'file_storage_dir': temp_dir / 'file_storage',
+        'embedding_cache_db_path': temp_dir / 'embedding_cache.sqlite3',
+        # So the benchmark neither waits for nor uses up the rate limits of a running web app.
+        'llm_rate_limits_db_path': temp_dir / 'llm_rate_limits.sqlite3',
+        'llm_cache_enabled': False,
+        'pdf_text_cache_enabled': False,
+        'embedding_cache_enabled': False,
+        'llm_backend': 'fake',
+        'fake_llm_latency_seconds': llm_latency_seconds,
+        'fake_embedding_latency_seconds': embedding_latency_seconds,
+    }
+    original_settings = {name: getattr(env, name) for name in settings}
+    # The LLM provider builds the scheduler and its shared token buckets.
+    cached_services = [
+        get_llm_provider, get_embedding_cache, get_llm_cache, get_pdf_text_cache, get_index_cache, get_guideline_cache, get_prompt_embedding,
+    ]
+
+    for name, value in settings.items():
+        setattr(env, name, value)
+    for get_service in cached_services:
+        get_service.cache_clear()
+    try:
+        yield
+    finally:
+        for name, value in original_settings.items():
+            setattr(env, name, value)
+        for get_service in cached_services:
+            get_service.cache_clear()
+
+
+def _summarize(runs: list[PipelineRunResult]) -> PipelineSummary:
+    successful_runs = [run for run in runs if not run.error] or runs
+
+    def mean(values: list[float]) -> float:
+        return sum(values) / len(values) if values else 0.0
+
+    return PipelineSummary(
+        run_count=len(runs),
+        error_count=sum(1 for run in runs if run.error),
+        mean_duration_seconds=mean([run.duration_seconds for run in successful_runs]),
+        mean_stage_seconds={
+            stage: mean([run.stage_seconds.get(stage, 0.0) for run in successful_runs])
+            for stage in sorted({stage for run in successful_runs for stage in run.stage_seconds})
+        },
+        mean_llm_calls={
+            name: mean([run.llm_calls.get(name, 0) for run in successful_runs])
+            for name in sorted({name for run in successful_runs for name in run.llm_calls})
+        },
+        max_peak_memory_bytes=max((run.peak_memory_bytes for run in runs), default=0),
+    )
+
+
+def _current_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        is_dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if is_dirty else commit
+
+
+if __name__ == '__main__':
+    """Script for benchmarking the pipelines and comparing the results with an earlier commit."""
+    parser = argparse.ArgumentParser(description='Benchmarks the pipelines against a fake LLM backend.')
+    parser.add_argument('--pipelines', nargs='+', choices=list(STAGES), default=None, help='The pipelines to benchmark.')
+    parser.add_argument('--repeats', type=int, default=2, help='The number of runs for each input.')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='The simulated latency of each LLM call in seconds.')
+    parser.add_argument('--embedding-latency', type=float, default=0.1, help='The simulated latency of each embedding call in seconds.')
+    parser.add_argument('--compare', default=None, help='The commit (or results file) to compare the results with.')
+    parser.add_argument('--verbose', action='store_true', help='Log the output of the pipelines.')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    benchmark_results = run_benchmark(
+        pipelines=args.pipelines,
+        repeats=args.repeats,
+        llm_latency_seconds=args.llm_latency,
+        embedding_latency_seconds=args.embedding_latency,
+    )
+    print(f'Saved results to {save_benchmark_results(benchmark_results)}')
+    for pipeline_name, summary in benchmark_results.summaries.items():
+        print(f'{pipeline_name}: {summary.model_dump_json(indent=4)}')
+
+    if args.compare:
+        baseline_path = Path(args.compare) if args.compare.endswith('.json') else BENCHMARK_RESULTS_DIR / f'{args.compare}.json'
+        baseline_results = BenchmarkResults.model_validate_json(baseline_path.read_text())
+        print('\n'.join(compare_benchmark_results(baseline_results, benchmark_results)))
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class PipelineRunResult(BaseModel):
+    """The measurements for a single run of a pipeline in a benchmark."""
+    pipeline: str
+    input_file: str
+    run: int  # The first run for each input (0) is cold, the rest reuse any indexes and caches.
+    duration_seconds: float
+    stage_seconds: dict[str, float]
+    llm_calls: dict[str, int]
+    peak_memory_bytes: int
+    error: str | None = None
+
+
+class PipelineSummary(BaseModel):
+    """The mean measurements over every run of a pipeline in a benchmark."""
+    run_count: int
+    error_count: int
+    mean_duration_seconds: float
+    mean_stage_seconds: dict[str, float]
+    mean_llm_calls: dict[str, float]
+    max_peak_memory_bytes: int
+
+
+class BenchmarkResults(BaseModel):
+    """The results of a benchmark, stored per commit so they can be compared between commits."""
+    commit: str
+    created_at: datetime
+    settings: dict
+    runs: list[PipelineRunResult]
+    summaries: dict[str, PipelineSummary]
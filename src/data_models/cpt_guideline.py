@@ -35,6 +35,15 @@ class GuidelineDecisionTree(BaseModel):
         return criteria_operator.value if criteria_operator else None
 
 
+class QueryEmbeddings(BaseModel):
+    """
+    The embeddings of the retrieval queries for a set of CPT guidelines, computed when the
+    guidelines are ingested so they are not embedded again for every pre-authorization.
+    """
+    model: str  # Embeddings from a different model than the one used for retrieval are ignored.
+    embeddings: dict[str, list[float]]  # Keyed by the hash of the query.
+
+
 class CPTGuidelineDocument(BaseModel):
     """
     Data model for a document in the 'cpt_guidelines' DB collection.
@@ -43,3 +52,33 @@ class CPTGuidelineDocument(BaseModel):
     cpt_code: str
     guidelines: str
     decision_tree: GuidelineDecisionTree
+    file_sha256: str | None = None  # Used to skip re-ingesting an unchanged file.
+    query_embeddings: QueryEmbeddings | None = None  # None for guidelines ingested before these were computed.
+
+
+class GuidelineIngestionStatus(Enum):
+    INGESTED = 'INGESTED'
+    UNCHANGED = 'UNCHANGED'
+    FAILED = 'FAILED'
+
+
+class GuidelineIngestionResult(BaseModel):
+    """
+    The result of the CPT guideline ingestion pipeline for a single CPT code in a bulk ingestion.
+    """
+    cpt_code: str
+    file_path: str
+    status: GuidelineIngestionStatus
+    error: str | None = None
+    duration_seconds: float
+
+
+class BulkGuidelineIngestionResults(BaseModel):
+    """
+    The results of the CPT guideline ingestion pipeline for a manifest of CPT codes.
+    """
+    results: list[GuidelineIngestionResult]
+    ingested_count: int
+    unchanged_count: int
+    failed_count: int
+    duration_seconds: float
@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+
+
+class WorkerHealth(BaseModel):
+    """
+    Data model for the health and load of a single web app worker process.
+    """
+    pid: int
+    preloaded: bool  # Whether the worker was forked from a master which preloaded the shared state
+    pipelines_loaded: bool  # Whether the pipelines have been imported, otherwise the next request imports them
+    uptime_seconds: float
+    requests_in_flight: int
+    requests_handled: int
+    cpu_seconds: float
+    max_rss_bytes: int
+    guideline_cpt_codes: int
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel, field_serializer
+
+from data_models.pre_authorization import PreAuthorizationDocument
+
+
+class JobStatus(Enum):
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+
+
+class Job(BaseModel):
+    """
+    Data model for a job in the persistent job queue.
+    """
+    job_id: str
+    job_type: str
+    status: JobStatus
+    payload: dict
+    result: dict | None = None
+    error: str | None = None
+    error_status_code: int | None = None
+    attempts: int = 0
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    @field_serializer('status')
+    def serialize_status(self, status: JobStatus, *args):
+        return status.value
+
+
+class PreAuthorizationJob(BaseModel):
+    """
+    Data model for the status and (once finished) the result of a pre-authorization job.
+    """
+    job_id: str
+    status: JobStatus
+    medical_record_file_name: str
+    pre_authorization_id: str | None = None
+    result: PreAuthorizationDocument | None = None
+    error: str | None = None
+    error_status_code: int | None = None
+    attempts: int
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    @field_serializer('status')
+    def serialize_status(self, status: JobStatus, *args):
+        return status.value
@@ -29,16 +29,55 @@ class CriterionResult(BaseModel):
     reason: str
     evidence: str | None = None
     information_required: str | None = None
+    was_evaluated: bool = True
 
 
 class CPTGuidelineResults(BaseModel):
-    are_criteria_met: bool
+    are_criteria_met: bool | None
     criteria_results: list[CriterionResult]
+    llm_calls_saved: int = 0
+    criteria_reused: int = 0
+
+
+class CriterionStatistics(BaseModel):
+    """
+    Data model for a document in the 'criterion_statistics' DB collection which
+    stores the results of past evaluations of a single criterion question.
+    """
+    criterion_question: str | None = None
+    evaluation_count: int = 0
+    met_count: int = 0
+    not_met_count: int = 0
+    # A total rather than a mean, so the statistics of each run can be added atomically.
+    total_latency_seconds: float = 0.0
+
+    @property
+    def mean_latency_seconds(self) -> float:
+        return self.total_latency_seconds / self.evaluation_count if self.evaluation_count else 0.0
+
+
+class CPTCodeResult(BaseModel):
+    """
+    The result of evaluating the guidelines for a single requested CPT code.
+    """
+    cpt_code: str
+    guidelines: str
+    are_guideline_criteria_met: bool | None
+    guideline_criteria_results: list[CriterionResult]
+    llm_calls_saved: int = 0
 
 
 class PreAuthorizationDocument(BaseModel):
     """
     Data model for a document in the 'pre_authorizations' DB collection.
+
+    Notes
+    -----
+    - A medical record may request several procedures. The result for each requested
+      CPT code is in `cpt_code_results` and the top level fields are the result for
+      the first requested CPT code, as for documents created before multiple codes were
+      supported.
+    - The medical record is kept so the document can be re-evaluated when guidelines change.
     """
     cpt_code: str
     exit_reason: ExitReason
@@ -46,7 +85,97 @@ class PreAuthorizationDocument(BaseModel):
     guidelines: str
     are_guideline_criteria_met: bool | None
     guideline_criteria_results: list[CriterionResult]
+    llm_calls_saved: int = 0
+    cpt_code_results: list[CPTCodeResult] = []
+    medical_record_file_path: str | None = None
+    medical_record_content_hash: str | None = None
 
     @field_serializer('exit_reason')
     def serialize_exit_reason(self, exit_reason: ExitReason, *args):
         return exit_reason.value
+
+
+class PreAuthorizationEventType(Enum):
+    CPT_CODES_EXTRACTED = 'cpt_codes_extracted'
+    PRIOR_TREATMENT = 'prior_treatment'
+    CRITERION_RESULT = 'criterion_result'
+    CPT_CODE_RESULT = 'cpt_code_result'
+    COMPLETED = 'completed'
+    ERROR = 'error'
+
+
+class PreAuthorizationEvent(BaseModel):
+    """
+    An event emitted by the pre-authorization pipeline as each stage finishes,
+    only the fields for the type of event are populated.
+
+    Notes
+    -----
+    - CRITERION_RESULT is emitted for each leaf criterion as soon as it is answered, so the
+      results of a CPT code arrive in the order they finish rather than depth-first order.
+    - CPT_CODE_RESULT is emitted once the leaf results of a CPT code have been combined.
+    - COMPLETED or ERROR is always the last event.
+    """
+    event: PreAuthorizationEventType
+    cpt_codes: list[str] | None = None
+    cpt_code: str | None = None
+    prior_treatment: PriorTreatmentInformation | None = None
+    criterion_result: CriterionResult | None = None
+    cpt_code_result: CPTCodeResult | None = None
+    pre_authorization_id: str | None = None
+    pre_authorization: PreAuthorizationDocument | None = None
+    error: str | None = None
+    status_code: int | None = None
+
+
+class BatchRecordResult(BaseModel):
+    """
+    The result of the pre-authorization pipeline for a single medical record in a batch.
+    """
+    medical_record_file_path: str
+    pre_authorization_id: str | None = None
+    pre_authorization: PreAuthorizationDocument | None = None
+    error: str | None = None
+    duration_seconds: float
+
+
+class BatchPreAuthorizationResults(BaseModel):
+    """
+    The results of the pre-authorization pipeline for a batch of medical records.
+    """
+    record_results: list[BatchRecordResult]
+    succeeded_count: int
+    failed_count: int
+    duration_seconds: float
+    records_per_minute: float
+
+
+class ReevaluationStatus(Enum):
+    UPDATED = 'UPDATED'
+    UNCHANGED = 'UNCHANGED'
+    FAILED = 'FAILED'
+
+
+class ReevaluationResult(BaseModel):
+    """
+    The result of re-evaluating a single stored pre-authorization against the current guidelines.
+    """
+    pre_authorization_id: str
+    status: ReevaluationStatus
+    criteria_queried: int = 0
+    criteria_reused: int = 0
+    error: str | None = None
+    duration_seconds: float
+
+
+class BulkReevaluationResults(BaseModel):
+    """
+    The results of re-evaluating the stored pre-authorizations against the current guidelines.
+    """
+    results: list[ReevaluationResult]
+    updated_count: int
+    unchanged_count: int
+    failed_count: int
+    criteria_queried: int
+    criteria_reused: int
+    duration_seconds: float
@@ -15,9 +15,90 @@ class Env(BaseSettings):
     openai_api_key: str
 
     # Database Configuration
-    mock_nosql_db_dir: Path = REPO_ROOT_DIR / 'database/mock_nosql_db'
+    db_path: Path = REPO_ROOT_DIR / 'database/db.sqlite3'
+    db_pool_size: int = 8
+    mock_nosql_db_dir: Path = REPO_ROOT_DIR / 'database/mock_nosql_db'  # Old JSON file layout, imported into a new DB
     vector_db_dir: Path = REPO_ROOT_DIR / 'database/vector_db'
     file_storage_dir: Path = REPO_ROOT_DIR / 'database/file_storage'
+    llm_cache_dir: Path = REPO_ROOT_DIR / 'database/llm_cache'
+    embedding_cache_db_path: Path = REPO_ROOT_DIR / 'database/embedding_cache.sqlite3'
+    pdf_text_cache_dir: Path = REPO_ROOT_DIR / 'database/pdf_text_cache'
+    job_queue_db_path: Path = REPO_ROOT_DIR / 'database/job_queue.sqlite3'
+    llm_rate_limits_db_path: Path = REPO_ROOT_DIR / 'database/llm_rate_limits.sqlite3'  # Shared by every process
+    storage_chunk_size_bytes: int = 1024 * 1024
+
+    # LLM Provider Configuration
+    llm_backend: str = 'openai'  # 'openai' or 'fake', a local stand-in for testing and benchmarking
+    fake_llm_latency_seconds: float = 0.0
+    fake_embedding_latency_seconds: float = 0.0
+    fake_llm_max_concurrent_requests: int | None = None  # More concurrent requests are rate limited
+    fake_llm_rate_limited_fraction: float = 0.0
+    llm_max_connections: int = 20
+    llm_timeout_seconds: float = 60.0
+    llm_max_retries: int = 3
+    llm_requests_per_minute: float = 3_500
+    llm_tokens_per_minute: float = 160_000
+    llm_batch_reserved_fraction: float = 0.2  # Of the rate limits, which batch requests leave for interactive requests
+    llm_initial_concurrency: int = 8  # Adapted to rate limiting and latency up to `llm_max_connections`
+    llm_latency_target_seconds: float = 20.0
+    llm_retry_base_delay_seconds: float = 0.5
+    llm_retry_max_delay_seconds: float = 30.0
+
+    # LLM Cache Configuration
+    llm_cache_enabled: bool = True
+    llm_cache_max_size_bytes: int = 500 * 1024 * 1024
+    llm_cache_max_age_seconds: float = 30 * 24 * 60 * 60
+
+    # Embedding Cache Configuration
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 200_000
+
+    # PDF Text Cache Configuration
+    pdf_text_cache_enabled: bool = True
+    pdf_text_cache_max_size_bytes: int = 100 * 1024 * 1024
+
+    # Guideline Cache Configuration
+    guideline_cache_max_age_seconds: float = 60
+
+    # Index Cache Configuration
+    index_cache_max_size_bytes: int = 512 * 1024 * 1024
+
+    # Job Queue Configuration
+    job_workers: int = 4
+    job_lease_seconds: float = 60
+    job_max_attempts: int = 3
+
+    # Batch Configuration
+    batch_max_workers: int = 4
+    batch_write_size: int = 50
+    guideline_ingestion_max_workers: int = 4
+    reevaluation_max_workers: int = 4
+    reevaluation_page_size: int = 100  # Pre-authorizations read from the DB at a time
+
+    # Web App Configuration
+    web_app_warmup_enabled: bool = True  # Preload the pipelines in the background once the server has started
+    web_app_workers: int | None = None  # Gunicorn worker processes, defaults to one per CPU core
+    web_app_bind: str = '0.0.0.0:80'
+    web_app_max_requests: int = 1000  # Each worker is replaced after about this many requests, 0 to never replace them
+    web_app_max_requests_jitter: int = 100  # So the workers aren't all replaced at once
+    web_app_worker_timeout_seconds: int = 120  # Workers which stop responding for longer are killed and replaced
+    web_app_graceful_timeout_seconds: int = 30
+    web_app_preload_indexes: int = 100  # Medical record indexes loaded before forking the workers
+
+    # Observability Configuration
+    tracing_enabled: bool = True
+
+    # Pipeline Configuration
+    criteria_evaluation_mode: str = 'concurrent'  # 'sequential', 'concurrent', 'lazy' or 'batched'
+    criteria_evaluation_max_workers: int = 8
+    cpt_code_evaluation_max_workers: int = 4
+    batched_extraction: bool = False
+    batched_extraction_batch_size: int = 10
+    batched_extraction_similarity_top_k: int = 10
+    pdf_extraction_max_workers: int = 4
+    pdf_extraction_pages_per_worker: int = 8  # Smaller PDFs are extracted in-process
+    guideline_enumeration_chunk_size_chars: int = 6000
+    guideline_enumeration_max_workers: int = 4
 
     model_config = SettingsConfigDict(
         env_file=find_dotenv('.env'),
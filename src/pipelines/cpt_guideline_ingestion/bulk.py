@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from data_models.cpt_guideline import (
+    CPTGuidelineDocument,
+    GuidelineIngestionStatus,
+    GuidelineIngestionResult,
+    BulkGuidelineIngestionResults,
+)
+from env import env
+from pipelines.cpt_guideline_ingestion.pipeline import cpt_guideline_ingestion_pipeline
+from pipelines.exceptions import PipelineException
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+from services.llm_scheduler import llm_priority, Priority
+from services.tracing import traced, with_current_span
+from utils.hash_utils import sha256_file
+
+
+@traced('cpt_guideline_ingestion.bulk')
+def bulk_cpt_guideline_ingestion_pipeline(
+        manifest: dict[str, str | Path],
+        max_workers: int | None = None,
+        force: bool = False,
+) -> BulkGuidelineIngestionResults:
+    """
+    Runs the CPT guideline ingestion pipeline for many CPT codes concurrently
+    and stores the resulting guidelines in the DB.
+
+    Notes
+    -----
+    - Guidelines whose file has the same SHA-256 as when they were last ingested are skipped.
+    - The pipeline is I/O bound (waiting on GPT), so CPT codes are ingested on a pool of threads.
+    - Every ingested guidelines document is written to the DB in a single transaction once all
+      CPT codes have finished, overwriting any existing guidelines.
+    - A CPT code that fails does not stop the others, its error is reported in the results.
+    - LLM calls are sent with batch priority, so they give way to interactive requests.
+
+    Parameters
+    ----------
+    manifest: dict[str, str | Path]
+        The file path of the guidelines PDF for each CPT code.
+    max_workers: int | None
+        The number of CPT codes ingested at the same time, defaults to the `guideline_ingestion_max_workers` setting.
+    force: bool
+        Whether to re-ingest guidelines even if their file has not changed.
+
+    Returns
+    -------
+    BulkGuidelineIngestionResults
+        The result for each CPT code in the same order as `manifest`.
+    """
+    max_workers = max_workers or env.guideline_ingestion_max_workers
+
+    logging.info(f'Ingesting CPT guidelines for {len(manifest)} CPT codes on {max_workers} threads...')
+
+    start_time = time.perf_counter()
+    db = Database()
+    existing_documents = {} if force else db.read_many(
+        collection=Collection.CPT_GUIDELINES,
+        document_ids=list(manifest),
+        output_class=CPTGuidelineDocument,
+    )
+
+    results: dict[str, GuidelineIngestionResult] = {}
+    ingested_documents: dict[str, CPTGuidelineDocument] = {}
+
+    def ingest(cpt_code: str, file_path: Path, file_sha256: str) -> CPTGuidelineDocument:
+        with llm_priority(Priority.BATCH):
+            return cpt_guideline_ingestion_pipeline(
+                cpt_guideline_file_path=file_path,
+                cpt_code=cpt_code,
+                cpt_guideline_file_sha256=file_sha256,
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for cpt_code, file_path in manifest.items():
+            file_path = Path(file_path)
+            try:
+                file_sha256 = sha256_file(file_path)
+            except OSError as exc:
+                results[cpt_code] = GuidelineIngestionResult(
+                    cpt_code=cpt_code,
+                    file_path=str(file_path),
+                    status=GuidelineIngestionStatus.FAILED,
+                    error=f'Cannot read guidelines file: {exc.strerror}',
+                    duration_seconds=0.0,
+                )
+                continue
+            existing_document = existing_documents.get(cpt_code)
+            if existing_document and existing_document.file_sha256 == file_sha256:
+                results[cpt_code] = GuidelineIngestionResult(
+                    cpt_code=cpt_code,
+                    file_path=str(file_path),
+                    status=GuidelineIngestionStatus.UNCHANGED,
+                    duration_seconds=0.0,
+                )
+                continue
+            future = executor.submit(with_current_span(ingest), cpt_code, file_path, file_sha256)
+            futures[future] = (cpt_code, file_path, time.perf_counter())
+
+        for future in as_completed(futures):
+            cpt_code, file_path, submitted_time = futures[future]
+            error = None
+            try:
+                ingested_documents[cpt_code] = future.result()
+            except PipelineException as exc:
+                error = exc.detail
+            except Exception as exc:
+                logging.exception(f'CPT guideline ingestion pipeline failed for {cpt_code}')
+                error = f'{type(exc).__name__}: {exc}'
+
+            results[cpt_code] = GuidelineIngestionResult(
+                cpt_code=cpt_code,
+                file_path=str(file_path),
+                status=GuidelineIngestionStatus.FAILED if error else GuidelineIngestionStatus.INGESTED,
+                error=error,
+                duration_seconds=time.perf_counter() - submitted_time,
+            )
+            logging.info(f' - {cpt_code} ({file_path}): {"✅" if not error else f"❌ {error}"}')
+
+    if ingested_documents:
+        db.bulk_create(
+            collection=Collection.CPT_GUIDELINES,
+            documents=ingested_documents,
+            overwrite=True,
+        )
+        guideline_cache = get_guideline_cache()
+        for cpt_code in ingested_documents:
+            guideline_cache.invalidate(cpt_code)
+
+    ordered_results = [results[cpt_code] for cpt_code in manifest]
+    status_counts = {
+        status: sum(1 for result in ordered_results if result.status == status)
+        for status in GuidelineIngestionStatus
+    }
+
+    logging.info(
+        f'Successfully ingested CPT guidelines ✅ ({status_counts[GuidelineIngestionStatus.INGESTED]} ingested, '
+        f'{status_counts[GuidelineIngestionStatus.UNCHANGED]} unchanged, {status_counts[GuidelineIngestionStatus.FAILED]} failed)'
+    )
+
+    return BulkGuidelineIngestionResults(
+        results=ordered_results,
+        ingested_count=status_counts[GuidelineIngestionStatus.INGESTED],
+        unchanged_count=status_counts[GuidelineIngestionStatus.UNCHANGED],
+        failed_count=status_counts[GuidelineIngestionStatus.FAILED],
+        duration_seconds=time.perf_counter() - start_time,
+    )
+
+
+def read_manifest(manifest_file_path: str | Path) -> dict[str, Path]:
+    """
+    Reads a manifest of CPT codes from a JSON file of the form `{"<CPT code>": "<guidelines PDF>"}`,
+    where relative file paths are relative to the manifest.
+    """
+    manifest_file_path = Path(manifest_file_path)
+    with open(manifest_file_path) as file:
+        manifest = json.load(file)
+    return {cpt_code: manifest_file_path.parent / file_path for cpt_code, file_path in manifest.items()}
+
+
+if __name__ == '__main__':
+    """Script for ingesting the guidelines for many CPT codes, e.g. when onboarding a payer."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Runs the CPT guideline ingestion pipeline for a manifest of CPT codes.')
+    parser.add_argument('manifest', type=Path, help='A JSON file mapping each CPT code to its guidelines PDF.')
+    parser.add_argument('--max-workers', type=int, default=None, help='The number of CPT codes ingested at the same time.')
+    parser.add_argument('--force', action='store_true', help='Re-ingest guidelines even if their file has not changed.')
+    parser.add_argument('--output', type=Path, default=None, help='Optional file to write the results to as JSON.')
+    args = parser.parse_args()
+
+    results = bulk_cpt_guideline_ingestion_pipeline(
+        manifest=read_manifest(args.manifest),
+        max_workers=args.max_workers,
+        force=args.force,
+    )
+    if args.output:
+        args.output.write_text(results.model_dump_json(indent=4))
+    print(f'{results.ingested_count} ingested, {results.unchanged_count} unchanged, {results.failed_count} failed in {results.duration_seconds:.1f}s')
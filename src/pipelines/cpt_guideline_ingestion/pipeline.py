@@ -5,16 +5,22 @@ from data_models.cpt_guideline import CPTGuidelineDocument
 from pipelines.cpt_guideline_ingestion.pipeline_steps import (
     parse_cpt_guidelines_from_pdf,
     create_guideline_decision_tree,
+    embed_guideline_queries,
 )
+from services.tracing import traced
+from utils.hash_utils import sha256_file
 from utils.pydantic_utils import pretty_print_pydantic
 
 
+@traced('cpt_guideline_ingestion')
 def cpt_guideline_ingestion_pipeline(
         cpt_guideline_file_path: str | Path,
         cpt_code: str,
+        cpt_guideline_file_sha256: str | None = None,
 ) -> CPTGuidelineDocument:
     """
-    Parses guidelines from PDF and creates a logical decision tree.
+    Parses guidelines from PDF, creates a logical decision tree and embeds
+    the questions which are used to query medical records against it.
 
     Parameters
     ----------
@@ -22,6 +28,8 @@ def cpt_guideline_ingestion_pipeline(
         File path for a PDF file containing guidelines for a single CPT code.
     cpt_code:
         The CPT code for which the guidelines are for.
+    cpt_guideline_file_sha256: str | None
+        The SHA-256 of the guidelines file returned by storage, if known, to avoid hashing it again.
 
     Returns
     -------
@@ -30,12 +38,15 @@ def cpt_guideline_ingestion_pipeline(
     """
     cpt_guidelines = parse_cpt_guidelines_from_pdf(cpt_guideline_file_path)
     cpt_guideline_decision_tree = create_guideline_decision_tree(cpt_guidelines)
+    query_embeddings = embed_guideline_queries(cpt_guideline_decision_tree)
 
     return CPTGuidelineDocument(
         file_path=str(cpt_guideline_file_path),
         cpt_code=cpt_code,
         guidelines=cpt_guidelines,
         decision_tree=cpt_guideline_decision_tree,
+        file_sha256=cpt_guideline_file_sha256 or sha256_file(cpt_guideline_file_path),
+        query_embeddings=query_embeddings,
     )
 
 
@@ -1,2 +1,3 @@
 from .parse_guidelines_from_pdf import parse_cpt_guidelines_from_pdf
 from .create_guideline_decision_tree import create_guideline_decision_tree
+from .embed_guideline_queries import embed_guideline_queries
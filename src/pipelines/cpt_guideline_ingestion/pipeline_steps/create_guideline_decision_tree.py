@@ -2,20 +2,37 @@ from __future__ import annotations
 
 import logging
 
-from llama_index.llms import OpenAI
 from llama_index.program import OpenAIPydanticProgram
 
 from data_models.cpt_guideline import GuidelineDecisionTree
+from services.llm_cache import get_llm_cache, llm_cache_key
+from services.llm_provider import get_llm_provider
+from services.tracing import traced, current_span
 from utils.prompt_utils import multiline_prompt
 
+DECISION_TREE_MODEL = 'gpt-3.5-turbo-0613'
 
+
+@traced('cpt_guideline_ingestion.create_guideline_decision_tree')
 def create_guideline_decision_tree(cpt_guidelines: str) -> GuidelineDecisionTree:
     logging.info('Converting CPT guidelines into decision tree...')
 
     prompt_template_str = create_prompt()
 
-    llm = OpenAI(
-        model="gpt-3.5-turbo-0613",
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache_key(
+        model=DECISION_TREE_MODEL,
+        prompt=prompt_template_str.format(cpt_guidelines=cpt_guidelines),
+        output_class=GuidelineDecisionTree,
+    )
+    cached_cpt_guidelines_tree = llm_cache.get_model(cache_key, GuidelineDecisionTree)
+    current_span().set_attribute('llm_cache_hit', cached_cpt_guidelines_tree is not None)
+    if cached_cpt_guidelines_tree is not None:
+        logging.info('Loaded CPT guidelines decision tree from LLM cache ✅')
+        return cached_cpt_guidelines_tree
+
+    llm = get_llm_provider().llm(
+        model=DECISION_TREE_MODEL,
         temperature=0.0,
     )
 
@@ -29,6 +46,7 @@ def create_guideline_decision_tree(cpt_guidelines: str) -> GuidelineDecisionTree
     cpt_guidelines_tree = program(
         cpt_guidelines=cpt_guidelines
     )
+    llm_cache.set_model(cache_key, cpt_guidelines_tree)
 
     logging.info('Successfully converted CPT guidelines into decision tree ✅')
 
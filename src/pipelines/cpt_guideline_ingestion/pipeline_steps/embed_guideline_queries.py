@@ -0,0 +1,33 @@
+import logging
+
+from data_models.cpt_guideline import GuidelineDecisionTree, QueryEmbeddings
+from services.guideline_cache import CompiledGuidelineTree
+from services.query_embeddings import embed_queries
+from services.tracing import traced
+
+
+@traced('cpt_guideline_ingestion.embed_guideline_queries')
+def embed_guideline_queries(decision_tree: GuidelineDecisionTree) -> QueryEmbeddings:
+    """
+    Embeds the queries used to retrieve the medical record when evaluating the guidelines,
+    so a pre-authorization retrieves with these vectors rather than embedding them again.
+
+    Parameters
+    ----------
+    decision_tree: GuidelineDecisionTree
+        A tree of the criteria from the CPT guidelines.
+
+    Returns
+    -------
+    QueryEmbeddings
+        The embedding of the question of each leaf criterion, and of all of them
+        together as used in BATCHED mode.
+    """
+    logging.info('Embedding CPT guideline questions...')
+
+    tree = CompiledGuidelineTree(decision_tree)
+    query_embeddings = embed_queries([*tree.leaf_retrieval_queries, tree.batched_retrieval_query])
+
+    logging.info(f'Successfully embedded CPT guideline questions ✅ ({len(query_embeddings.embeddings)} queries)')
+
+    return query_embeddings
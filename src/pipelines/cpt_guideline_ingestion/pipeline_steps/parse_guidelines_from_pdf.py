@@ -1,18 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import json
 import logging
+import re
 
-from pypdf import PdfReader
-from openai import OpenAI
-
+from env import env
+from services.llm_cache import get_llm_cache, llm_cache_key
+from services.llm_provider import get_llm_provider
+from services.tracing import traced, current_span, span, with_current_span
+from utils.pdf_utils import extract_pdf_pages
 from utils.prompt_utils import multiline_prompt
 
+ENUMERATION_MODEL = 'gpt-3.5-turbo'
+
+# An enumerated bullet point, e.g. '    1.2.3. Aged over 60 years'.
+ENUMERATED_BULLET_POINT_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)*)\.?\s+(.*\S)\s*$')
+
 
+@traced('cpt_guideline_ingestion.parse_cpt_guidelines_from_pdf')
 def parse_cpt_guidelines_from_pdf(pdf_file_path: str | Path):
     """
-    Parses CPT guidelines from the first page of the given PDF, removes additional
+    Parses CPT guidelines from every page of the given PDF, removes additional
     text and enumerates and formats bullet points for easier processing later
     in the pipeline.
 
+    Notes
+    -----
+    - Long guidelines are split into chunks which are enumerated separately, in parallel,
+      then merged into a single hierarchy, so no single prompt grows with the document.
+
     Parameters
     ----------
     pdf_file_path: str | Path
@@ -36,20 +52,128 @@ def parse_cpt_guidelines_from_pdf(pdf_file_path: str | Path):
     """
     logging.info(f'Parsing CPT guidelines from PDF: {pdf_file_path}...')
 
-    reader = PdfReader(str(pdf_file_path))
+    pages = extract_pdf_pages(pdf_file_path)
 
-    cpt_guidelines = reader.pages[0].extract_text()
+    cpt_guidelines = _strip_text_preceding_first_bullet_point('\n'.join(pages))
 
-    cpt_guidelines = _strip_text_preceding_first_bullet_point(cpt_guidelines)
+    chunks = split_into_chunks(cpt_guidelines, env.guideline_enumeration_chunk_size_chars)
+    current_span().set_attribute('chunk_count', len(chunks))
 
-    cpt_guidelines = _convert_to_enumerated_bullet_points(cpt_guidelines)
+    if len(chunks) == 1:
+        cpt_guidelines = _convert_to_enumerated_bullet_points(chunks[0])
+    else:
+        def enumerate_chunk(i: int) -> str:
+            with span('cpt_guideline_ingestion.enumerate_chunk', chunk=i):
+                return _convert_to_enumerated_bullet_points(chunks[i], continuation=i > 0)
+
+        with ThreadPoolExecutor(max_workers=env.guideline_enumeration_max_workers) as executor:
+            enumerated_chunks = list(executor.map(with_current_span(enumerate_chunk), range(len(chunks))))
+
+        cpt_guidelines = merge_enumerated_bullet_points(enumerated_chunks)
 
     logging.info('Successfully parsed CPT guidelines from PDF ✅')
 
     return cpt_guidelines
 
 
-def _convert_to_enumerated_bullet_points(cpt_guidelines: str) -> str:
+def split_into_chunks(text: str, max_chars: int) -> list[str]:
+    """
+    Splits text into chunks of at most `max_chars` characters, where possible, at the start of
+    a bullet point so that a chunk rarely starts part way through one.
+
+    Parameters
+    ----------
+    text: str
+        The raw text parsed from the PDF.
+    max_chars: int
+        The max number of characters in a chunk. A single bullet point longer than this is split
+        at whitespace.
+
+    Returns
+    -------
+    list[str]
+        The chunks, which joined together give the original text.
+    """
+    segments = []
+    for segment in re.split(r'(?=•)', text):
+        while len(segment) > max_chars:
+            split_pos = segment.rfind(' ', 1, max_chars + 1)
+            split_pos = split_pos if split_pos > 0 else max_chars
+            segments.append(segment[:split_pos])
+            segment = segment[split_pos:]
+        segments.append(segment)
+
+    chunks = ['']
+    for segment in segments:
+        if chunks[-1] and len(chunks[-1]) + len(segment) > max_chars:
+            chunks.append('')
+        chunks[-1] += segment
+
+    return chunks
+
+
+def merge_enumerated_bullet_points(enumerated_chunks: list[str]) -> str:
+    """
+    Merges the separately enumerated bullet points of consecutive chunks into a single hierarchy.
+
+    Notes
+    -----
+    - The bullet points of each chunk are renumbered to follow on from the previous chunk.
+    - A chunk which starts part way through a bullet point enumerates it as `0.`, see
+      `_convert_to_enumerated_bullet_points`. Its text is appended to the last bullet point of
+      the previous chunk and its sub-bullet points are appended to the last top level bullet point.
+    - Lines which are not enumerated are appended to the previous bullet point.
+
+    Parameters
+    ----------
+    enumerated_chunks: list[str]
+        The enumerated bullet points of each chunk, in order.
+
+    Returns
+    -------
+    str:
+        The merged, enumerated bullet points in the same format as for a single chunk.
+    """
+    bullet_points: list[list] = []  # [criterion ID, text] pairs, with no ID for text before the first bullet point.
+    child_counts: dict[tuple[int, ...], int] = {}
+
+    for enumerated_chunk in enumerated_chunks:
+        renumbered_ids: dict[tuple[int, ...], tuple[int, ...]] = {(): ()}
+
+        def renumber(criterion_id: tuple[int, ...]) -> tuple[int, ...]:
+            if criterion_id not in renumbered_ids:
+                if criterion_id == (0,) and child_counts.get(()):
+                    renumbered_ids[criterion_id] = (child_counts[()],)
+                else:
+                    parent_id = renumber(criterion_id[:-1])
+                    child_counts[parent_id] = child_counts.get(parent_id, 0) + 1
+                    renumbered_ids[criterion_id] = (*parent_id, child_counts[parent_id])
+            return renumbered_ids[criterion_id]
+
+        for line in enumerated_chunk.splitlines():
+            match = ENUMERATED_BULLET_POINT_PATTERN.match(line)
+            if not match:
+                if line.strip() and bullet_points:
+                    bullet_points[-1][1] += f' {line.strip()}'
+                elif line.strip():
+                    bullet_points.append([None, line.strip()])
+                continue
+
+            criterion_id = tuple(int(number) for number in match[1].split('.'))
+            if criterion_id == (0,) and child_counts.get(()):
+                renumber(criterion_id)
+                bullet_points[-1][1] += f' {match[2]}'
+            else:
+                bullet_points.append([renumber(criterion_id), match[2]])
+
+    return '\n'.join(
+        text if criterion_id is None
+        else '    ' * (len(criterion_id) - 1) + '.'.join(map(str, criterion_id)) + f'. {text}'
+        for criterion_id, text in bullet_points
+    )
+
+
+def _convert_to_enumerated_bullet_points(cpt_guidelines: str, continuation: bool = False) -> str:
     """
     Calls GPT to convert raw CPT guidelines into well formatted, enumerated bullet points.
 
@@ -63,6 +187,9 @@ def _convert_to_enumerated_bullet_points(cpt_guidelines: str) -> str:
     ----------
     cpt_guidelines: str
         The raw CPT guidelines parsed from the PDF.
+    continuation: bool
+        Whether the text is a chunk which follows on from another chunk, so may start part way
+        through a bullet point.
 
     Returns
     -------
@@ -92,6 +219,14 @@ def _convert_to_enumerated_bullet_points(cpt_guidelines: str) -> str:
         Ignore any text that comes before or after the block of bullet points.
         """
     )
+    if continuation:
+        system_prompt += '\n\n' + multiline_prompt(
+            """
+            The text is part of a longer document so it may start part way through a bullet point.
+            
+            If it does, number that bullet point 0. and its sub-bullet points 0.1., 0.2., etc.
+            """
+        )
 
     example1_input = multiline_prompt(
             """
@@ -128,14 +263,22 @@ def _convert_to_enumerated_bullet_points(cpt_guidelines: str) -> str:
         }
     ]
 
-    client = OpenAI()
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache_key(model=ENUMERATION_MODEL, prompt=json.dumps(messages))
+    cached_cpt_guidelines = llm_cache.get(cache_key)
+    current_span().set_attribute('llm_cache_hit', cached_cpt_guidelines is not None)
+    if cached_cpt_guidelines is not None:
+        return cached_cpt_guidelines
+
+    client = get_llm_provider().openai_client
     response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
+        model=ENUMERATION_MODEL,
         messages=messages,
         temperature=0
     )
 
     cpt_guidelines = response.choices[0].message.content
+    llm_cache.set(cache_key, cpt_guidelines)
 
     return cpt_guidelines
 
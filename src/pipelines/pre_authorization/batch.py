@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from uuid import uuid4
+
+from data_models.pre_authorization import BatchRecordResult, BatchPreAuthorizationResults
+from env import env
+from pipelines.exceptions import PipelineException
+from pipelines.pre_authorization.pipeline import pre_authorization_pipeline
+from services.db import Database, Collection
+from services.llm_scheduler import llm_priority, Priority
+
+
+def batch_pre_authorization_pipeline(
+        medical_record_file_paths: list[str | Path],
+        max_workers: int | None = None,
+        write_batch_size: int | None = None,
+) -> BatchPreAuthorizationResults:
+    """
+    Runs the pre-authorization pipeline for many medical records in parallel
+    across a pool of worker processes and stores the results in the DB.
+
+    Notes
+    -----
+    - Each worker process is long-lived, so the guideline cache, loaded indexes
+      and LLM cache in that process are shared by every record it processes.
+    - Results are written to the 'pre_authorizations' collection in bulk, every
+      `write_batch_size` records.
+    - A record that fails does not stop the batch, its error is reported in the results. If a worker
+      process dies the records it and the other workers had not finished are reported as failed.
+    - Progress, throughput and any failure are logged as each record finishes.
+    - LLM calls are sent with batch priority, so they give way to interactive requests.
+
+    Parameters
+    ----------
+    medical_record_file_paths: list[str | Path]
+        File paths for the medical records.
+    max_workers: int | None
+        The number of worker processes, defaults to the `batch_max_workers` setting.
+    write_batch_size: int | None
+        The number of results written to the DB at once, defaults to the `batch_write_size` setting.
+
+    Returns
+    -------
+    BatchPreAuthorizationResults
+        The result for each record in the same order as `medical_record_file_paths`.
+    """
+    max_workers = max_workers or env.batch_max_workers
+    write_batch_size = write_batch_size or env.batch_write_size
+
+    logging.info(f'Running pre-authorization pipeline for {len(medical_record_file_paths)} medical records on {max_workers} processes...')
+
+    start_time = time.perf_counter()
+    record_results: list[BatchRecordResult | None] = [None] * len(medical_record_file_paths)
+    unwritten_results: list[BatchRecordResult] = []
+    completed_count = 0
+
+    # Spawn rather than fork as the parent process may be running threads, e.g. in the web app.
+    try:
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_initialize_worker,
+                initargs=(logging.getLogger().getEffectiveLevel(),),
+        ) as executor:
+            futures = {
+                executor.submit(_run_record, str(file_path)): i
+                for i, file_path in enumerate(medical_record_file_paths)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    record_result = future.result()
+                except Exception as exc:
+                    # The worker process died (e.g. ran out of memory), which also fails every record still pending.
+                    record_result = BatchRecordResult(
+                        medical_record_file_path=str(medical_record_file_paths[i]),
+                        error=f'{type(exc).__name__}: {exc}',
+                        duration_seconds=0.0,
+                    )
+                record_results[i] = record_result
+                completed_count += 1
+
+                if record_result.pre_authorization:
+                    unwritten_results.append(record_result)
+                if len(unwritten_results) >= write_batch_size:
+                    _write_results(unwritten_results)
+                    unwritten_results = []
+
+                _log_progress(record_result, completed_count, len(futures), time.perf_counter() - start_time)
+    finally:
+        # Completed records are always stored, even if the batch is interrupted.
+        if unwritten_results:
+            _write_results(unwritten_results)
+
+    duration_seconds = time.perf_counter() - start_time
+    succeeded_count = sum(1 for record_result in record_results if record_result.pre_authorization)
+
+    logging.info(f'Successfully ran pre-authorization pipeline for {succeeded_count}/{len(record_results)} medical records ✅')
+
+    return BatchPreAuthorizationResults(
+        record_results=record_results,
+        succeeded_count=succeeded_count,
+        failed_count=len(record_results) - succeeded_count,
+        duration_seconds=duration_seconds,
+        records_per_minute=60 * len(record_results) / duration_seconds if duration_seconds else 0.0,
+    )
+
+
+def _initialize_worker(log_level: int):
+    logging.basicConfig(level=log_level)
+
+
+def _run_record(medical_record_file_path: str) -> BatchRecordResult:
+    """Runs the pipeline for a single record in a worker process."""
+    start_time = time.perf_counter()
+    try:
+        with llm_priority(Priority.BATCH):
+            pre_authorization_document = pre_authorization_pipeline(
+                medical_record_file_path=Path(medical_record_file_path),
+            )
+    except PipelineException as exc:
+        error = exc.detail
+    except Exception as exc:
+        logging.exception(f'Pre-authorization pipeline failed for {medical_record_file_path}')
+        error = f'{type(exc).__name__}: {exc}'
+    else:
+        return BatchRecordResult(
+            medical_record_file_path=medical_record_file_path,
+            pre_authorization_id=str(uuid4()),
+            pre_authorization=pre_authorization_document,
+            duration_seconds=time.perf_counter() - start_time,
+        )
+
+    return BatchRecordResult(
+        medical_record_file_path=medical_record_file_path,
+        error=error,
+        duration_seconds=time.perf_counter() - start_time,
+    )
+
+
+def _write_results(record_results: list[BatchRecordResult]):
+    Database().bulk_create(
+        collection=Collection.PRE_AUTHORIZATIONS,
+        documents={
+            record_result.pre_authorization_id: record_result.pre_authorization
+            for record_result in record_results
+        },
+    )
+
+
+def _log_progress(record_result: BatchRecordResult, completed_count: int, total_count: int, elapsed_seconds: float):
+    status = '✅' if record_result.pre_authorization else f'❌ {record_result.error}'
+    logging.info(
+        f' - [{completed_count}/{total_count}] {record_result.medical_record_file_path} '
+        f'({record_result.duration_seconds:.1f}s, {60 * completed_count / elapsed_seconds:.1f} records/min): {status}'
+    )
+
+
+def find_medical_records(paths: list[str | Path]) -> list[Path]:
+    """Expands any directories into the PDF files they contain."""
+    file_paths = []
+    for path in map(Path, paths):
+        file_paths.extend(sorted(path.glob('*.pdf')) if path.is_dir() else [path])
+    return file_paths
+
+
+if __name__ == '__main__':
+    """Script for running the pipeline over many medical records, e.g. for a backfill."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Runs the pre-authorization pipeline for many medical records.')
+    parser.add_argument('paths', nargs='+', help='Medical record PDF files and/or directories of them.')
+    parser.add_argument('--max-workers', type=int, default=None, help='The number of worker processes.')
+    parser.add_argument('--output', type=Path, default=None, help='Optional file to write the results to as JSON.')
+    args = parser.parse_args()
+
+    results = batch_pre_authorization_pipeline(
+        medical_record_file_paths=find_medical_records(args.paths),
+        max_workers=args.max_workers,
+    )
+    if args.output:
+        args.output.write_text(results.model_dump_json(indent=4))
+    print(f'{results.succeeded_count} succeeded, {results.failed_count} failed in {results.duration_seconds:.1f}s ({results.records_per_minute:.1f} records/min)')
@@ -1,83 +1,239 @@
 from __future__ import annotations
 
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterator
 
-from data_models.cpt_guideline import CPTGuidelineDocument
-from data_models.pre_authorization import PreAuthorizationDocument, ExitReason
+from data_models.pre_authorization import (
+    PreAuthorizationDocument,
+    ExitReason,
+    CPTCodeResult,
+    PriorTreatmentInformation,
+    PreAuthorizationEvent,
+    PreAuthorizationEventType,
+)
 from pipelines.exceptions import PipelineException
 from pipelines.pre_authorization.pipeline_steps import (
     index_medical_record,
     extract_requested_cpt_codes,
     extract_prior_treatment_information,
     are_cpt_guideline_criteria_met,
+    retrieve_record_context,
+    extract_record_information,
 )
+from pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met import CriteriaEvaluationMode
 
-from services.db import Database, Collection
+from env import env
+from services.guideline_cache import get_guideline_cache
+from services.tracing import traced, span, current_span, with_current_span
 from utils.pydantic_utils import pretty_print_pydantic
 
-logging.basicConfig(level=logging.INFO)
-
 
+@traced('pre_authorization')
 def pre_authorization_pipeline(
         medical_record_file_path: str | Path,
         force_reindex: bool = False,
+        medical_record_content_hash: str | None = None,
+        batched_extraction: bool | None = None,
+        on_event: Callable[[PreAuthorizationEvent], None] | None = None,
 ) -> PreAuthorizationDocument:
+    """
+    Runs the pre-authorization pipeline for a single medical record, evaluating the
+    guidelines for every CPT code it requests.
+
+    Notes
+    -----
+    - The medical record is indexed and prior treatment is extracted once, then the guidelines
+      for each CPT code are evaluated concurrently over the same index, so each additional
+      CPT code only costs the queries for its own criteria.
+    - Retrieval uses the query embeddings computed when the guidelines were ingested, and the fixed
+      extraction prompts are embedded once per process, so no queries are embedded per medical record.
+
+    Parameters
+    ----------
+    medical_record_file_path: str | Path
+        File path for a single medical record.
+    force_reindex: bool
+        Whether to force a reindex if this document has already been indexed.
+    medical_record_content_hash: str | None
+        The SHA-256 of the medical record returned by storage, if known, to avoid hashing it again.
+    batched_extraction: bool | None
+        Whether to retrieve the medical record once and answer the questions about it
+        together in a few LLM calls, rather than with a separate RAG query per question.
+        Defaults to the `batched_extraction` setting.
+    on_event: Callable[[PreAuthorizationEvent], None] | None
+        Called as each stage of the pipeline finishes, see `pre_authorization_pipeline_events`.
+        This may be called from several threads at once.
+
+    Returns
+    -------
+    PreAuthorizationDocument
+        The results for every requested CPT code, with those for the first at the top level.
+    """
+    batched_extraction = env.batched_extraction if batched_extraction is None else batched_extraction
+    emit = on_event or (lambda event: None)
+
     # 1) Load and index medical record for RAG pipeline.
     index = index_medical_record(
         medical_record_file_path=medical_record_file_path,
         force_reindex=force_reindex,
+        content_hash=medical_record_content_hash,
     )
 
     # 2) Extract requested CPT code(s) from medical record.
-    cpt_codes = extract_requested_cpt_codes(index)
+    if batched_extraction:
+        # Prior treatment is extracted in the same LLM call as the CPT codes.
+        context = retrieve_record_context(index)
+        record_information = extract_record_information(context)
+        cpt_codes = record_information.requested_cpt_codes.cpt_codes
+    else:
+        cpt_codes = extract_requested_cpt_codes(index)
     if not cpt_codes:
         raise PipelineException(
             detail='Could not find CPT code for requested procedure in medical record'
         )
-    cpt_code = cpt_codes[0]  # todo handle case with >1 requested procedures.
-
-    # 3) Load parsed CPT guidelines from database.
-    db = Database()
-    guidelines_document = db.read(
-        collection=Collection.CPT_GUIDELINES,
-        document_id=cpt_code,
-        output_class=CPTGuidelineDocument,
-    )
-    if not guidelines_document:
+    cpt_codes = list(dict.fromkeys(cpt_codes))  # Remove duplicates, keeping the requested order.
+    current_span().set_attribute('cpt_code_count', len(cpt_codes))
+    emit(PreAuthorizationEvent(event=PreAuthorizationEventType.CPT_CODES_EXTRACTED, cpt_codes=cpt_codes))
+
+    # 3) Load parsed CPT guidelines for every requested CPT code from the guideline cache (or database).
+    guidelines = get_guideline_cache().get_many(cpt_codes)
+    missing_cpt_codes = [cpt_code for cpt_code in cpt_codes if not guidelines[cpt_code]]
+    if missing_cpt_codes:
         raise PipelineException(
-            detail=f"Guidelines for requested CPT code {cpt_code} have not been ingested yet. "
+            detail=f"Guidelines for requested CPT code(s) {', '.join(missing_cpt_codes)} have not been ingested yet. "
                    f"Submit the guidelines file via the POST /pre-authorization/guidelines endpoint.",
             status_code=400,
         )
 
-    # 4) Determine whether prior treatment was attempted and successful.
-    prior_treatment = extract_prior_treatment_information(index)
+    # 4) Determine whether prior treatment was attempted and successful, once for every CPT code.
+    if batched_extraction:
+        prior_treatment = record_information.prior_treatment
+    else:
+        prior_treatment = extract_prior_treatment_information(index)
+    emit(PreAuthorizationEvent(event=PreAuthorizationEventType.PRIOR_TREATMENT, prior_treatment=prior_treatment))
 
     # 6) If prior treatment was successful, exist pipeline.
     if prior_treatment.was_treatment_attempted and prior_treatment.was_treatment_successful:
-        return PreAuthorizationDocument(
+        cpt_code_results = [
+            CPTCodeResult(
+                cpt_code=cpt_code,
+                guidelines=guidelines[cpt_code].document.guidelines,
+                are_guideline_criteria_met=None,
+                guideline_criteria_results=[],
+            )
+            for cpt_code in cpt_codes
+        ]
+        return _pre_authorization_document(
+            ExitReason.PRIOR_TREATMENT_SUCCESSFUL, prior_treatment, cpt_code_results, medical_record_file_path, medical_record_content_hash,
+        )
+
+    # 7 Determine whether CPT guideline criteria are met, for every CPT code concurrently over the same index.
+    def evaluate_cpt_code(cpt_code: str) -> CPTCodeResult:
+        with span('pre_authorization.cpt_code', cpt_code=cpt_code):
+            cpt_guideline_results = are_cpt_guideline_criteria_met(
+                cpt_guideline_tree=guidelines[cpt_code].tree,
+                index=index,
+                mode=CriteriaEvaluationMode.BATCHED if batched_extraction else None,
+                context=context if batched_extraction else None,
+                query_embeddings=guidelines[cpt_code].document.query_embeddings,
+                on_criterion_result=lambda criterion_result: emit(PreAuthorizationEvent(
+                    event=PreAuthorizationEventType.CRITERION_RESULT,
+                    cpt_code=cpt_code,
+                    criterion_result=criterion_result,
+                )),
+            )
+        cpt_code_result = CPTCodeResult(
             cpt_code=cpt_code,
-            exit_reason=ExitReason.PRIOR_TREATMENT_SUCCESSFUL,
-            prior_treatment=prior_treatment,
-            guidelines=guidelines_document.guidelines,
-            are_guideline_criteria_met=None,
-            guideline_criteria_results=[],
+            guidelines=guidelines[cpt_code].document.guidelines,
+            are_guideline_criteria_met=cpt_guideline_results.are_criteria_met,
+            guideline_criteria_results=cpt_guideline_results.criteria_results,
+            llm_calls_saved=cpt_guideline_results.llm_calls_saved,
         )
+        emit(PreAuthorizationEvent(event=PreAuthorizationEventType.CPT_CODE_RESULT, cpt_code=cpt_code, cpt_code_result=cpt_code_result))
+        return cpt_code_result
+
+    if len(cpt_codes) == 1:
+        cpt_code_results = [evaluate_cpt_code(cpt_codes[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=env.cpt_code_evaluation_max_workers) as executor:
+            cpt_code_results = list(executor.map(with_current_span(evaluate_cpt_code), cpt_codes))
 
-    # 7 Determine whether CPT guideline criteria are met.
-    cpt_guideline_results = are_cpt_guideline_criteria_met(
-        cpt_guideline_tree=guidelines_document.decision_tree,
-        index=index,
+    return _pre_authorization_document(
+        ExitReason.GUIDELINE_CRITERIA_EVALUATED, prior_treatment, cpt_code_results, medical_record_file_path, medical_record_content_hash,
     )
 
+
+def pre_authorization_pipeline_events(
+        medical_record_file_path: str | Path,
+        **kwargs,
+) -> Iterator[PreAuthorizationEvent]:
+    """
+    Runs the pre-authorization pipeline for a single medical record on a background thread,
+    yielding an event as each stage finishes so results can be shown before the whole pipeline has.
+
+    Notes
+    -----
+    - The last event is COMPLETED, with the result of the pipeline, or ERROR if the pipeline failed.
+    - If the generator is closed early, e.g. because the client disconnected, the pipeline still runs
+      to completion in the background so the LLM responses are cached for a retry.
+
+    Parameters
+    ----------
+    medical_record_file_path: str | Path
+        File path for a single medical record.
+    kwargs:
+        Any other arguments for `pre_authorization_pipeline`.
+
+    Returns
+    -------
+    Iterator[PreAuthorizationEvent]
+        The events in the order they happened.
+    """
+    events: queue.SimpleQueue[PreAuthorizationEvent] = queue.SimpleQueue()
+
+    def run():
+        try:
+            pre_authorization_document = pre_authorization_pipeline(medical_record_file_path, on_event=events.put, **kwargs)
+        except PipelineException as exc:
+            events.put(PreAuthorizationEvent(event=PreAuthorizationEventType.ERROR, error=exc.detail, status_code=exc.status_code))
+        except Exception as exc:
+            logging.exception(f'Pre-authorization pipeline failed for {medical_record_file_path}')
+            events.put(PreAuthorizationEvent(event=PreAuthorizationEventType.ERROR, error=f'{type(exc).__name__}: {exc}', status_code=500))
+        else:
+            events.put(PreAuthorizationEvent(event=PreAuthorizationEventType.COMPLETED, pre_authorization=pre_authorization_document))
+
+    threading.Thread(target=with_current_span(run), daemon=True).start()
+    while True:
+        event = events.get()
+        yield event
+        if event.event in (PreAuthorizationEventType.COMPLETED, PreAuthorizationEventType.ERROR):
+            return
+
+
+def _pre_authorization_document(
+        exit_reason: ExitReason,
+        prior_treatment: PriorTreatmentInformation,
+        cpt_code_results: list[CPTCodeResult],
+        medical_record_file_path: str | Path,
+        medical_record_content_hash: str | None,
+) -> PreAuthorizationDocument:
+    """Creates the document for the results of every CPT code, with the first at the top level."""
+    first_result = cpt_code_results[0]
     return PreAuthorizationDocument(
-        cpt_code=cpt_code,
-        exit_reason=ExitReason.GUIDELINE_CRITERIA_EVALUATED,
+        cpt_code=first_result.cpt_code,
+        exit_reason=exit_reason,
         prior_treatment=prior_treatment,
-        guidelines=guidelines_document.guidelines,
-        are_guideline_criteria_met=cpt_guideline_results.are_criteria_met,
-        guideline_criteria_results=cpt_guideline_results.criteria_results,
+        guidelines=first_result.guidelines,
+        are_guideline_criteria_met=first_result.are_guideline_criteria_met,
+        guideline_criteria_results=first_result.guideline_criteria_results,
+        llm_calls_saved=first_result.llm_calls_saved,
+        cpt_code_results=cpt_code_results,
+        medical_record_file_path=str(medical_record_file_path),
+        medical_record_content_hash=medical_record_content_hash,
     )
 
 
@@ -1,18 +1,73 @@
 import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from enum import Enum
+from typing import Callable
 
-from llama_index import VectorStoreIndex, ServiceContext
-from llama_index.llms import OpenAI
+from llama_index import VectorStoreIndex
 from pydantic import BaseModel
 
-from data_models.cpt_guideline import Criterion, LogicalOperator, GuidelineDecisionTree
-from data_models.pre_authorization import CPTGuidelineResults, CriterionResult
+from llama_index.embeddings.base import Embedding
+
+from data_models.cpt_guideline import Criterion, LogicalOperator, GuidelineDecisionTree, QueryEmbeddings
+from data_models.pre_authorization import CPTGuidelineResults, CriterionResult, CriterionStatistics
+from env import env
+from services.db import Database, Collection
+from services.guideline_cache import CompiledGuidelineTree, combine_criteria_results
+from services.llm_provider import get_llm_provider
+from services.query_embeddings import precomputed_query_embedding
+from services.tracing import traced, span, current_span, with_current_span
+from utils.hash_utils import sha256_text
 from utils.prompt_utils import multiline_prompt
+from utils.rag_utils import query_index, retrieve_context, query_context
+
+# The reason given for criteria that are skipped in LAZY mode.
+NOT_EVALUATED_REASON = 'Not evaluated as the result of the parent criteria was already decided.'
+
+# The expected latency of a criterion that has never been queried before.
+DEFAULT_LATENCY_SECONDS = 1.0
+MIN_LATENCY_SECONDS = 0.001
+
+CRITERIA_MODEL = 'gpt-3.5-turbo-0613'
+
+
+class CriteriaEvaluationMode(Enum):
+    SEQUENTIAL = 'sequential'
+    CONCURRENT = 'concurrent'
+    LAZY = 'lazy'
+    BATCHED = 'batched'
+
 
+class QAResponse(BaseModel):
+    """Data model containing the answer to the question and evidence for the answer."""
+    answer: bool | None = None
+    reason: str
+    evidence: str | None = None
+    additional_information_required: str | None = None
 
+
+class BatchQAResponse(QAResponse):
+    """Data model containing the answer to a single question from a batch of questions."""
+    question_id: str
+
+
+class BatchQAResponses(BaseModel):
+    """Data model containing the answers to a batch of questions."""
+    answers: list[BatchQAResponse]
+
+
+@traced('pre_authorization.are_cpt_guideline_criteria_met')
 def are_cpt_guideline_criteria_met(
-        cpt_guideline_tree: GuidelineDecisionTree,
+        cpt_guideline_tree: GuidelineDecisionTree | CompiledGuidelineTree,
         index: VectorStoreIndex,
+        mode: CriteriaEvaluationMode | None = None,
+        max_workers: int | None = None,
+        context: list[str] | None = None,
+        query_embeddings: QueryEmbeddings | None = None,
+        previous_results: dict[str, CriterionResult] | None = None,
+        on_criterion_result: Callable[[CriterionResult], None] | None = None,
 ) -> CPTGuidelineResults:
     """
     Uses RAG query pipeline to query medical record to determine whether
@@ -22,10 +77,39 @@ def are_cpt_guideline_criteria_met(
 
     Parameters
     ----------
-    cpt_guideline_tree: CPTGuidelineTree
-        A tree of the criteria from the CPT guidelines.
+    cpt_guideline_tree: GuidelineDecisionTree | CompiledGuidelineTree
+        A tree of the criteria from the CPT guidelines, preferably already compiled by the guideline cache.
     index: VectorStoreIndex
         An index of the medical record being queried.
+    mode: CriteriaEvaluationMode | None
+        - SEQUENTIAL: leaf criteria are queried one at a time while traversing the tree.
+        - CONCURRENT: all leaf criteria are queried at once on a bounded thread pool and
+          the results are combined once every answer is in.
+        - LAZY: leaf criteria are queried one at a time, most decisive and cheapest first
+          (according to the statistics from past runs), and criteria whose result can no
+          longer change the result of their parent are not queried at all.
+        - BATCHED: the medical record is retrieved once and the leaf criteria are answered
+          together in batches of `batched_extraction_batch_size` questions per LLM call,
+          with the batches queried concurrently.
+        Defaults to the `criteria_evaluation_mode` setting.
+    max_workers: int | None
+        The maximum number of leaf criteria (or batches of leaf criteria) queried at the same
+        time in CONCURRENT and BATCHED modes.
+        Defaults to the `criteria_evaluation_max_workers` setting.
+    context: list[str] | None
+        The chunks of the medical record to answer the questions from in BATCHED mode,
+        these are retrieved from the index if not given.
+    query_embeddings: QueryEmbeddings | None
+        The embeddings of the retrieval queries computed when the guidelines were ingested.
+        Queries without a precomputed embedding are embedded when they are retrieved.
+    previous_results: dict[str, CriterionResult] | None
+        The results of a previous evaluation of the same medical record keyed by the hash of the
+        criterion question, see `criterion_results_by_question`. Leaf criteria with the same question
+        reuse these results rather than being queried again, e.g. when re-evaluating after the
+        guidelines changed. `index` is not used if every leaf criterion has a previous result.
+    on_criterion_result: Callable[[CriterionResult], None] | None
+        Called with the result of each leaf criterion as soon as it is answered (or reused), e.g. to
+        stream results to the client. This may be called from several threads at once.
 
     Returns
     -------
@@ -35,27 +119,127 @@ def are_cpt_guideline_criteria_met(
     """
     logging.info('Determining if CPT guideline criteria are met...')
 
-    is_criteria_met, criteria_results = _evaluate_criteria(
-        criteria=cpt_guideline_tree.criteria,
-        operator=cpt_guideline_tree.criteria_operator,
-        index=index,
-    )
+    mode = mode or CriteriaEvaluationMode(env.criteria_evaluation_mode)
+    max_workers = max_workers or env.criteria_evaluation_max_workers
+
+    if isinstance(cpt_guideline_tree, GuidelineDecisionTree):
+        cpt_guideline_tree = CompiledGuidelineTree(cpt_guideline_tree)
+    leaves = cpt_guideline_tree.leaf_criteria
+    evaluations: list[tuple[Criterion, CriterionResult, float]] = []
+    reused: list[Criterion] = []
+    previous_results = previous_results or {}
+    reused_results = {
+        i: _reuse_result(leaf, previous_result)
+        for i, leaf in enumerate(leaves)
+        if (previous_result := previous_results.get(sha256_text(leaf.criterion_question or '')))
+    }
+
+    def resolved(criterion_result: CriterionResult) -> CriterionResult:
+        if on_criterion_result:
+            on_criterion_result(criterion_result)
+        return criterion_result
+
+    def query_leaf(criterion: Criterion) -> CriterionResult:
+        previous_result = previous_results.get(sha256_text(criterion.criterion_question or ''))
+        if previous_result:
+            reused.append(criterion)
+            return resolved(_reuse_result(criterion, previous_result))
+        start_time = time.perf_counter()
+        with span('pre_authorization.criterion', criterion_id=criterion.criterion_id):
+            criterion_result = _is_criterion_met(
+                criterion,
+                index,
+                query_embedding=precomputed_query_embedding(query_embeddings, criterion.criterion_question or ''),
+            )
+        evaluations.append((criterion, criterion_result, time.perf_counter() - start_time))
+        return resolved(criterion_result)
+
+    if mode == CriteriaEvaluationMode.LAZY:
+        is_criteria_met, criteria_results = _evaluate_criteria_lazily(
+            criteria=cpt_guideline_tree.decision_tree.criteria,
+            operator=cpt_guideline_tree.decision_tree.criteria_operator,
+            evaluate_leaf=query_leaf,
+            statistics=_read_criterion_statistics(leaves),
+        )
+    else:
+        if mode == CriteriaEvaluationMode.SEQUENTIAL:
+            leaf_results = [query_leaf(leaf) for leaf in leaves]
+        elif mode == CriteriaEvaluationMode.BATCHED:
+            queried_leaves = [leaf for i, leaf in enumerate(leaves) if i not in reused_results]
+            for reused_result in reused_results.values():
+                resolved(reused_result)
+            if context is None and queried_leaves:
+                context = retrieve_context(
+                    index,
+                    query=cpt_guideline_tree.batched_retrieval_query,
+                    similarity_top_k=env.batched_extraction_similarity_top_k,
+                    query_embedding=precomputed_query_embedding(query_embeddings, cpt_guideline_tree.batched_retrieval_query),
+                )
+
+            def query_batch(batch: list[Criterion]) -> list[CriterionResult]:
+                start_time = time.perf_counter()
+                with span('pre_authorization.criteria_batch', criteria_count=len(batch)):
+                    batch_results = _are_criteria_met(batch, context)
+                latency_seconds = (time.perf_counter() - start_time) / len(batch)
+                evaluations.extend((leaf, result, latency_seconds) for leaf, result in zip(batch, batch_results))
+                return [resolved(result) for result in batch_results]
+
+            batch_size = env.batched_extraction_batch_size
+            batches = [queried_leaves[i:i + batch_size] for i in range(0, len(queried_leaves), batch_size)]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                queried_results = iter([result for batch_results in executor.map(with_current_span(query_batch), batches) for result in batch_results])
+            leaf_results = [reused_results[i] if i in reused_results else next(queried_results) for i in range(len(leaves))]
+            reused.extend(leaves[i] for i in reused_results)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                leaf_results = list(executor.map(with_current_span(query_leaf), leaves))
+
+        is_criteria_met, criteria_results = cpt_guideline_tree.evaluate(leaf_results)
+
+    _update_criterion_statistics(evaluations)
+
+    llm_calls_saved = len(leaves) - len(evaluations)
+    current_span().set_attribute('criteria_queried', len(evaluations))
+    current_span().set_attribute('llm_calls_saved', llm_calls_saved)
+    current_span().set_attribute('criteria_reused', len(reused))
 
-    logging.info('Successfully determined if CPT guideline criteria are met ✅')
+    logging.info(f'Successfully determined if CPT guideline criteria are met ✅ ({len(evaluations)} criteria queried, {llm_calls_saved} skipped)')
 
     return CPTGuidelineResults(
         are_criteria_met=is_criteria_met,
         criteria_results=criteria_results,
+        llm_calls_saved=llm_calls_saved,
+        criteria_reused=len(reused),
     )
 
 
+def criterion_results_by_question(criteria_results: list[CriterionResult]) -> dict[str, CriterionResult]:
+    """
+    Returns the results of the leaf criteria which were evaluated, keyed by the hash of
+    the criterion question, so they can be passed to `are_cpt_guideline_criteria_met`
+    as `previous_results`.
+    """
+    return {
+        sha256_text(criterion_result.criterion_question): criterion_result
+        for criterion_result in criteria_results
+        # Only leaf criteria have a question, the results of their parents are combined from them.
+        if criterion_result.criterion_question and criterion_result.was_evaluated
+    }
+
+
 def _is_criterion_met(
         criterion: Criterion,
         index: VectorStoreIndex,
+        query_embedding: Embedding | None = None,
 ) -> CriterionResult:
     """
     Uses GPT to determine whether criterion is met and obtain evidence.
 
+    Notes
+    -----
+    - The medical record is retrieved with the criterion question rather than the whole prompt,
+      so the retrieval does not change with the date and can use a precomputed embedding.
+
     Parameters
     ----------
     criterion
@@ -67,13 +251,6 @@ def _is_criterion_met(
     if not criterion.criterion_question:
         raise RuntimeError(f'Criterion {criterion.criterion_id} in guidelines tree has no question')
 
-    class QAResponse(BaseModel):
-        """Data model containing the answer to the question and evidence for the answer."""
-        answer: bool | None = None
-        reason: str
-        evidence: str | None = None
-        additional_information_required: str | None = None
-
     prompt = multiline_prompt(
         f"""
         Read the medical report above which was sent to an American healthcare insurer for them to perform a Prior Authorization for a requested treatment and answer the question below:
@@ -96,23 +273,111 @@ def _is_criterion_met(
         """
     )
 
-    llm = OpenAI(
-        model="gpt-3.5-turbo-0613",
+    service_context = get_llm_provider().service_context(
+        model=CRITERIA_MODEL,
         # model='gpt-4-1106-preview',
         temperature=0.0,
     )
 
-    service_context = ServiceContext.from_defaults(llm=llm)
-
-    query_engine = index.as_query_engine(
+    qa_response = query_index(
+        index,
+        prompt,
         output_cls=QAResponse,
         service_context=service_context,
+        retrieval_query=criterion.criterion_question,
+        query_embedding=query_embedding,
+    )
+
+    return _to_criterion_result(criterion, qa_response)
+
+
+def _are_criteria_met(
+        criteria: list[Criterion],
+        context: list[str],
+) -> list[CriterionResult]:
+    """
+    Uses GPT to determine whether each of a batch of criteria is met and obtain evidence in a single call.
+
+    Parameters
+    ----------
+    criteria: list[Criterion]
+        A batch of leaf criteria.
+    context: list[str]
+        The chunks of the medical record to answer the questions from.
+
+    Returns
+    -------
+    list[CriterionResult]
+        The result for each criterion in the same order as `criteria`.
+    """
+    for criterion in criteria:
+        if not criterion.criterion_question:
+            raise RuntimeError(f'Criterion {criterion.criterion_id} in guidelines tree has no question')
+
+    # Questions are identified by their position in the batch as criterion IDs are not guaranteed to be unique.
+    questions = '\n'.join(f'[{i}] {criterion.criterion_question}' for i, criterion in enumerate(criteria, start=1))
+
+    prompt_template_str = multiline_prompt(
+        f"""
+        Below are excerpts from a medical report which was sent to an American healthcare insurer for them to perform a Prior Authorization for a requested treatment.
+
+        ---------------------
+        {{context}}
+        ---------------------
+
+        Read the medical report above and answer each of the questions below separately. Each question is preceded by its ID in square brackets.
+
+        {{questions}}
+
+        For context (for any date and age related questions), today's is {datetime.now().strftime('%B %d, %Y"')}.
+
+        Give your answer in JSON format with an "answers" field containing a list with one object for each question with the following fields:
+            - question_id
+            - answer
+            - reason
+            - evidence
+            - additional_information_required
+
+        Where:
+            - The "question_id" field should be the ID of the question (without square brackets).
+            - The "answer" field should be true if the answer to the question is yes, or false if the answer to the question is no, or null if the question cannot be answered from the report.
+            - The "reason" field should contain a one sentence justification for the answer given that references which information (or lack of information) in the medical report was used to arrive at that answer.
+            - The "evidence" field should contain a short excerpt from the medical report that acts as evidence for the answer, or null if the report contains no information that answers the question.
+            - The "additional_information_required" should be populated only if the question cannot be answered from the information available and should contain a one-sentence explanation of what additional information is needed to answer the question.
+        """
     )
 
-    response = query_engine.query(prompt)
+    llm = get_llm_provider().llm(
+        model=CRITERIA_MODEL,
+        temperature=0.0,
+    )
 
-    qa_response = response.response
+    batch_qa_responses = query_context(
+        context,
+        prompt_template_str=prompt_template_str,
+        output_cls=BatchQAResponses,
+        llm=llm,
+        questions=questions,
+    )
 
+    answers = {qa_response.question_id.strip('[] '): qa_response for qa_response in batch_qa_responses.answers}
+    unanswered = QAResponse(
+        answer=None,
+        reason='No answer was given for this question.',
+    )
+
+    return [_to_criterion_result(criterion, answers.get(str(i), unanswered)) for i, criterion in enumerate(criteria, start=1)]
+
+
+def _reuse_result(criterion: Criterion, previous_result: CriterionResult) -> CriterionResult:
+    """Returns a previous result for the criterion, which may have been renumbered or reworded since."""
+    return previous_result.model_copy(update={
+        'criterion_id': criterion.criterion_id,
+        'criterion': criterion.criterion,
+    })
+
+
+def _to_criterion_result(criterion: Criterion, qa_response: QAResponse) -> CriterionResult:
     logging.info(f' - Criteria {criterion.criterion_id}) {criterion.criterion}: {"✅" if qa_response.answer else "❌" if qa_response.answer is False else "❓"}')
 
     return CriterionResult(
@@ -126,16 +391,26 @@ def _is_criterion_met(
     )
 
 
-def _evaluate_criteria(
+def _evaluate_criteria_lazily(
         criteria: list[Criterion],
         operator: LogicalOperator,
-        index: VectorStoreIndex,
-) -> tuple[bool, list[CriterionResult]]:
+        evaluate_leaf: Callable[[Criterion], CriterionResult],
+        statistics: dict[str, CriterionStatistics],
+) -> tuple[bool | None, list[CriterionResult]]:
     """
-    Recursive function that traverses through tree of CPT guideline criteria,
-    determines whether each individual criterion is met and then combines these
-    results with the logical operators to determine whether the criteria as a
-    whole are met.
+    Recursive function that evaluates the tree of CPT guideline criteria with
+    short-circuiting i.e. an AND stops at the first criterion that is not met
+    and an OR stops at the first criterion that is met. The remaining criteria
+    (and all their sub-criteria) are returned as not evaluated.
+
+    Notes
+    -----
+    - Criteria are evaluated in order of how likely they are to decide the result
+      of their parent per expected second of LLM time, estimated from `statistics`.
+    - Results are combined with `combine_criteria_results`, the same as `CompiledGuidelineTree.evaluate`,
+      so skipping the criteria which cannot change the result never changes the result.
+    - The sub-criteria of a NONE operator are not evaluated, as it is met whatever their results.
+    - The returned results are in the same depth-first order as `CompiledGuidelineTree.evaluate`.
 
     Parameters
     ----------
@@ -143,49 +418,150 @@ def _evaluate_criteria(
         List of criteria.
     operator: LogicalOperator
         Whether the criteria results should be combined with an AND / OR operator.
+    evaluate_leaf: Callable[[Criterion], CriterionResult]
+        Returns the result for a single leaf criterion.
+    statistics: dict[str, CriterionStatistics]
+        Statistics from past runs keyed by the hash of the criterion question.
 
     Returns
     -------
-    tuple[bool, list[CriterionResult]]:
-        - The bool indicates whether criteria as a whole are met.
-        - The list[CriterionResult] stores the results from each individual criteria.
+    tuple[bool | None, list[CriterionResult]]:
+        - Whether criteria as a whole are met, or None if this cannot be determined.
+        - The results from each individual criteria.
     """
-    results: list[CriterionResult] = []
     if not criteria:
-        return True, results
+        return True, []
+    if operator == LogicalOperator.NONE:
+        return combine_criteria_results(operator, []), [result for criterion in criteria for result in _not_evaluated_results(criterion)]
 
-    final_result = (operator != LogicalOperator.OR)  # True for AND, False for OR
-    for criterion in criteria:
-        if criterion.sub_criteria:
-            # Evaluate sub_criteria recursively
-            sub_result, sub_results = _evaluate_criteria(
+    decisive_value = operator == LogicalOperator.OR  # True decides an OR, False decides an AND
+    evaluation_order = sorted(
+        range(len(criteria)),
+        key=lambda i: _evaluation_priority(criteria[i], operator, statistics),
+        reverse=True,
+    )
+
+    values: list[bool | None] = []
+    results: list[list[CriterionResult]] = [[] for _ in criteria]
+    for i in evaluation_order:
+        criterion = criteria[i]
+        if decisive_value in values:
+            results[i] = _not_evaluated_results(criterion)
+        elif criterion.sub_criteria:
+            sub_result, sub_results = _evaluate_criteria_lazily(
                 criteria=criterion.sub_criteria,
                 operator=criterion.sub_criteria_operator or LogicalOperator.NONE,
-                index=index,
+                evaluate_leaf=evaluate_leaf,
+                statistics=statistics,
             )
-            results.append(
+            results[i] = [
                 CriterionResult(
                     criterion=criterion.criterion,
                     criterion_id=criterion.criterion_id,
                     is_criterion_met=sub_result,
                     reason=f'Sub-criteria are{" not" if not sub_result else ""} met.'
-                )
-            )
-            results.extend(sub_results)
-            if operator == LogicalOperator.AND:
-                final_result = final_result and sub_result
-            elif operator == LogicalOperator.OR:
-                final_result = final_result or sub_result
+                ),
+                *sub_results,
+            ]
+            values.append(sub_result)
         else:
-            # Evaluate leaf nodes
-            criterion_result = _is_criterion_met(
-                criterion=criterion,
-                index=index,
-            )
-            results.append(criterion_result)
-            if operator == LogicalOperator.AND:
-                final_result = final_result and criterion_result.is_criterion_met
-            elif operator == LogicalOperator.OR:
-                final_result = final_result or criterion_result.is_criterion_met
+            criterion_result = evaluate_leaf(criterion)
+            results[i] = [criterion_result]
+            values.append(criterion_result.is_criterion_met)
+
+    return combine_criteria_results(operator, values), [result for criterion_results in results for result in criterion_results]
+
+
+def _evaluation_priority(
+        criterion: Criterion,
+        parent_operator: LogicalOperator,
+        statistics: dict[str, CriterionStatistics],
+) -> float:
+    """
+    Returns the probability that the criterion decides the result of its parent
+    per expected second spent querying it.
+    """
+    probability_met = _probability_met(criterion, statistics)
+    probability_decisive = probability_met if parent_operator == LogicalOperator.OR else 1 - probability_met
+    # Criteria which are never queried (e.g. under a NONE operator) cost nothing but must not divide by 0.
+    return probability_decisive / max(_expected_latency(criterion, statistics), MIN_LATENCY_SECONDS)
+
+
+def _probability_met(criterion: Criterion, statistics: dict[str, CriterionStatistics]) -> float:
+    """Estimates the probability the criterion is met assuming all criteria are independent."""
+    if not criterion.sub_criteria:
+        criterion_statistics = statistics.get(sha256_text(criterion.criterion_question or ''))
+        if not criterion_statistics:
+            return 0.5
+        # Laplace smoothing so a handful of past runs do not give a probability of 0 or 1.
+        return (criterion_statistics.met_count + 1) / (criterion_statistics.evaluation_count + 2)
+
+    if (criterion.sub_criteria_operator or LogicalOperator.NONE) == LogicalOperator.NONE:
+        return 1.0
+    probabilities = [_probability_met(sub_criterion, statistics) for sub_criterion in criterion.sub_criteria]
+    if criterion.sub_criteria_operator == LogicalOperator.OR:
+        return 1 - math.prod(1 - probability for probability in probabilities)
+    return math.prod(probabilities)
+
+
+def _expected_latency(criterion: Criterion, statistics: dict[str, CriterionStatistics]) -> float:
+    """Estimates the seconds spent querying every leaf criterion under this criterion."""
+    if not criterion.sub_criteria:
+        criterion_statistics = statistics.get(sha256_text(criterion.criterion_question or ''))
+        return criterion_statistics.mean_latency_seconds if criterion_statistics else DEFAULT_LATENCY_SECONDS
+    if (criterion.sub_criteria_operator or LogicalOperator.NONE) == LogicalOperator.NONE:
+        return 0.0
+    return sum(_expected_latency(sub_criterion, statistics) for sub_criterion in criterion.sub_criteria)
+
+
+def _not_evaluated_results(criterion: Criterion) -> list[CriterionResult]:
+    """Returns the results for a skipped criterion and all of its sub-criteria in depth-first order."""
+    results = [
+        CriterionResult(
+            criterion=criterion.criterion,
+            criterion_id=criterion.criterion_id,
+            criterion_question=criterion.criterion_question,
+            is_criterion_met=None,
+            reason=NOT_EVALUATED_REASON,
+            was_evaluated=False,
+        )
+    ]
+    for sub_criterion in criterion.sub_criteria:
+        results.extend(_not_evaluated_results(sub_criterion))
+    return results
+
+
+def _read_criterion_statistics(criteria: list[Criterion]) -> dict[str, CriterionStatistics]:
+    """Reads the statistics from past runs for each criterion keyed by the hash of the criterion question."""
+    statistics = Database().read_many(
+        collection=Collection.CRITERION_STATISTICS,
+        document_ids=list({sha256_text(criterion.criterion_question or '') for criterion in criteria}),
+        output_class=CriterionStatistics,
+    )
+    return {question_hash: criterion_statistics for question_hash, criterion_statistics in statistics.items() if criterion_statistics}
+
+
+def _update_criterion_statistics(evaluations: list[tuple[Criterion, CriterionResult, float]]):
+    """Adds the results of this run to the statistics used to order criteria in LAZY mode, in a single transaction."""
+    increments: dict[str, dict[str, int | float]] = {}
+    documents: dict[str, CriterionStatistics] = {}
+    for criterion, criterion_result, latency_seconds in evaluations:
+        question_hash = sha256_text(criterion.criterion_question or '')
+        documents[question_hash] = CriterionStatistics(criterion_question=criterion.criterion_question)
+        increment = increments.setdefault(
+            question_hash,
+            {'evaluation_count': 0, 'met_count': 0, 'not_met_count': 0, 'total_latency_seconds': 0.0},
+        )
+        increment['evaluation_count'] += 1
+        if criterion_result.is_criterion_met is True:
+            increment['met_count'] += 1
+        elif criterion_result.is_criterion_met is False:
+            increment['not_met_count'] += 1
+        increment['total_latency_seconds'] += latency_seconds
 
-    return final_result, results
+    if increments:
+        Database().bulk_increment(
+            collection=Collection.CRITERION_STATISTICS,
+            increments=increments,
+            documents=documents,
+        )
@@ -1,9 +1,13 @@
 from llama_index import VectorStoreIndex
 
 from data_models.pre_authorization import PriorTreatmentInformation
+from services.query_embeddings import get_prompt_embedding
+from services.tracing import traced
 from utils.prompt_utils import multiline_prompt
+from utils.rag_utils import query_index
 
 
+@traced('pre_authorization.extract_prior_treatment_information')
 def extract_prior_treatment_information(index: VectorStoreIndex) -> PriorTreatmentInformation:
     """
     Determines whether prior conservative treatment was attempted and
@@ -18,11 +22,13 @@ def extract_prior_treatment_information(index: VectorStoreIndex) -> PriorTreatme
     -------
     WasConservativeTreatmentAttempted
     """
-    query_engine = index.as_query_engine(
-        output_cls=PriorTreatmentInformation,
-    )
+    prompt = create_prompt()
+
+    return query_index(index, prompt, output_cls=PriorTreatmentInformation, query_embedding=get_prompt_embedding(prompt))
+
 
-    prompt = multiline_prompt(
+def create_prompt() -> str:
+    return multiline_prompt(
         """
         Read the medical report above which was sent to an American healthcare insurer for them to perform a Prior Authorization for a requested treatment.
         
@@ -41,7 +47,3 @@ def extract_prior_treatment_information(index: VectorStoreIndex) -> PriorTreatme
          - The "evidence_of_whether_treatment_was_successful" should contain a short excerpt from the medical report that mentions whether or not the attempted treatment was successful.
         """
     )
-
-    response = query_engine.query(prompt)
-
-    return response.response
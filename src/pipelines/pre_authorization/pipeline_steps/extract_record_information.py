@@ -0,0 +1,110 @@
+import logging
+
+from llama_index import VectorStoreIndex
+from pydantic import BaseModel
+
+from data_models.pre_authorization import PriorTreatmentInformation
+from env import env
+from services.llm_provider import get_llm_provider
+from services.query_embeddings import get_prompt_embedding
+from services.tracing import traced
+from pipelines.pre_authorization.pipeline_steps.extract_prior_treatment_information import create_prompt as create_prior_treatment_prompt
+from pipelines.pre_authorization.pipeline_steps.extract_requested_cpt_codes import CPTCodes, create_prompt as create_cpt_codes_prompt
+from utils.prompt_utils import multiline_prompt
+from utils.rag_utils import retrieve_context, query_context
+
+BATCHED_EXTRACTION_MODEL = 'gpt-3.5-turbo-0613'
+
+
+class RecordInformation(BaseModel):
+    """Data model for the information extracted from a medical record in a single LLM call."""
+    requested_cpt_codes: CPTCodes
+    prior_treatment: PriorTreatmentInformation
+
+
+@traced('pre_authorization.retrieve_record_context')
+def retrieve_record_context(index: VectorStoreIndex) -> list[str]:
+    """
+    Retrieves the chunks of the medical record once so they can be reused
+    for every batched extraction question asked about the record.
+
+    Parameters
+    ----------
+    index: VectorStoreIndex
+        An index of the medical record being queried.
+
+    Returns
+    -------
+    list[str]
+        The content of the retrieved chunks in the order they appear in the medical record.
+    """
+    query = f'{create_cpt_codes_prompt()}\n{create_prior_treatment_prompt()}'
+    return retrieve_context(
+        index,
+        query=query,
+        similarity_top_k=env.batched_extraction_similarity_top_k,
+        query_embedding=get_prompt_embedding(query),
+    )
+
+
+@traced('pre_authorization.extract_record_information')
+def extract_record_information(context: list[str]) -> RecordInformation:
+    """
+    Extracts the requested CPT code(s) and determines whether prior conservative
+    treatment was attempted and successful in a single LLM call.
+
+    Notes
+    -----
+    - This answers the same questions as `extract_requested_cpt_codes` and
+      `extract_prior_treatment_information` without a retrieval per question.
+
+    Parameters
+    ----------
+    context: list[str]
+        The chunks of the medical record returned by `retrieve_record_context`.
+
+    Returns
+    -------
+    RecordInformation
+    """
+    logging.info('Extracting requested CPT codes and prior treatment information...')
+
+    llm = get_llm_provider().llm(
+        model=BATCHED_EXTRACTION_MODEL,
+        temperature=0.0,
+    )
+
+    record_information = query_context(
+        context,
+        prompt_template_str=create_prompt(),
+        output_cls=RecordInformation,
+        llm=llm,
+        cpt_codes_prompt=create_cpt_codes_prompt(),
+        prior_treatment_prompt=create_prior_treatment_prompt(),
+    )
+
+    logging.info('Successfully extracted requested CPT codes and prior treatment information ✅')
+
+    return record_information
+
+
+def create_prompt() -> str:
+    return multiline_prompt(
+        """
+        Below are excerpts from a medical report which was sent to an American healthcare insurer for them to perform a Prior Authorization for a requested treatment.
+
+        ---------------------
+        {context}
+        ---------------------
+
+        Complete both of the tasks below and give your answers in JSON format with the following fields:
+        - requested_cpt_codes: The answer to task 1.
+        - prior_treatment: The answer to task 2.
+
+        Task 1:
+        {cpt_codes_prompt}
+
+        Task 2:
+        {prior_treatment_prompt}
+        """
+    )
@@ -1,7 +1,10 @@
 from llama_index import VectorStoreIndex
 from pydantic import BaseModel
 
+from services.query_embeddings import get_prompt_embedding
+from services.tracing import traced
 from utils.prompt_utils import multiline_prompt
+from utils.rag_utils import query_index
 
 
 class CPTCodes(BaseModel):
@@ -9,6 +12,7 @@ class CPTCodes(BaseModel):
     cpt_codes: list[str]
 
 
+@traced('pre_authorization.extract_requested_cpt_codes')
 def extract_requested_cpt_codes(index: VectorStoreIndex) -> list[str]:
     """
     Extracts the CPT code(s) for the requested procedures from the medical record.
@@ -23,11 +27,15 @@ def extract_requested_cpt_codes(index: VectorStoreIndex) -> list[str]:
     list[str]
         A list of the requested CPT codes.
     """
-    query_engine = index.as_query_engine(
-        output_cls=CPTCodes,
-    )
+    prompt = create_prompt()
+
+    response = query_index(index, prompt, output_cls=CPTCodes, query_embedding=get_prompt_embedding(prompt))
+
+    return response.cpt_codes
 
-    prompt = multiline_prompt(
+
+def create_prompt() -> str:
+    return multiline_prompt(
         """
         Extract the CPT codes for the requested procedure(s) from this medical record.
     
@@ -36,7 +44,3 @@ def extract_requested_cpt_codes(index: VectorStoreIndex) -> list[str]:
         Give the CPT code(s) only with no additional explanation or information.
         """
     )
-
-    response = query_engine.query(prompt)
-
-    return response.response.cpt_codes
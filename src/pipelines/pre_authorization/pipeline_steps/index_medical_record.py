@@ -1,7 +1,9 @@
+import functools
 import shutil
 from pathlib import Path
 
 from llama_index import (
+    ServiceContext,
     VectorStoreIndex,
     SimpleDirectoryReader,
     StorageContext,
@@ -9,19 +11,40 @@ from llama_index import (
 )
 
 from env import env
+from services.index_cache import get_index_cache
+from services.llm_provider import get_llm_provider
+from services.numpy_vector_store import NumpyVectorStore
+from services.single_flight import get_single_flight
+from services.tracing import traced, span, current_span
+from utils.hash_utils import sha256_file
 
 
+@traced('pre_authorization.index_medical_record')
 def index_medical_record(
         medical_record_file_path: str | Path,
         force_reindex: bool = False,
+        content_hash: str | None = None,
 ) -> VectorStoreIndex:
     """
     Loads and indexes medical record for RAG pipeline using LlamaIndex.
 
     Notes
     -----
-    - The created index will be saved to disk to avoid re-indexing the same document.
-    - The index will be loaded from disk if this document has already been indexed.
+    - Indexes are addressed by the SHA-256 of the file contents, so the same
+      record uploaded under different names shares a single index.
+    - The created index will be saved to disk to avoid re-indexing the same document,
+      as a memory-mapped matrix of embeddings, see `NumpyVectorStore`.
+    - The index will be loaded from disk if this document has already been indexed,
+      without parsing the PDF again. Indexes saved in LlamaIndex's JSON format by
+      earlier versions are still loaded.
+    - Loaded indexes are kept in an in-process LRU cache so a repeat submission
+      skips loading the index from disk too.
+    - Concurrent calls for the same record (e.g. a retried upload) wait for a single
+      load or build, rather than each writing (or removing) the same index directory.
+      A forced reindex also waits for a load or build already in flight, rather than reindexing.
+    - Chunks are embedded through the embedding cache of the LLM provider, so indexing
+      a record which only differs slightly from one indexed before only embeds the
+      chunks which changed.
 
     Parameters
     ----------
@@ -29,29 +52,112 @@ def index_medical_record(
         File path for a single medical record.
     force_reindex: bool
         Whether to force a reindex if this document has already been indexed.
+    content_hash: str | None
+        The SHA-256 of the file contents if already known, otherwise it is computed.
 
     Returns
     -------
     VectorStoreIndex
         LlamaIndex index which can be used for RAG.
     """
+    content_hash = content_hash or sha256_file(medical_record_file_path)
+    service_context = get_llm_provider().service_context()
 
-    vector_db_index_dir = env.vector_db_dir / medical_record_file_path.name.rstrip('.pdf')
+    if not force_reindex and (index := get_index_cache().get(content_hash)):
+        current_span().set_attribute('index_cache_hit', True)
+        return index
 
-    if vector_db_index_dir.exists() and force_reindex:
-        shutil.rmtree(str(vector_db_index_dir))
+    index, is_coalesced = get_single_flight('index').do(
+        content_hash,
+        functools.partial(_load_or_build_index, medical_record_file_path, content_hash, force_reindex, service_context),
+    )
+    current_span().set_attribute('index_coalesced', is_coalesced)
 
-    documents = SimpleDirectoryReader(
-        input_files=[medical_record_file_path],
-        filename_as_id=True,
-    ).load_data()
+    return index
+
+
+def preload_medical_record_indexes(max_indexes: int) -> int:
+    """
+    Loads the most recently built medical record indexes on disk into the index cache, e.g. in
+    the web app before forking its workers so they share the loaded indexes.
+
+    Notes
+    -----
+    - The indexes are loaded oldest first, so if they don't all fit in the index cache
+      the most recently built are the ones kept.
+
+    Parameters
+    ----------
+    max_indexes: int
+        The maximum number of indexes to load.
+
+    Returns
+    -------
+    int
+        The number of indexes loaded.
+    """
+    if max_indexes <= 0 or not env.vector_db_dir.exists():
+        return 0
 
-    if not vector_db_index_dir.exists():
-        index = VectorStoreIndex.from_documents(documents)
-        index.storage_context.persist(persist_dir=vector_db_index_dir)
+    index_dirs = [path for path in env.vector_db_dir.iterdir() if _has_index(path)]
+    # Loading an index does not modify its directory, so this is the order they were built in.
+    index_dirs = sorted(index_dirs, key=lambda path: path.stat().st_mtime)[-max_indexes:]
+
+    service_context = get_llm_provider().service_context()
+    index_cache = get_index_cache()
+    for vector_db_index_dir in index_dirs:
+        index_cache.put(vector_db_index_dir.name, _load_index(vector_db_index_dir, service_context))
+
+    return len(index_dirs)
+
+
+def _has_index(vector_db_index_dir: Path) -> bool:
+    return NumpyVectorStore.exists(vector_db_index_dir) or (vector_db_index_dir / 'docstore.json').exists()
+
+
+def _load_index(vector_db_index_dir: Path, service_context: ServiceContext) -> VectorStoreIndex:
+    """Loads an index saved by `index_medical_record`, or in LlamaIndex's JSON format by earlier versions."""
+    if NumpyVectorStore.exists(vector_db_index_dir):
+        vector_store = NumpyVectorStore.from_persist_dir(vector_db_index_dir)
+        return VectorStoreIndex.from_vector_store(vector_store, service_context=service_context)
+
+    storage_context = StorageContext.from_defaults(persist_dir=vector_db_index_dir)
+    return load_index_from_storage(storage_context, service_context=service_context)
+
+
+def _load_or_build_index(
+        medical_record_file_path: str | Path,
+        content_hash: str,
+        force_reindex: bool,
+        service_context: ServiceContext,
+) -> VectorStoreIndex:
+    vector_db_index_dir = env.vector_db_dir / content_hash
+    index_cache = get_index_cache()
+
+    if force_reindex:
+        index_cache.remove(content_hash)
+        if vector_db_index_dir.exists():
+            shutil.rmtree(str(vector_db_index_dir))
+
+    if _has_index(vector_db_index_dir):
+        with span('pre_authorization.load_index'):
+            index = _load_index(vector_db_index_dir, service_context)
     else:
-        storage_context = StorageContext.from_defaults(persist_dir=vector_db_index_dir)
-        index = load_index_from_storage(storage_context)
-        index.refresh_ref_docs(documents)
+        with span('pre_authorization.load_pdf'):
+            documents = SimpleDirectoryReader(
+                input_files=[medical_record_file_path],
+                filename_as_id=True,
+            ).load_data()
+        with span('pre_authorization.build_index') as build_span:
+            vector_store = NumpyVectorStore()
+            index = VectorStoreIndex.from_documents(
+                documents,
+                storage_context=StorageContext.from_defaults(vector_store=vector_store),
+                service_context=service_context,
+            )
+            vector_store.persist(vector_db_index_dir)
+            build_span.set_attribute('node_count', len(vector_store.node_ids))
+
+    index_cache.put(content_hash, index)
 
     return index
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from typing import Iterator
+
+from data_models.pre_authorization import (
+    PreAuthorizationDocument,
+    ExitReason,
+    CPTCodeResult,
+    ReevaluationStatus,
+    ReevaluationResult,
+    BulkReevaluationResults,
+)
+from env import env
+from pipelines.exceptions import PipelineException
+from pipelines.pre_authorization.pipeline_steps import index_medical_record, are_cpt_guideline_criteria_met
+from pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met import (
+    CriteriaEvaluationMode,
+    criterion_results_by_question,
+)
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+from services.llm_scheduler import llm_priority, Priority
+from services.tracing import traced, current_span, with_current_span
+from utils.hash_utils import sha256_text
+
+
+@traced('pre_authorization.reevaluate')
+def reevaluate_pre_authorization(
+        pre_authorization: PreAuthorizationDocument,
+        mode: CriteriaEvaluationMode | None = None,
+) -> tuple[PreAuthorizationDocument, int, int]:
+    """
+    Re-evaluates a stored pre-authorization against the current guidelines for its CPT codes,
+    only querying the leaf criteria which are new or whose question has changed.
+
+    Notes
+    -----
+    - Leaf criteria are matched to their previous results by the hash of the criterion question,
+      so renumbered criteria are not queried again. Every other result is then recomputed from the
+      leaf results and the logical operators of the current decision tree, which costs no LLM calls.
+    - The medical record is only loaded if a leaf criterion has to be queried.
+    - Prior treatment is not re-evaluated as it does not depend on the guidelines, so a
+      pre-authorization which exited because prior treatment was successful is returned unchanged.
+
+    Parameters
+    ----------
+    pre_authorization: PreAuthorizationDocument
+        A pre-authorization created by the pre-authorization pipeline.
+    mode: CriteriaEvaluationMode | None
+        How the new and changed leaf criteria are queried, see `are_cpt_guideline_criteria_met`.
+
+    Returns
+    -------
+    tuple[PreAuthorizationDocument, int, int]:
+        - The re-evaluated pre-authorization, which is equal to `pre_authorization` if nothing changed.
+        - The number of leaf criteria queried.
+        - The number of leaf criteria whose previous result was reused.
+    """
+    if pre_authorization.exit_reason != ExitReason.GUIDELINE_CRITERIA_EVALUATED:
+        return pre_authorization, 0, 0
+
+    # Documents created before multiple CPT codes were supported only have the top level result.
+    previous_cpt_code_results = pre_authorization.cpt_code_results or [
+        CPTCodeResult(
+            cpt_code=pre_authorization.cpt_code,
+            guidelines=pre_authorization.guidelines,
+            are_guideline_criteria_met=pre_authorization.are_guideline_criteria_met,
+            guideline_criteria_results=pre_authorization.guideline_criteria_results,
+            llm_calls_saved=pre_authorization.llm_calls_saved,
+        )
+    ]
+    guidelines = get_guideline_cache().get_many([result.cpt_code for result in previous_cpt_code_results])
+    missing_cpt_codes = [cpt_code for cpt_code, compiled_guidelines in guidelines.items() if not compiled_guidelines]
+    if missing_cpt_codes:
+        raise PipelineException(detail=f"Guidelines for CPT code(s) {', '.join(missing_cpt_codes)} no longer exist")
+
+    previous_results = {
+        result.cpt_code: criterion_results_by_question(result.guideline_criteria_results)
+        for result in previous_cpt_code_results
+    }
+    index = None
+    if any(
+        sha256_text(leaf.criterion_question or '') not in previous_results[cpt_code]
+        for cpt_code, compiled_guidelines in guidelines.items()
+        for leaf in compiled_guidelines.tree.leaf_criteria
+    ):
+        if not pre_authorization.medical_record_file_path:
+            raise PipelineException(detail='Guidelines have changed but the medical record of this pre-authorization is unknown')
+        index = index_medical_record(
+            medical_record_file_path=pre_authorization.medical_record_file_path,
+            content_hash=pre_authorization.medical_record_content_hash,
+        )
+
+    cpt_code_results = []
+    criteria_queried = 0
+    criteria_reused = 0
+    for previous_cpt_code_result in previous_cpt_code_results:
+        compiled_guidelines = guidelines[previous_cpt_code_result.cpt_code]
+        cpt_guideline_results = are_cpt_guideline_criteria_met(
+            cpt_guideline_tree=compiled_guidelines.tree,
+            index=index,
+            mode=mode,
+            query_embeddings=compiled_guidelines.document.query_embeddings,
+            previous_results=previous_results[previous_cpt_code_result.cpt_code],
+        )
+        criteria_reused += cpt_guideline_results.criteria_reused
+        criteria_queried += len(compiled_guidelines.tree.leaf_criteria) - cpt_guideline_results.llm_calls_saved
+
+        if (
+            cpt_guideline_results.criteria_results == previous_cpt_code_result.guideline_criteria_results
+            and compiled_guidelines.document.guidelines == previous_cpt_code_result.guidelines
+        ):
+            cpt_code_results.append(previous_cpt_code_result)
+            continue
+        cpt_code_results.append(CPTCodeResult(
+            cpt_code=previous_cpt_code_result.cpt_code,
+            guidelines=compiled_guidelines.document.guidelines,
+            are_guideline_criteria_met=cpt_guideline_results.are_criteria_met,
+            guideline_criteria_results=cpt_guideline_results.criteria_results,
+            llm_calls_saved=cpt_guideline_results.llm_calls_saved,
+        ))
+
+    current_span().set_attribute('criteria_queried', criteria_queried)
+    current_span().set_attribute('criteria_reused', criteria_reused)
+
+    first_result = cpt_code_results[0]
+    reevaluated_pre_authorization = pre_authorization.model_copy(update={
+        'guidelines': first_result.guidelines,
+        'are_guideline_criteria_met': first_result.are_guideline_criteria_met,
+        'guideline_criteria_results': first_result.guideline_criteria_results,
+        'llm_calls_saved': first_result.llm_calls_saved,
+        'cpt_code_results': cpt_code_results if pre_authorization.cpt_code_results else [],
+    })
+
+    return reevaluated_pre_authorization, criteria_queried, criteria_reused
+
+
+@traced('pre_authorization.reevaluate_all')
+def reevaluate_pre_authorizations(
+        cpt_codes: list[str] | None = None,
+        max_workers: int | None = None,
+        mode: CriteriaEvaluationMode | None = None,
+) -> BulkReevaluationResults:
+    """
+    Re-evaluates the stored pre-authorizations for the CPT codes against their current guidelines,
+    e.g. after a payer has updated a few criteria, and overwrites those whose results changed.
+
+    Notes
+    -----
+    - Only the new and changed leaf criteria are queried, see `reevaluate_pre_authorization`.
+    - The re-evaluation is I/O bound (waiting on GPT), so pre-authorizations are re-evaluated
+      on a pool of threads.
+    - Every pre-authorization is read, as the indexed `cpt_code` is only the first CPT code requested.
+      They are read a page of `reevaluation_page_size` at a time, and the next page is only read once
+      fewer than a page are waiting, so at most about two pages are held in memory.
+    - Updated pre-authorizations are written to the DB in batches of `batch_write_size`. A pre-authorization
+      which was overwritten while it was being re-evaluated (e.g. by a retried request) is not written,
+      as that would lose the newer version, and is reported as failed so it can be re-evaluated again.
+    - A pre-authorization that fails does not stop the others, its error is reported in the results.
+    - LLM calls are sent with batch priority, so they give way to interactive requests.
+
+    Parameters
+    ----------
+    cpt_codes: list[str] | None
+        Only re-evaluate pre-authorizations which requested one of these CPT codes, defaults to all.
+    max_workers: int | None
+        The number of pre-authorizations re-evaluated at the same time, defaults to the `reevaluation_max_workers` setting.
+    mode: CriteriaEvaluationMode | None
+        How the new and changed leaf criteria are queried, see `are_cpt_guideline_criteria_met`.
+
+    Returns
+    -------
+    BulkReevaluationResults
+        The result for each pre-authorization in the order they were created.
+    """
+    max_workers = max_workers or env.reevaluation_max_workers
+
+    logging.info(f'Re-evaluating pre-authorizations for {", ".join(cpt_codes) if cpt_codes else "every CPT code"} on {max_workers} threads...')
+
+    start_time = time.perf_counter()
+    db = Database()
+    page_size = env.reevaluation_page_size
+
+    pre_authorization_ids: list[str] = []
+    results: dict[str, ReevaluationResult] = {}
+    # The version that was read and its re-evaluated version, keyed by ID.
+    updated_pre_authorizations: dict[str, tuple[PreAuthorizationDocument, PreAuthorizationDocument]] = {}
+    conflicting_pre_authorization_ids: set[str] = set()
+    write_lock = threading.Lock()
+
+    def reevaluate(pre_authorization_id: str, pre_authorization: PreAuthorizationDocument) -> ReevaluationResult:
+        submitted_time = time.perf_counter()
+        try:
+            with llm_priority(Priority.BATCH):
+                reevaluated_pre_authorization, criteria_queried, criteria_reused = reevaluate_pre_authorization(pre_authorization, mode)
+        except PipelineException as exc:
+            error = exc.detail
+        except Exception as exc:
+            logging.exception(f'Re-evaluation failed for pre-authorization {pre_authorization_id}')
+            error = f'{type(exc).__name__}: {exc}'
+        else:
+            is_updated = reevaluated_pre_authorization != pre_authorization
+            if is_updated:
+                with write_lock:
+                    updated_pre_authorizations[pre_authorization_id] = (pre_authorization, reevaluated_pre_authorization)
+                    if len(updated_pre_authorizations) >= env.batch_write_size:
+                        conflicting_pre_authorization_ids.update(_write_pre_authorizations(db, updated_pre_authorizations))
+            return ReevaluationResult(
+                pre_authorization_id=pre_authorization_id,
+                status=ReevaluationStatus.UPDATED if is_updated else ReevaluationStatus.UNCHANGED,
+                criteria_queried=criteria_queried,
+                criteria_reused=criteria_reused,
+                duration_seconds=time.perf_counter() - submitted_time,
+            )
+        return ReevaluationResult(
+            pre_authorization_id=pre_authorization_id,
+            status=ReevaluationStatus.FAILED,
+            error=error,
+            duration_seconds=time.perf_counter() - submitted_time,
+        )
+
+    futures: dict[Future, str] = {}
+
+    def collect(done_futures: set[Future]):
+        for future in done_futures:
+            result = future.result()
+            results[futures.pop(future)] = result
+            logging.info(f' - {result.pre_authorization_id}: {result.status.value} ({result.criteria_queried} criteria queried, {result.criteria_reused} reused){f" ❌ {result.error}" if result.error else ""}')
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for pre_authorizations in _read_pre_authorizations(db, cpt_codes, page_size):
+            for pre_authorization_id, pre_authorization in pre_authorizations.items():
+                futures[executor.submit(with_current_span(reevaluate), pre_authorization_id, pre_authorization)] = pre_authorization_id
+            pre_authorization_ids.extend(pre_authorizations)
+            while len(futures) >= page_size:
+                collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        collect(wait(futures).done)
+
+    conflicting_pre_authorization_ids.update(_write_pre_authorizations(db, updated_pre_authorizations))
+    for pre_authorization_id in conflicting_pre_authorization_ids:
+        results[pre_authorization_id] = results[pre_authorization_id].model_copy(update={
+            'status': ReevaluationStatus.FAILED,
+            'error': 'The pre-authorization was changed while it was being re-evaluated',
+        })
+
+    ordered_results = [results[pre_authorization_id] for pre_authorization_id in pre_authorization_ids]
+    status_counts = {
+        status: sum(1 for result in ordered_results if result.status == status)
+        for status in ReevaluationStatus
+    }
+    criteria_queried = sum(result.criteria_queried for result in ordered_results)
+    criteria_reused = sum(result.criteria_reused for result in ordered_results)
+
+    logging.info(
+        f'Successfully re-evaluated pre-authorizations ✅ ({status_counts[ReevaluationStatus.UPDATED]} updated, '
+        f'{status_counts[ReevaluationStatus.UNCHANGED]} unchanged, {status_counts[ReevaluationStatus.FAILED]} failed, '
+        f'{criteria_queried} criteria queried, {criteria_reused} reused)'
+    )
+
+    return BulkReevaluationResults(
+        results=ordered_results,
+        updated_count=status_counts[ReevaluationStatus.UPDATED],
+        unchanged_count=status_counts[ReevaluationStatus.UNCHANGED],
+        failed_count=status_counts[ReevaluationStatus.FAILED],
+        criteria_queried=criteria_queried,
+        criteria_reused=criteria_reused,
+        duration_seconds=time.perf_counter() - start_time,
+    )
+
+
+def _read_pre_authorizations(db: Database, cpt_codes: list[str] | None, page_size: int) -> Iterator[dict[str, PreAuthorizationDocument]]:
+    """Reads the pre-authorizations which requested any of the CPT codes, oldest first, a page at a time."""
+    cursor = None
+    while True:
+        page = db.query(Collection.PRE_AUTHORIZATIONS, output_class=PreAuthorizationDocument, limit=page_size, cursor=cursor)
+        yield {
+            pre_authorization_id: pre_authorization
+            for pre_authorization_id, pre_authorization in page.documents.items()
+            if not cpt_codes or _requested_cpt_codes(pre_authorization).intersection(cpt_codes)
+        }
+        cursor = page.next_cursor
+        if not cursor:
+            return
+
+
+def _requested_cpt_codes(pre_authorization: PreAuthorizationDocument) -> set[str]:
+    return {result.cpt_code for result in pre_authorization.cpt_code_results} or {pre_authorization.cpt_code}
+
+
+def _write_pre_authorizations(
+        db: Database,
+        pre_authorizations: dict[str, tuple[PreAuthorizationDocument, PreAuthorizationDocument]],
+) -> list[str]:
+    """
+    Overwrites the pre-authorizations in the DB with their re-evaluated versions, unless they have changed
+    since they were read, and removes them from `pre_authorizations`. Returns the IDs of those that changed.
+    """
+    if not pre_authorizations:
+        return []
+    updated_ids = set(db.bulk_update_if_unchanged(
+        collection=Collection.PRE_AUTHORIZATIONS,
+        documents=dict(pre_authorizations),
+        output_class=PreAuthorizationDocument,
+    ))
+    conflicting_ids = [pre_authorization_id for pre_authorization_id in pre_authorizations if pre_authorization_id not in updated_ids]
+    pre_authorizations.clear()
+    return conflicting_ids
+
+
+if __name__ == '__main__':
+    """Script for re-scoring stored pre-authorizations after their guidelines have been re-ingested."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Re-evaluates stored pre-authorizations against the current guidelines.')
+    parser.add_argument('cpt_codes', nargs='*', help='Only re-evaluate pre-authorizations which requested these CPT codes.')
+    parser.add_argument('--max-workers', type=int, default=None, help='The number of pre-authorizations re-evaluated at the same time.')
+    args = parser.parse_args()
+
+    results = reevaluate_pre_authorizations(cpt_codes=args.cpt_codes or None, max_workers=args.max_workers)
+    print(
+        f'{results.updated_count} updated, {results.unchanged_count} unchanged, {results.failed_count} failed in '
+        f'{results.duration_seconds:.1f}s ({results.criteria_queried} criteria queried, {results.criteria_reused} reused)'
+    )
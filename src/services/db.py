@@ -1,7 +1,15 @@
+import argparse
+import base64
 import json
+import logging
+import queue
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from enum import Enum
+from functools import cache
 from pathlib import Path
-from typing import Type
+from typing import Type, Iterator
 from uuid import uuid4
 
 from pydantic import BaseModel
@@ -12,6 +20,7 @@ from env import env
 class Collection(Enum):
     CPT_GUIDELINES = 'cpt_guidelines'
     PRE_AUTHORIZATIONS = 'pre_authorizations'
+    CRITERION_STATISTICS = 'criterion_statistics'
 
 
 class DatabaseException(Exception):
@@ -19,22 +28,47 @@ class DatabaseException(Exception):
         self.msg = msg
 
 
+_INSERT_SQL = """
+    INSERT INTO documents (collection, document_id, document, cpt_code, exit_reason, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Keeps the original creation time of a document which is overwritten.
+_UPSERT_SQL = _INSERT_SQL + """
+    ON CONFLICT (collection, document_id) DO UPDATE SET
+        document = excluded.document,
+        cpt_code = excluded.cpt_code,
+        exit_reason = excluded.exit_reason,
+        updated_at = excluded.updated_at
+"""
+
+_INSERT_OR_IGNORE_SQL = _INSERT_SQL + """
+    ON CONFLICT (collection, document_id) DO NOTHING
+"""
+
+
+class QueryPage(BaseModel):
+    """A page of documents returned by `Database.query`, keyed by document ID."""
+    documents: dict[str, BaseModel]
+    next_cursor: str | None
+
+
 class Database:
     """
-    A mock NoSQL database service class that just stores documents on disk as JSON files.
+    A mock NoSQL database service class that stores JSON documents in a local SQLite database.
 
     Notes
     -----
+    - Documents are stored as JSON alongside indexed `cpt_code`, `exit_reason` and `created_at`
+      columns, so they can be queried without reading every document in a collection.
+    - Connections are pooled and shared by every `Database` in the process.
+    - A new database imports the documents from the old JSON file layout in `env.mock_nosql_db_dir`.
     - In production this could be replaced with Mongo DB, DocumentDB, Firestore, etc.
     """
 
     def __init__(self):
-        self.db_dir = env.mock_nosql_db_dir
-
-        for collection in Collection:
-            collection_path = self.db_dir / collection.value
-            if not collection_path.exists():
-                collection_path.mkdir()
+        self.db_path = env.db_path
+        self._pool = _get_connection_pool(self.db_path)
 
     def read(
             self,
@@ -45,18 +79,47 @@ class Database:
         """
         Read document from database.
         """
-        file_path = self._file_path(collection, document_id)
+        with self._pool.connection() as connection:
+            row = connection.execute(
+                'SELECT document FROM documents WHERE collection = ? AND document_id = ?',
+                (collection.value, document_id),
+            ).fetchone()
 
-        if not file_path.exists():
+        if not row:
             return None
 
-        with open(file_path, 'r') as file:
-            document = json.loads(file.read())
-
-        document = output_class(**document)
+        document = output_class(**json.loads(row['document']))
 
         return document
 
+    def read_many(
+            self,
+            collection: Collection,
+            document_ids: list[str],
+            output_class: Type[BaseModel],
+    ) -> dict[str, BaseModel | None]:
+        """
+        Read many documents from database in a single query, keyed by document ID.
+        Documents which do not exist are None.
+        """
+        documents = dict.fromkeys(document_ids)
+        if not document_ids:
+            return documents
+
+        with self._pool.connection() as connection:
+            rows = connection.execute(
+                f"""
+                SELECT document_id, document FROM documents
+                WHERE collection = ? AND document_id IN ({', '.join('?' * len(documents))})
+                """,
+                (collection.value, *documents),
+            ).fetchall()
+
+        for row in rows:
+            documents[row['document_id']] = output_class(**json.loads(row['document']))
+
+        return documents
+
     def create(
             self,
             collection: Collection,
@@ -67,19 +130,158 @@ class Database:
         """
         Create new document in database.
         """
-        document_id = document_id or uuid4()
-        file_path = self._file_path(collection, document_id)
+        document_id = document_id or str(uuid4())
+
+        with self._pool.connection() as connection:
+            try:
+                connection.execute(
+                    _UPSERT_SQL if overwrite else _INSERT_SQL,
+                    _to_row(collection, document_id, document),
+                )
+            except sqlite3.IntegrityError:
+                raise DatabaseException(f'Document already exists: {collection.value}/{document_id}')
 
-        if file_path.exists() and not overwrite:
-            raise DatabaseException(f'Document already exists: {file_path}')
+        return document_id
 
-        if isinstance(document, BaseModel):
-            document = document.model_dump()
+    def bulk_create(
+            self,
+            collection: Collection,
+            documents: dict[str, dict | BaseModel],
+            overwrite: bool = False,
+    ) -> list[str]:
+        """
+        Create many new documents in database, keyed by document ID, in a single transaction.
 
-        with open(file_path, 'w') as file:
-            file.write(json.dumps(document, indent=4))
+        Notes
+        -----
+        - If `overwrite` is False no documents are created if any of them already exist.
+        """
+        rows = [
+            _to_row(collection, document_id, document)
+            for document_id, document in documents.items()
+        ]
 
-        return document_id
+        with self._pool.connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(_UPSERT_SQL if overwrite else _INSERT_SQL, rows)
+            except sqlite3.IntegrityError:
+                connection.execute('ROLLBACK')
+                raise DatabaseException(f'Documents already exist in {collection.value}')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+        return list(documents)
+
+    def bulk_increment(
+            self,
+            collection: Collection,
+            increments: dict[str, dict[str, int | float]],
+            documents: dict[str, dict | BaseModel],
+    ):
+        """
+        Add to the numeric fields of many documents, keyed by document ID, in a single transaction.
+
+        Notes
+        -----
+        - The fields are incremented in SQL, so increments made concurrently (by other threads or
+          processes) are never lost, unlike reading, modifying and overwriting the documents.
+        - Documents which do not exist yet are first created from `documents`.
+
+        Parameters
+        ----------
+        collection: Collection
+            The collection of the documents.
+        increments: dict[str, dict[str, int | float]]
+            The amount to add to each field, keyed by document ID and then field name.
+        documents: dict[str, dict | BaseModel]
+            The documents to create if they do not exist, keyed by document ID.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        updates: dict[tuple[str, ...], list[list]] = {}
+        for document_id, field_increments in increments.items():
+            parameters = [parameter for field, increment in field_increments.items() for parameter in (f'$.{field}', f'$.{field}', increment)]
+            updates.setdefault(tuple(field_increments), []).append([*parameters, now, collection.value, document_id])
+
+        with self._pool.connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    _INSERT_OR_IGNORE_SQL,
+                    [_to_row(collection, document_id, documents[document_id]) for document_id in increments],
+                )
+                for fields, rows in updates.items():
+                    json_set_sql = ', '.join(['?, COALESCE(json_extract(document, ?), 0) + ?'] * len(fields))
+                    connection.executemany(
+                        f'UPDATE documents SET document = json_set(document, {json_set_sql}), updated_at = ? WHERE collection = ? AND document_id = ?',
+                        rows,
+                    )
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def bulk_update_if_unchanged(
+            self,
+            collection: Collection,
+            documents: dict[str, tuple[BaseModel, dict | BaseModel]],
+            output_class: Type[BaseModel],
+    ) -> list[str]:
+        """
+        Update many existing documents in a single transaction, keyed by document ID, skipping any
+        which no longer equal the version they were computed from, e.g. as they were overwritten since.
+
+        Parameters
+        ----------
+        collection: Collection
+            The collection of the documents.
+        documents: dict[str, tuple[BaseModel, dict | BaseModel]]
+            The version of each document that was read and its new version, keyed by document ID.
+        output_class: Type[BaseModel]
+            The data model of the documents in the collection, the stored versions are compared as this model.
+
+        Returns
+        -------
+        list[str]
+            The IDs of the documents which were updated.
+        """
+        if not documents:
+            return []
+
+        with self._pool.connection() as connection:
+            # Take the write lock before reading so nothing can change the documents in between.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                rows = connection.execute(
+                    f"""
+                    SELECT document_id, document FROM documents
+                    WHERE collection = ? AND document_id IN ({', '.join('?' * len(documents))})
+                    """,
+                    (collection.value, *documents),
+                ).fetchall()
+                updated_document_ids = [
+                    row['document_id'] for row in rows
+                    if output_class(**json.loads(row['document'])) == documents[row['document_id']][0]
+                ]
+                updates = []
+                for document_id in updated_document_ids:
+                    _, _, document_json, cpt_code, exit_reason, updated_at, _ = _to_row(collection, document_id, documents[document_id][1])
+                    updates.append((document_json, cpt_code, exit_reason, updated_at, collection.value, document_id))
+                connection.executemany(
+                    """
+                    UPDATE documents SET document = ?, cpt_code = ?, exit_reason = ?, updated_at = ?
+                    WHERE collection = ? AND document_id = ?
+                    """,
+                    updates,
+                )
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+        return updated_document_ids
 
     def update(
             self,
@@ -90,17 +292,261 @@ class Database:
         """
         Update existing document in database.
         """
-        file_path = self._file_path(collection, document_id)
+        _, _, document_json, cpt_code, exit_reason, updated_at, _ = _to_row(collection, document_id, document)
+
+        with self._pool.connection() as connection:
+            cursor = connection.execute(
+                """
+                UPDATE documents SET document = ?, cpt_code = ?, exit_reason = ?, updated_at = ?
+                WHERE collection = ? AND document_id = ?
+                """,
+                (document_json, cpt_code, exit_reason, updated_at, collection.value, document_id),
+            )
 
-        if not file_path.exists():
-            raise DatabaseException(f'Cannot update document as does not exist: {file_path}')
+        if cursor.rowcount == 0:
+            raise DatabaseException(f'Cannot update document as does not exist: {collection.value}/{document_id}')
 
-        return self.create(
-            collection=collection,
-            document=document,
-            document_id=document_id,
-            overwrite=True,
+        return document_id
+
+    def query(
+            self,
+            collection: Collection,
+            output_class: Type[BaseModel],
+            cpt_code: str | None = None,
+            exit_reason: str | Enum | None = None,
+            created_after: datetime | None = None,
+            created_before: datetime | None = None,
+            limit: int = 100,
+            cursor: str | None = None,
+    ) -> QueryPage:
+        """
+        Query the documents in a collection, oldest first, using the indexed fields.
+
+        Parameters
+        ----------
+        collection: Collection
+            The collection to query.
+        output_class: Type[BaseModel]
+            The data model of the documents in the collection.
+        cpt_code: str | None
+            Only return documents for this CPT code.
+        exit_reason: str | Enum | None
+            Only return documents with this exit reason.
+        created_after: datetime | None
+            Only return documents created at or after this time.
+        created_before: datetime | None
+            Only return documents created before this time.
+        limit: int
+            The maximum number of documents to return.
+        cursor: str | None
+            The `next_cursor` of the previous page, to return the page after it.
+
+        Returns
+        -------
+        QueryPage
+            The matching documents and a cursor for the next page, which is None if this is the last page.
+        """
+        where_sql, parameters = _where_sql(collection, cpt_code, exit_reason, created_after, created_before)
+
+        if cursor:
+            # Keyset pagination so later pages are as fast as the first.
+            last_created_at, last_document_id = json.loads(base64.urlsafe_b64decode(cursor))
+            where_sql += ' AND (created_at, document_id) > (?, ?)'
+            parameters += [last_created_at, last_document_id]
+
+        with self._pool.connection() as connection:
+            rows = connection.execute(
+                f'SELECT document_id, document, created_at FROM documents WHERE {where_sql} ORDER BY created_at, document_id LIMIT ?',
+                [*parameters, limit + 1],
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([rows[-1]['created_at'], rows[-1]['document_id']]).encode()
+            ).decode()
+
+        return QueryPage(
+            documents={row['document_id']: output_class(**json.loads(row['document'])) for row in rows},
+            next_cursor=next_cursor,
+        )
+
+    def count(
+            self,
+            collection: Collection,
+            cpt_code: str | None = None,
+            exit_reason: str | Enum | None = None,
+            created_after: datetime | None = None,
+            created_before: datetime | None = None,
+    ) -> int:
+        """
+        Count the documents in a collection using the indexed fields, see `query`.
+        """
+        where_sql, parameters = _where_sql(collection, cpt_code, exit_reason, created_after, created_before)
+
+        with self._pool.connection() as connection:
+            return connection.execute(f'SELECT COUNT(*) FROM documents WHERE {where_sql}', parameters).fetchone()[0]
+
+    def import_json_files(self, json_dir: Path, overwrite: bool = False) -> int:
+        """
+        Imports the documents stored in the old JSON file layout, i.e. `<json_dir>/<collection>/<document_id>.json`.
+
+        Notes
+        -----
+        - Documents which already exist are skipped unless `overwrite` is True.
+        - The creation time of each document is taken from the modification time of its file.
+
+        Returns
+        -------
+        int
+            The number of documents imported.
+        """
+        return _import_json_files(self._pool, json_dir, overwrite)
+
+    def close_connections(self):
+        """
+        Closes the idle pooled connections, which are reopened when next used. Call before forking
+        (e.g. in the web app after preloading), as SQLite connections must not be shared with a child process.
+        """
+        self._pool.close()
+
+
+class _ConnectionPool:
+    """A fixed size pool of SQLite connections which can be shared between threads."""
+
+    def __init__(self, db_path: Path, size: int):
+        self.db_path = db_path
+        # Connections are opened lazily and closed by `close`, so none need to be shared with a child after a fork.
+        self._connections: queue.LifoQueue[sqlite3.Connection | None] = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(None)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connections.get() or self._connect()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    def close(self):
+        for _ in range(self._connections.qsize()):
+            connection = self._connections.get_nowait()
+            if connection:
+                connection.close()
+            self._connections.put(None)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are opened explicitly where needed.
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+
+@cache
+def _get_connection_pool(db_path: Path) -> _ConnectionPool:
+    is_new_db = not db_path.exists()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    pool = _ConnectionPool(db_path, size=env.db_pool_size)
+    with pool.connection() as connection:
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                document TEXT NOT NULL,
+                cpt_code TEXT,
+                exit_reason TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (collection, document_id)
+            )
+            """
         )
+        connection.execute('CREATE INDEX IF NOT EXISTS documents_cpt_code ON documents (collection, cpt_code, created_at)')
+        connection.execute('CREATE INDEX IF NOT EXISTS documents_exit_reason ON documents (collection, exit_reason, created_at)')
+        connection.execute('CREATE INDEX IF NOT EXISTS documents_created_at ON documents (collection, created_at, document_id)')
+
+    if is_new_db and env.mock_nosql_db_dir.exists():
+        _import_json_files(pool, env.mock_nosql_db_dir, overwrite=False)
+
+    return pool
+
+
+def _import_json_files(pool: _ConnectionPool, json_dir: Path, overwrite: bool) -> int:
+    rows = []
+    for collection in Collection:
+        for file_path in sorted((json_dir / collection.value).glob('*.json')):
+            created_at = datetime.fromtimestamp(file_path.stat().st_mtime, timezone.utc).isoformat()
+            row = _to_row(collection, file_path.stem, json.loads(file_path.read_text()))
+            rows.append((*row[:5], created_at, created_at))
+
+    with pool.connection() as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            imported_count = 0
+            for row in rows:
+                sql = _UPSERT_SQL if overwrite else _INSERT_OR_IGNORE_SQL
+                imported_count += connection.execute(sql, row).rowcount
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    logging.info(f'Imported {imported_count} JSON documents from {json_dir} into {pool.db_path} ✅')
+
+    return imported_count
+
+
+def _to_row(collection: Collection, document_id: str, document: dict | BaseModel) -> tuple:
+    if isinstance(document, BaseModel):
+        document = document.model_dump(mode='json')
+
+    now = datetime.now(timezone.utc).isoformat()
+    return (
+        collection.value,
+        str(document_id),
+        json.dumps(document),
+        document.get('cpt_code'),
+        document.get('exit_reason'),
+        now,
+        now,
+    )
+
+
+def _where_sql(
+        collection: Collection,
+        cpt_code: str | None,
+        exit_reason: str | Enum | None,
+        created_after: datetime | None,
+        created_before: datetime | None,
+) -> tuple[str, list]:
+    conditions, parameters = ['collection = ?'], [collection.value]
+    if cpt_code is not None:
+        conditions.append('cpt_code = ?')
+        parameters.append(cpt_code)
+    if exit_reason is not None:
+        conditions.append('exit_reason = ?')
+        parameters.append(exit_reason.value if isinstance(exit_reason, Enum) else exit_reason)
+    if created_after is not None:
+        conditions.append('created_at >= ?')
+        parameters.append(created_after.astimezone(timezone.utc).isoformat())
+    if created_before is not None:
+        conditions.append('created_at < ?')
+        parameters.append(created_before.astimezone(timezone.utc).isoformat())
+    return ' AND '.join(conditions), parameters
+
+
+if __name__ == '__main__':
+    """Script for migrating documents stored in the old JSON file layout into the database."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Imports JSON file documents into the database.')
+    parser.add_argument('json_dir', type=Path, nargs='?', default=env.mock_nosql_db_dir, help='The directory containing a folder of JSON files per collection.')
+    parser.add_argument('--overwrite', action='store_true', help='Overwrite documents which already exist in the database.')
+    args = parser.parse_args()
 
-    def _file_path(self, collection: Collection, document_id: str) -> Path:
-        return self.db_dir / collection.value / f'{document_id}.json'
+    Database().import_json_files(args.json_dir, overwrite=args.overwrite)
@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from functools import cache
+from pathlib import Path
+from typing import Any, Iterator
+
+from llama_index.bridge.pydantic import Field, PrivateAttr
+from llama_index.embeddings.base import BaseEmbedding, Embedding
+
+from env import env
+from services.metrics import get_metrics
+from utils.hash_utils import sha256_text
+
+# SQLite limits the number of parameters in a single statement.
+MAX_KEYS_PER_QUERY = 500
+
+
+class EmbeddingCache:
+    """
+    A persistent cache of embeddings backed by a local SQLite database, keyed by the
+    embedding model and the hash of the normalized text, so identical chunks of different
+    medical records (headers, templates, re-submissions) are only ever embedded once.
+
+    Notes
+    -----
+    - Text is normalized by collapsing whitespace, so text which only differs in
+      whitespace (e.g. from PDF parsing) shares an embedding.
+    - Embeddings are stored as float64 so a cached embedding is identical to the one returned
+      by the API, and retrieval gives the same results whether or not the cache is hit.
+    - When the cache holds more than `max_entries` embeddings the least recently used
+      are evicted until it is back under 90% of the limit.
+    """
+
+    def __init__(self, db_path: Path, max_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: int | None = None  # Counted on first write.
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    embedding BLOB NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used_at ON embeddings (last_used_at)')
+
+    def get_many(self, model: str, texts: list[str]) -> list[Embedding | None]:
+        """
+        Returns the cached embedding of each text, or None for texts which have not been embedded by the model.
+        """
+        keys = [embedding_cache_key(model, text) for text in texts]
+        embeddings: dict[str, Embedding] = {}
+
+        with self._connect() as connection:
+            for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                key_batch = keys[i:i + MAX_KEYS_PER_QUERY]
+                placeholders = ', '.join('?' * len(key_batch))
+                rows = connection.execute(
+                    f'SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})',
+                    key_batch,
+                ).fetchall()
+                embeddings.update((row['key'], array('d', row['embedding']).tolist()) for row in rows)
+                # Bump the last use so eviction removes the least recently used embeddings first.
+                connection.execute(
+                    f'UPDATE embeddings SET last_used_at = ? WHERE key IN ({placeholders})',
+                    (time.time(), *key_batch),
+                )
+
+        results = [embeddings.get(key) for key in keys]
+        with self._lock:
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def set_many(self, model: str, texts: list[str], embeddings: list[Embedding]):
+        """
+        Stores the embedding of each text, evicting the least recently used embeddings if the cache is full.
+        """
+        now = time.time()
+        rows = [
+            (embedding_cache_key(model, text), array('d', embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._connect() as connection:
+            cursor = connection.executemany(
+                'INSERT INTO embeddings (key, embedding, last_used_at) VALUES (?, ?, ?) ON CONFLICT (key) DO NOTHING',
+                rows,
+            )
+            with self._lock:
+                if self._entries is None:
+                    self._entries = connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+                else:
+                    self._entries += cursor.rowcount
+                if self._entries > self.max_entries:
+                    self._evict(connection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'entries': self._entries,
+            }
+
+    def _evict(self, connection: sqlite3.Connection):
+        """Deletes the least recently used embeddings until the cache is under 90% of its max size. Must hold the lock."""
+        eviction_count = self._entries - int(0.9 * self.max_entries)
+        connection.execute(
+            'DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used_at LIMIT ?)',
+            (eviction_count,),
+        )
+        self._entries -= eviction_count
+        self.evictions += eviction_count
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model to look up the embedding of each text and query in the
+    embedding cache first, and only embed the texts which are not cached.
+    """
+
+    embed_model: BaseEmbedding = Field(description='The embedding model used for texts which are not cached.')
+    text_model: str = Field(description='The name of the model used to embed texts, part of the cache key.')
+    query_model: str = Field(description='The name of the model used to embed queries, part of the cache key.')
+
+    _embedding_cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(
+            self,
+            embed_model: BaseEmbedding,
+            embedding_cache: EmbeddingCache,
+            text_model: str | None = None,
+            query_model: str | None = None,
+            **kwargs: Any,
+    ):
+        super().__init__(
+            embed_model=embed_model,
+            text_model=text_model or embed_model.model_name,
+            query_model=query_model or text_model or embed_model.model_name,
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embedding_cache = embedding_cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return 'CachedEmbedding'
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._get_embeddings(self.query_model, [query], lambda texts: [self.embed_model._get_query_embedding(texts[0])])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return self._get_embeddings(self.text_model, texts, self.embed_model._get_text_embeddings)
+
+    def _get_embeddings(self, model: str, texts: list[str], embed) -> list[Embedding]:
+        embeddings = self._embedding_cache.get_many(model, texts)
+        missing_indexes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing_indexes:
+            missing_texts = [texts[i] for i in missing_indexes]
+            missing_embeddings = embed(missing_texts)
+            self._embedding_cache.set_many(model, missing_texts, missing_embeddings)
+            for i, embedding in zip(missing_indexes, missing_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """Returns the cache key for the embedding of the text by the model, ignoring differences in whitespace."""
+    return sha256_text(f'{model}\n{" ".join(text.split())}')
+
+
+@cache
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the embedding cache shared by every pipeline step in this process."""
+    embedding_cache = EmbeddingCache(
+        db_path=env.embedding_cache_db_path,
+        max_entries=env.embedding_cache_max_entries,
+    )
+    get_metrics().register_gauges('embedding_cache', 'Embedding cache statistics.', embedding_cache.stats)
+
+    return embedding_cache
@@ -0,0 +1,246 @@
+import array
+import base64
+import json
+import math
+import re
+import threading
+import time
+import zlib
+
+import httpx
+
+from utils.hash_utils import sha256_text
+
+# Canned tool call arguments keyed by the name of the structured output class.
+DEFAULT_CANNED_ARGUMENTS = {
+    'CPTCodes': {
+        'cpt_codes': ['45378'],
+    },
+    'PriorTreatmentInformation': {
+        'was_treatment_attempted': True,
+        'evidence_of_whether_treatment_was_attempted': 'The patient was prescribed a high fiber diet.',
+        'was_treatment_successful': False,
+        'evidence_of_whether_treatment_was_successful': 'Symptoms persisted after 6 weeks.',
+    },
+}
+
+
+class FakeOpenAITransport(httpx.BaseTransport):
+    """
+    A stand-in for the OpenAI API which answers chat, structured output and embedding
+    requests locally, so the pipelines can be run and benchmarked without an API key.
+
+    Notes
+    -----
+    - Answers are deterministic: structured outputs use the canned arguments for the output
+      class if there are any, otherwise criteria questions are answered yes or no based on a
+      hash of the prompt and any other output is generated from its JSON schema.
+    - Plain chat requests echo the last user message back.
+    - Embeddings are hashed bag-of-words vectors, so texts sharing words are similar.
+    - Each request sleeps for the simulated latency to mimic the real API.
+    - Rate limiting is simulated by answering 429 to requests beyond `max_concurrent_requests`
+      in flight, and to an evenly spread `rate_limited_fraction` of the others.
+    """
+
+    def __init__(
+            self,
+            chat_latency_seconds: float = 0.0,
+            embedding_latency_seconds: float = 0.0,
+            canned_arguments: dict[str, dict] | None = None,
+            embedding_dimensions: int = 256,
+            max_concurrent_requests: int | None = None,
+            rate_limited_fraction: float = 0.0,
+            retry_after_seconds: float = 0.0,
+    ):
+        self.chat_latency_seconds = chat_latency_seconds
+        self.embedding_latency_seconds = embedding_latency_seconds
+        self.canned_arguments = {**DEFAULT_CANNED_ARGUMENTS, **(canned_arguments or {})}
+        self.embedding_dimensions = embedding_dimensions
+        self.max_concurrent_requests = max_concurrent_requests
+        self.rate_limited_fraction = rate_limited_fraction
+        self.retry_after_seconds = retry_after_seconds
+
+        self.chat_calls = 0
+        self.structured_output_calls = 0
+        self.embedding_calls = 0
+        self.embedded_texts = 0
+        self.requests = 0
+        self.rate_limited_requests = 0
+        self.max_requests_in_flight = 0
+
+        self._lock = threading.Lock()
+        self._requests_in_flight = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.requests += 1
+            # Every request for which the running total of the fraction passes a whole number is rate limited.
+            is_rate_limited = int(self.requests * self.rate_limited_fraction) > int((self.requests - 1) * self.rate_limited_fraction)
+            if self.max_concurrent_requests is not None and self._requests_in_flight >= self.max_concurrent_requests:
+                is_rate_limited = True
+            if is_rate_limited:
+                self.rate_limited_requests += 1
+                return httpx.Response(
+                    429,
+                    headers={'retry-after': str(self.retry_after_seconds)},
+                    json={'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                )
+            self._requests_in_flight += 1
+            self.max_requests_in_flight = max(self.max_requests_in_flight, self._requests_in_flight)
+
+        try:
+            return self._handle_request(request)
+        finally:
+            with self._lock:
+                self._requests_in_flight -= 1
+
+    def _handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.read() or b'{}')
+
+        if request.url.path.endswith('/chat/completions'):
+            time.sleep(self.chat_latency_seconds)
+            return httpx.Response(200, json=self._chat_completion(body))
+        if request.url.path.endswith('/embeddings'):
+            time.sleep(self.embedding_latency_seconds)
+            return httpx.Response(200, json=self._embeddings(body))
+
+        return httpx.Response(404, json={'error': {'message': f'Unknown endpoint {request.url.path}'}})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'chat_calls': self.chat_calls,
+                'structured_output_calls': self.structured_output_calls,
+                'embedding_calls': self.embedding_calls,
+                'embedded_texts': self.embedded_texts,
+                'rate_limited_requests': self.rate_limited_requests,
+            }
+
+    def _chat_completion(self, body: dict) -> dict:
+        prompt = next(
+            (message['content'] for message in reversed(body['messages']) if message['role'] == 'user'),
+            '',
+        )
+        tools = body.get('tools') or []
+
+        message = {'role': 'assistant', 'content': prompt}
+        if tools:
+            function = tools[0]['function']
+            arguments = self._structured_output(function['name'], function.get('parameters', {}), prompt)
+            message = {
+                'role': 'assistant',
+                'content': None,
+                'tool_calls': [{
+                    'id': f'call_{sha256_text(prompt)[:24]}',
+                    'type': 'function',
+                    'function': {'name': function['name'], 'arguments': json.dumps(arguments)},
+                }],
+            }
+
+        with self._lock:
+            self.chat_calls += 1
+            if tools:
+                self.structured_output_calls += 1
+
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(json.dumps(message).split())
+        return {
+            'id': f'chatcmpl-{sha256_text(prompt)[:24]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': message,
+                'finish_reason': 'tool_calls' if tools else 'stop',
+                'logprobs': None,
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _structured_output(self, name: str, schema: dict, prompt: str) -> dict:
+        if name in self.canned_arguments:
+            return self.canned_arguments[name]
+        if name == 'QAResponse':
+            return _qa_response(prompt)
+        if name == 'BatchQAResponses':
+            # Questions are listed in the prompt as "[<question_id>] <question>".
+            return {
+                'answers': [
+                    {'question_id': question_id, **_qa_response(question)}
+                    for question_id, question in re.findall(r'^\s*\[(\d+)\] (.+)$', prompt, re.MULTILINE)
+                ]
+            }
+        if name == 'RecordInformation':
+            return {
+                'requested_cpt_codes': self._structured_output('CPTCodes', {}, prompt),
+                'prior_treatment': self._structured_output('PriorTreatmentInformation', {}, prompt),
+            }
+        return _from_schema(schema, schema.get('$defs', schema.get('definitions', {})))
+
+    def _embeddings(self, body: dict) -> dict:
+        texts = body['input'] if isinstance(body['input'], list) else [body['input']]
+        embeddings = [self._embedding(text) for text in texts]
+
+        with self._lock:
+            self.embedding_calls += 1
+            self.embedded_texts += len(texts)
+
+        if body.get('encoding_format') == 'base64':
+            embeddings = [base64.b64encode(array.array('f', embedding).tobytes()).decode() for embedding in embeddings]
+
+        token_count = sum(len(str(text).split()) for text in texts)
+        return {
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': embedding}
+                for i, embedding in enumerate(embeddings)
+            ],
+            'model': body.get('model', 'fake'),
+            'usage': {'prompt_tokens': token_count, 'total_tokens': token_count},
+        }
+
+    def _embedding(self, text: str | list[int]) -> list[float]:
+        embedding = [0.0] * self.embedding_dimensions
+        for word in re.findall(r'\w+', str(text).lower()):
+            embedding[zlib.crc32(word.encode()) % self.embedding_dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+        return [value / norm for value in embedding]
+
+
+def _qa_response(question: str) -> dict:
+    answer = int(sha256_text(question), 16) % 2 == 0
+    return {
+        'answer': answer,
+        'reason': f'The medical report {"shows" if answer else "does not show"} that this criterion is met.',
+        'evidence': None,
+        'additional_information_required': None,
+    }
+
+
+def _from_schema(schema: dict, definitions: dict, depth: int = 0):
+    """Returns a minimal value that is valid for the JSON schema."""
+    if '$ref' in schema:
+        return _from_schema(definitions[schema['$ref'].split('/')[-1]], definitions, depth)
+    if 'default' in schema:
+        return schema['default']
+    if 'enum' in schema:
+        return schema['enum'][0]
+    for union_key in ('anyOf', 'oneOf', 'allOf'):
+        if union_key in schema:
+            return _from_schema(schema[union_key][0], definitions, depth)
+
+    schema_type = schema.get('type', 'object')
+    if schema_type == 'object':
+        return {
+            name: _from_schema(property_schema, definitions, depth + 1)
+            for name, property_schema in schema.get('properties', {}).items()
+        }
+    if schema_type == 'array':
+        # Nested arrays are left empty so recursive schemas terminate.
+        return [_from_schema(schema['items'], definitions, depth + 1)] if depth < 2 and 'items' in schema else []
+    return {'string': 'canned', 'integer': 0, 'number': 0.0, 'boolean': True, 'null': None}.get(schema_type)
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from functools import cache
+from typing import Sequence
+
+from data_models.cpt_guideline import CPTGuidelineDocument, Criterion, GuidelineDecisionTree, LogicalOperator
+from data_models.pre_authorization import CriterionResult
+from env import env
+from services.db import Database, Collection
+from services.metrics import get_metrics
+
+
+class CompiledGuidelineTree:
+    """
+    A flat, array-backed representation of a `GuidelineDecisionTree` which is built once and
+    then evaluated without recursion for every pre-authorization.
+
+    Notes
+    -----
+    - Criteria are numbered in depth-first order, so every criterion comes after its parent
+      and evaluating the criteria in reverse order decides every sub-criterion before its parent.
+    - `parents` holds the index of the parent of each criterion, or -1 for the top level criteria.
+    - `operators` holds the operator which combines the sub-criteria of each criterion.
+    - `leaves` holds the indexes of the leaf criteria in depth-first order, the order in which
+      their results are passed to `evaluate`.
+    - `leaf_retrieval_queries` holds the query used to retrieve the medical record for each leaf
+      criterion, and `batched_retrieval_query` the query for every leaf criterion at once.
+    """
+
+    def __init__(self, decision_tree: GuidelineDecisionTree):
+        self.decision_tree = decision_tree
+
+        criteria: list[Criterion] = []
+        parents: list[int] = []
+        stack: list[tuple[Criterion, int]] = [(criterion, -1) for criterion in reversed(decision_tree.criteria)]
+        while stack:
+            criterion, parent = stack.pop()
+            criteria.append(criterion)
+            parents.append(parent)
+            stack.extend((sub_criterion, len(criteria) - 1) for sub_criterion in reversed(criterion.sub_criteria))
+
+        children: list[list[int]] = [[] for _ in criteria]
+        top_level: list[int] = []
+        for i, parent in enumerate(parents):
+            (children[parent] if parent >= 0 else top_level).append(i)
+
+        self.criteria: tuple[Criterion, ...] = tuple(criteria)
+        self.parents: tuple[int, ...] = tuple(parents)
+        self.children: tuple[tuple[int, ...], ...] = tuple(map(tuple, children))
+        self.top_level: tuple[int, ...] = tuple(top_level)
+        self.operators: tuple[LogicalOperator, ...] = tuple(
+            criterion.sub_criteria_operator or LogicalOperator.NONE for criterion in criteria
+        )
+        self.leaves: tuple[int, ...] = tuple(i for i, criterion_children in enumerate(children) if not criterion_children)
+        self.leaf_criteria: tuple[Criterion, ...] = tuple(criteria[i] for i in self.leaves)
+        self.leaf_retrieval_queries: tuple[str, ...] = tuple(
+            criterion.criterion_question or criterion.criterion for criterion in self.leaf_criteria
+        )
+        self.batched_retrieval_query: str = '\n'.join(self.leaf_retrieval_queries)
+
+    def evaluate(self, leaf_results: Sequence[CriterionResult]) -> tuple[bool, list[CriterionResult]]:
+        """
+        Combines the results of the leaf criteria with the logical operators to determine
+        whether the criteria as a whole are met.
+
+        Parameters
+        ----------
+        leaf_results: Sequence[CriterionResult]
+            The result for each leaf criterion, in the same order as `leaves`.
+
+        Returns
+        -------
+        tuple[bool, list[CriterionResult]]:
+            - The bool indicates whether criteria as a whole are met.
+            - The list[CriterionResult] stores the results from each individual criteria in depth-first order.
+        """
+        results: list[CriterionResult | None] = [None] * len(self.criteria)
+        for i, leaf_result in zip(self.leaves, leaf_results):
+            results[i] = leaf_result
+
+        for i in reversed(range(len(self.criteria))):
+            if self.children[i]:
+                is_met = combine_criteria_results(self.operators[i], [results[child].is_criterion_met for child in self.children[i]])
+                results[i] = CriterionResult(
+                    criterion=self.criteria[i].criterion,
+                    criterion_id=self.criteria[i].criterion_id,
+                    is_criterion_met=is_met,
+                    reason=f'Sub-criteria are{" not" if not is_met else ""} met.'
+                )
+
+        if not self.top_level:
+            return True, []
+
+        is_criteria_met = combine_criteria_results(
+            self.decision_tree.criteria_operator,
+            [results[i].is_criterion_met for i in self.top_level],
+        )
+        return is_criteria_met, results
+
+
+class CompiledGuidelines:
+    """The guidelines for a single CPT code along with their compiled decision tree."""
+
+    def __init__(self, document: CPTGuidelineDocument):
+        self.document = document
+        self.tree = CompiledGuidelineTree(document.decision_tree)
+        self.loaded_at = time.monotonic()
+
+
+class GuidelineCache:
+    """
+    An in-process cache of the compiled guidelines for each CPT code, so a pre-authorization
+    does not read, parse and validate the guidelines from the DB every time.
+
+    Notes
+    -----
+    - Entries are invalidated by `invalidate` when the guidelines for a CPT code are overwritten.
+      As that only reaches the cache of the process which ingested the guidelines, entries are
+      also reloaded after `max_age_seconds` so other processes pick up the new guidelines.
+    - CPT codes without guidelines are not cached, so they are found as soon as they are ingested.
+    """
+
+    def __init__(self, max_age_seconds: float):
+        self.max_age_seconds = max_age_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._guidelines: dict[str, CompiledGuidelines] = {}
+
+    def get_many(self, cpt_codes: list[str]) -> dict[str, CompiledGuidelines | None]:
+        """
+        Returns the compiled guidelines for each CPT code, reading any which are not cached from the
+        DB in a single query. CPT codes without guidelines are None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            guidelines = {
+                cpt_code: compiled_guidelines
+                if (compiled_guidelines := self._guidelines.get(cpt_code)) and now - compiled_guidelines.loaded_at <= self.max_age_seconds
+                else None
+                for cpt_code in cpt_codes
+            }
+            missing_cpt_codes = [cpt_code for cpt_code, compiled_guidelines in guidelines.items() if not compiled_guidelines]
+            self.hits += len(guidelines) - len(missing_cpt_codes)
+            self.misses += len(missing_cpt_codes)
+
+        if missing_cpt_codes:
+            documents = Database().read_many(
+                collection=Collection.CPT_GUIDELINES,
+                document_ids=missing_cpt_codes,
+                output_class=CPTGuidelineDocument,
+            )
+            for cpt_code, document in documents.items():
+                if document:
+                    guidelines[cpt_code] = self._put(cpt_code, CompiledGuidelines(document))
+
+        return guidelines
+
+    def invalidate(self, cpt_code: str):
+        with self._lock:
+            if self._guidelines.pop(cpt_code, None):
+                self.invalidations += 1
+
+    def warm(self):
+        """Loads and compiles the guidelines for every CPT code in the DB."""
+        logging.info('Warming guideline cache...')
+
+        db = Database()
+        cursor = None
+        while True:
+            page = db.query(Collection.CPT_GUIDELINES, output_class=CPTGuidelineDocument, cursor=cursor)
+            for cpt_code, document in page.documents.items():
+                self._put(cpt_code, CompiledGuidelines(document))
+            cursor = page.next_cursor
+            if not cursor:
+                break
+
+        logging.info(f'Successfully warmed guideline cache ✅ ({len(self._guidelines)} CPT codes)')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'cpt_codes': len(self._guidelines),
+            }
+
+    def _put(self, cpt_code: str, compiled_guidelines: CompiledGuidelines) -> CompiledGuidelines:
+        with self._lock:
+            self._guidelines[cpt_code] = compiled_guidelines
+        return compiled_guidelines
+
+
+def combine_criteria_results(operator: LogicalOperator, values: list[bool | None]) -> bool | None:
+    """
+    Combines the results of sibling criteria with their operator.
+
+    Notes
+    -----
+    - Uses three-valued logic, so the result does not depend on the order of the criteria and
+      is the same whether or not the criteria which cannot change it were evaluated: an unmet
+      criterion decides an AND and a met criterion decides an OR, otherwise the result is None
+      (unknown) if any of the results is None.
+    - A NONE operator (a criterion with a single sub-criterion) leaves the result as met.
+    """
+    if operator == LogicalOperator.NONE:
+        return True
+
+    decisive_value = operator == LogicalOperator.OR  # True decides an OR, False decides an AND
+    if decisive_value in values:
+        return decisive_value
+    if None in values:
+        return None
+    return not decisive_value
+
+
+@cache
+def get_guideline_cache() -> GuidelineCache:
+    """Returns the guideline cache shared by every request in this process."""
+    guideline_cache = GuidelineCache(max_age_seconds=env.guideline_cache_max_age_seconds)
+    get_metrics().register_gauges('guideline_cache', 'Compiled guideline cache statistics.', guideline_cache.stats)
+
+    return guideline_cache
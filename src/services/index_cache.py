@@ -0,0 +1,105 @@
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from functools import cache
+
+from llama_index import VectorStoreIndex
+
+from env import env
+from services.metrics import get_metrics
+from services.numpy_vector_store import NumpyVectorStore
+
+# The approximate size of each float in an embedding held in memory as a Python list.
+PYTHON_FLOAT_SIZE_BYTES = 32
+
+
+class IndexCache:
+    """
+    An in-process LRU cache of loaded medical record indexes so a repeat
+    submission of the same record skips parsing the PDF and loading the
+    index from disk.
+
+    Notes
+    -----
+    - Indexes are keyed by the SHA-256 of the medical record file.
+    - When the estimated memory used by the cached indexes exceeds
+      `max_size_bytes` the least recently used indexes are evicted.
+    """
+
+    def __init__(self, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._indexes: OrderedDict[str, tuple[VectorStoreIndex, int]] = OrderedDict()
+        self._size_bytes = 0
+
+    def get(self, key: str) -> VectorStoreIndex | None:
+        with self._lock:
+            if key not in self._indexes:
+                self.misses += 1
+                return None
+            self._indexes.move_to_end(key)
+            self.hits += 1
+            return self._indexes[key][0]
+
+    def put(self, key: str, index: VectorStoreIndex):
+        size_bytes = _estimate_index_size_bytes(index)
+        with self._lock:
+            self._remove(key)
+            self._indexes[key] = (index, size_bytes)
+            self._size_bytes += size_bytes
+            # Always keep the index just added, even if it is larger than the cache.
+            while self._size_bytes > self.max_size_bytes and len(self._indexes) > 1:
+                evicted_key, _ = next(iter(self._indexes.items()))
+                self._remove(evicted_key)
+                self.evictions += 1
+                logging.debug(f'Evicted index {evicted_key} from index cache')
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size_bytes': self._size_bytes,
+                'indexes': len(self._indexes),
+            }
+
+    def _remove(self, key: str):
+        """Must hold the lock."""
+        if key in self._indexes:
+            _, size_bytes = self._indexes.pop(key)
+            self._size_bytes -= size_bytes
+
+
+def _estimate_index_size_bytes(index: VectorStoreIndex) -> int:
+    """Estimates the memory used by the node text and embeddings of an index."""
+    if isinstance(index.vector_store, NumpyVectorStore):
+        return index.vector_store.size_bytes()
+
+    size_bytes = 0
+    for node_id, node in index.docstore.docs.items():
+        size_bytes += sys.getsizeof(node.get_content())
+        try:
+            size_bytes += len(index.vector_store.get(node_id)) * PYTHON_FLOAT_SIZE_BYTES
+        except (KeyError, NotImplementedError):
+            pass
+    return size_bytes
+
+
+@cache
+def get_index_cache() -> IndexCache:
+    """Returns the index cache shared by every request in this process."""
+    index_cache = IndexCache(max_size_bytes=env.index_cache_max_size_bytes)
+    get_metrics().register_gauges('index_cache', 'Loaded medical record index cache statistics.', index_cache.stats)
+
+    return index_cache
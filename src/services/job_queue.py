@@ -0,0 +1,283 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import cache
+from pathlib import Path
+from typing import Callable, Iterator
+from uuid import uuid4
+
+from data_models.job import Job, JobStatus
+from env import env
+
+
+class JobException(Exception):
+    """Raised by a job handler to fail the job with a detail and status code that are reported to the client."""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        self.detail = detail
+        self.status_code = status_code
+
+
+class JobQueue:
+    """
+    A persistent job queue backed by a local SQLite database, so jobs survive
+    a restart of the server without needing an external message broker.
+
+    Notes
+    -----
+    - A claimed job holds a lease which the worker extends while the job runs. If the
+      worker process crashes the lease expires and the job is claimed again (up to
+      `max_attempts` times), so no job is lost.
+    - In production this could be replaced with SQS, Cloud Tasks, Celery, etc.
+    """
+
+    def __init__(
+            self,
+            db_path: Path,
+            lease_seconds: float,
+            max_attempts: int,
+    ):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    error_status_code INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_expires_at REAL,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+                """
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (job_type, status, created_at)')
+
+    def enqueue(self, job_type: str, payload: dict) -> str:
+        """
+        Adds a job to the queue and returns its ID.
+        """
+        job_id = str(uuid4())
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO jobs (job_id, job_type, status, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, job_type, JobStatus.PENDING.value, json.dumps(payload), _now()),
+            )
+        return job_id
+
+    def enqueue_many(self, job_type: str, payloads: list[dict]) -> list[str]:
+        """
+        Adds many jobs to the queue in a single transaction and returns their IDs in the same order as `payloads`.
+        """
+        job_ids = [str(uuid4()) for _ in payloads]
+        created_at = _now()
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'INSERT INTO jobs (job_id, job_type, status, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+                    [(job_id, job_type, JobStatus.PENDING.value, json.dumps(payload), created_at) for job_id, payload in zip(job_ids, payloads)],
+                )
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        return job_ids
+
+    def get(self, job_id: str) -> Job | None:
+        with self._connect() as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return _to_job(row) if row else None
+
+    def claim(self, job_type: str) -> Job | None:
+        """
+        Claims the oldest pending job, or a running job whose worker has stopped renewing its lease.
+        """
+        with self._connect() as connection:
+            while True:
+                # Take the write lock before reading so two workers can never claim the same job.
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    row = connection.execute(
+                        """
+                        SELECT * FROM jobs
+                        WHERE job_type = ? AND (status = ? OR (status = ? AND lease_expires_at < ?))
+                        ORDER BY created_at
+                        LIMIT 1
+                        """,
+                        (job_type, JobStatus.PENDING.value, JobStatus.RUNNING.value, time.time()),
+                    ).fetchone()
+                    if not row:
+                        return None
+
+                    job = _to_job(row)
+                    if job.attempts < self.max_attempts:
+                        connection.execute(
+                            'UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, started_at = ? WHERE job_id = ?',
+                            (JobStatus.RUNNING.value, time.time() + self.lease_seconds, _now(), job.job_id),
+                        )
+                        return job.model_copy(update={'status': JobStatus.RUNNING, 'attempts': job.attempts + 1})
+
+                    # The job keeps crashing its worker so give up on it.
+                    connection.execute(
+                        'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?',
+                        (JobStatus.FAILED.value, f'Job was interrupted {job.attempts} times', _now(), job.job_id),
+                    )
+                finally:
+                    connection.execute('COMMIT')
+
+    def renew_leases(self, job_ids: list[str]):
+        """Extends the leases of jobs which are still running."""
+        with self._connect() as connection:
+            connection.executemany(
+                'UPDATE jobs SET lease_expires_at = ? WHERE job_id = ? AND status = ?',
+                [(time.time() + self.lease_seconds, job_id, JobStatus.RUNNING.value) for job_id in job_ids],
+            )
+
+    def complete(self, job_id: str, result: dict):
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE job_id = ?',
+                (JobStatus.SUCCEEDED.value, json.dumps(result), _now(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str, status_code: int = 500):
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, error = ?, error_status_code = ?, finished_at = ? WHERE job_id = ?',
+                (JobStatus.FAILED.value, error, status_code, _now(), job_id),
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit mode, transactions are opened explicitly where needed.
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+class JobWorkerPool:
+    """
+    A pool of background threads that claim jobs of a single type from the
+    queue and run them with the given handler.
+
+    Notes
+    -----
+    - The handler takes the claimed job and returns the job result.
+    - A job is retried if its worker crashes, so the handler must be idempotent, e.g. by deriving
+      the IDs of the documents it stores from the job ID and overwriting them.
+    - A `JobException` raised by the handler fails the job with its detail and status code,
+      any other exception fails the job with a 500 status code.
+    """
+
+    def __init__(
+            self,
+            queue: JobQueue,
+            job_type: str,
+            handler: Callable[[Job], dict],
+            num_workers: int,
+            poll_interval_seconds: float = 1.0,
+    ):
+        self.queue = queue
+        self.job_type = job_type
+        self.handler = handler
+        self.num_workers = num_workers
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._running_job_ids: set[str] = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f'{self.job_type}-worker-{i}', daemon=True)
+            for i in range(self.num_workers)
+        ]
+        self._threads.append(threading.Thread(target=self._renew_leases, name=f'{self.job_type}-lease-renewer', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logging.info(f'Started {self.num_workers} {self.job_type} job workers')
+
+    def stop(self, timeout: float | None = None):
+        """Stops claiming new jobs and waits for the running jobs to finish."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.job_type)
+            if not job:
+                self._stop.wait(self.poll_interval_seconds)
+                continue
+
+            with self._lock:
+                self._running_job_ids.add(job.job_id)
+            try:
+                result = self.handler(job)
+            except JobException as exc:
+                self.queue.fail(job.job_id, error=exc.detail, status_code=exc.status_code)
+            except Exception as exc:
+                logging.exception(f'Job {job.job_id} failed')
+                self.queue.fail(job.job_id, error=str(exc))
+            else:
+                self.queue.complete(job.job_id, result)
+            finally:
+                with self._lock:
+                    self._running_job_ids.discard(job.job_id)
+
+    def _renew_leases(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            with self._lock:
+                job_ids = list(self._running_job_ids)
+            if job_ids:
+                self.queue.renew_leases(job_ids)
+
+
+def _to_job(row: sqlite3.Row) -> Job:
+    return Job(
+        job_id=row['job_id'],
+        job_type=row['job_type'],
+        status=JobStatus(row['status']),
+        payload=json.loads(row['payload']),
+        result=json.loads(row['result']) if row['result'] else None,
+        error=row['error'],
+        error_status_code=row['error_status_code'],
+        attempts=row['attempts'],
+        created_at=row['created_at'],
+        started_at=row['started_at'],
+        finished_at=row['finished_at'],
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@cache
+def get_job_queue() -> JobQueue:
+    """Returns the job queue shared by every request in this process."""
+    return JobQueue(
+        db_path=env.job_queue_db_path,
+        lease_seconds=env.job_lease_seconds,
+        max_attempts=env.job_max_attempts,
+    )
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import cache
+from pathlib import Path
+from typing import Type
+
+from pydantic import BaseModel
+
+from env import env
+from services.metrics import get_metrics
+from utils.hash_utils import sha256_text
+
+
+class LLMCache:
+    """
+    A persistent, content-addressed cache of LLM responses that just stores each response on disk as a JSON file.
+
+    Notes
+    -----
+    - Every LLM call in the pipelines is made at temperature 0, so the same model, prompt
+      and retrieved context will always give the same response.
+    - Entries older than `max_age_seconds` are treated as misses and deleted.
+    - When the cache grows beyond `max_size_bytes` the least recently used entries are
+      evicted until it is back under 90% of the limit.
+    - In production this could be replaced with Redis, Memcached, etc.
+    """
+
+    def __init__(
+            self,
+            cache_dir: Path,
+            max_size_bytes: int,
+            max_age_seconds: float,
+            enabled: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._size_bytes: int | None = None  # Calculated on first write.
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response for the key, or None if there is no (fresh) cached response.
+        """
+        if not self.enabled:
+            return None
+
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'r') as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._count(hit=False)
+            return None
+
+        if time.time() - entry['created_at'] > self.max_age_seconds:
+            self._delete(file_path)
+            self._count(hit=False)
+            return None
+
+        # Bump the modification time so size-based eviction removes the least recently used entries first.
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            pass  # Evicted by another thread or process since it was read, which is still a hit.
+        self._count(hit=True)
+        return entry['value']
+
+    def set(self, key: str, value: str):
+        """
+        Stores the response for the key, evicting the least recently used entries if the cache is full.
+        """
+        if not self.enabled:
+            return
+
+        file_path = self._file_path(key)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            replaced_size_bytes = file_path.stat().st_size
+        except FileNotFoundError:
+            replaced_size_bytes = 0
+
+        # Write to a temporary file then rename so concurrent readers never see a partially written entry.
+        with tempfile.NamedTemporaryFile('w', dir=file_path.parent, delete=False, suffix='.tmp') as file:
+            json.dump({'created_at': time.time(), 'value': value}, file)
+        os.replace(file.name, file_path)
+
+        with self._lock:
+            if self._size_bytes is None:
+                self._size_bytes = sum(path.stat().st_size for path in self.cache_dir.glob('*/*.json'))
+            else:
+                self._size_bytes += file_path.stat().st_size - replaced_size_bytes
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def get_model(self, key: str, output_class: Type[BaseModel]) -> BaseModel | None:
+        """Returns the cached response for the key parsed as the given pydantic model."""
+        value = self.get(key)
+        return output_class.model_validate_json(value) if value is not None else None
+
+    def set_model(self, key: str, value: BaseModel):
+        """Stores a pydantic model response for the key."""
+        self.set(key, value.model_dump_json())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size_bytes': self._size_bytes,
+            }
+
+    def _evict(self):
+        """Deletes the least recently used entries until the cache is under 90% of its max size. Must hold the lock."""
+        entries = sorted(
+            ((path, path.stat()) for path in self.cache_dir.glob('*/*.json')),
+            key=lambda entry: entry[1].st_mtime,
+        )
+        self._size_bytes = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if self._size_bytes <= 0.9 * self.max_size_bytes:
+                break
+            self._delete(path)
+            self._size_bytes -= stat.st_size
+            self.evictions += 1
+        logging.debug(f'Evicted LLM cache entries, cache size is now {self._size_bytes} bytes')
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _file_path(self, key: str) -> Path:
+        # Fan out into sub-directories to keep the number of files per directory small.
+        return self.cache_dir / key[:2] / f'{key}.json'
+
+    @staticmethod
+    def _delete(file_path: Path):
+        try:
+            file_path.unlink()
+        except FileNotFoundError:
+            pass  # Already deleted by another thread or process.
+
+
+def llm_cache_key(
+        model: str,
+        prompt: str,
+        context: list[str] | None = None,
+        output_class: Type[BaseModel] | None = None,
+) -> str:
+    """
+    Returns the cache key for an LLM call.
+
+    Parameters
+    ----------
+    model: str
+        The name of the LLM.
+    prompt: str
+        The prompt (or serialized chat messages) sent to the LLM.
+    context: list[str] | None
+        The content of the nodes retrieved for a RAG query.
+    output_class: Type[BaseModel] | None
+        The class of the structured output, if any.
+
+    Returns
+    -------
+    str
+        The hex SHA-256 digest of all the inputs.
+    """
+    return sha256_text(json.dumps([
+        model,
+        sha256_text(prompt),
+        sha256_text(json.dumps(context)) if context is not None else None,
+        sha256_text(json.dumps(output_class.model_json_schema())) if output_class else None,
+    ]))
+
+
+@cache
+def get_llm_cache() -> LLMCache:
+    """Returns the LLM cache shared by every pipeline step in this process."""
+    llm_cache = LLMCache(
+        cache_dir=env.llm_cache_dir,
+        max_size_bytes=env.llm_cache_max_size_bytes,
+        max_age_seconds=env.llm_cache_max_age_seconds,
+        enabled=env.llm_cache_enabled,
+    )
+    get_metrics().register_gauges('llm_cache', 'LLM response cache statistics.', llm_cache.stats)
+
+    return llm_cache
@@ -0,0 +1,260 @@
+import json
+import threading
+import weakref
+from functools import cache
+from typing import Type
+
+import httpx
+import openai
+from llama_index import ServiceContext, get_response_synthesizer
+from llama_index.embeddings import OpenAIEmbedding
+from llama_index.llms import OpenAI
+from llama_index.response_synthesizers import BaseSynthesizer
+from pydantic import BaseModel
+
+from env import env
+from services.embedding_cache import EmbeddingCache, CachedEmbedding, get_embedding_cache
+from services.fake_openai import FakeOpenAITransport
+from services.llm_scheduler import LLMScheduler, SchedulingTransport
+from services.shared_token_buckets import SharedTokenBuckets
+from services.metrics import get_metrics
+from services.tracing import span, Span
+
+
+class LLMProvider:
+    """
+    A process-wide provider of LLM clients, service contexts and response synthesizers,
+    so they are constructed once rather than on every LLM call.
+
+    Notes
+    -----
+    - Every client shares a single keep-alive HTTP connection pool, so the connections
+      to OpenAI are reused across pipeline steps, threads and requests.
+    - LLMs and service contexts are keyed by model and temperature. `None` uses the
+      LlamaIndex defaults, as used by the default service context of an index.
+    - All the objects handed out are safe to share between threads.
+    - A `transport` can be given to send the requests somewhere other than the OpenAI API,
+      e.g. the local `FakeOpenAITransport`.
+    - Every request to the API is traced, see `_TracingTransport`.
+    - If an `embedding_cache` is given, texts and queries are only embedded if they are not
+      already in the cache, see `CachedEmbedding`.
+    - If a `scheduler` is given, every request goes through it to stay within the rate limits
+      of the API and it retries failed requests rather than the clients, see `LLMScheduler`.
+    """
+
+    def __init__(
+            self,
+            max_connections: int,
+            timeout_seconds: float,
+            max_retries: int,
+            transport: httpx.BaseTransport | None = None,
+            embedding_cache: EmbeddingCache | None = None,
+            scheduler: LLMScheduler | None = None,
+    ):
+        # Requests are only retried by the scheduler if there is one, so they are not retried twice.
+        self.max_retries = 0 if scheduler else max_retries
+        self.transport = transport
+        self.scheduler = scheduler
+
+        self.llms_created = 0
+        self.service_contexts_created = 0
+        self.response_synthesizers_created = 0
+        self.requests = 0
+        self.reuses = 0
+        self.http_requests = 0
+        self.http_connections_opened = 0
+
+        self._lock = threading.Lock()
+        self._llms: dict[tuple, OpenAI] = {}
+        self._service_contexts: dict[tuple, ServiceContext] = {}
+        self._response_synthesizers: dict[tuple, tuple[ServiceContext, BaseSynthesizer]] = {}
+        self._network_streams = weakref.WeakSet()
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # Each attempt of a scheduled request is traced, so retries show up in the metrics.
+        http_transport = _TracingTransport(transport or httpx.HTTPTransport(limits=limits))
+        self.http_client = httpx.Client(
+            timeout=timeout_seconds,
+            transport=SchedulingTransport(scheduler, http_transport) if scheduler else http_transport,
+            event_hooks={'response': [self._on_response]},
+        )
+        self.openai_client = openai.OpenAI(
+            api_key=env.openai_api_key,
+            http_client=self.http_client,
+            max_retries=self.max_retries,
+        )
+        self.embed_model = OpenAIEmbedding(
+            api_key=env.openai_api_key,
+            http_client=self.http_client,
+            max_retries=self.max_retries,
+        )
+        # Part of the key of precomputed query embeddings, so they are ignored if the model changes.
+        self.query_embedding_model: str = self.embed_model._query_engine
+        if embedding_cache:
+            self.embed_model = CachedEmbedding(
+                self.embed_model,
+                embedding_cache,
+                # The models used for texts and queries depend on the embedding mode.
+                text_model=self.embed_model._text_engine,
+                query_model=self.embed_model._query_engine,
+            )
+
+    def llm(self, model: str | None = None, temperature: float | None = None) -> OpenAI:
+        """Returns the shared LLM client for the model and temperature."""
+        key = (model, temperature)
+        with self._lock:
+            self._count_request(key in self._llms)
+            if key not in self._llms:
+                self._llms[key] = OpenAI(
+                    **{name: value for name, value in [('model', model), ('temperature', temperature)] if value is not None},
+                    api_key=env.openai_api_key,
+                    max_retries=self.max_retries,
+                    http_client=self.http_client,
+                )
+                self.llms_created += 1
+            return self._llms[key]
+
+    def service_context(self, model: str | None = None, temperature: float | None = None) -> ServiceContext:
+        """Returns the shared service context for the LLM with the model and temperature."""
+        llm = self.llm(model, temperature)
+        key = (model, temperature)
+        with self._lock:
+            self._count_request(key in self._service_contexts)
+            if key not in self._service_contexts:
+                self._service_contexts[key] = ServiceContext.from_defaults(
+                    llm=llm,
+                    embed_model=self.embed_model,
+                )
+                self.service_contexts_created += 1
+            return self._service_contexts[key]
+
+    def response_synthesizer(self, service_context: ServiceContext, output_cls: Type[BaseModel]) -> BaseSynthesizer:
+        """
+        Returns a shared response synthesizer with a structured output for the service context,
+        which can be combined with the retriever for any index to make a query engine.
+        """
+        # The service context is kept with the synthesizer so its ID is never reused.
+        key = (id(service_context), output_cls)
+        with self._lock:
+            self._count_request(key in self._response_synthesizers)
+            if key not in self._response_synthesizers:
+                self._response_synthesizers[key] = (
+                    service_context,
+                    get_response_synthesizer(service_context=service_context, output_cls=output_cls),
+                )
+                self.response_synthesizers_created += 1
+            return self._response_synthesizers[key][1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'llms_created': self.llms_created,
+                'service_contexts_created': self.service_contexts_created,
+                'response_synthesizers_created': self.response_synthesizers_created,
+                'requests': self.requests,
+                'reuses': self.reuses,
+                'http_requests': self.http_requests,
+                'http_connections_opened': self.http_connections_opened,
+            }
+
+    def _count_request(self, reused: bool):
+        """Must hold the lock."""
+        self.requests += 1
+        if reused:
+            self.reuses += 1
+
+    def _on_response(self, response: httpx.Response):
+        # Each connection in the pool has its own network stream, so a new stream means a new connection.
+        network_stream = response.extensions.get('network_stream')
+        with self._lock:
+            self.http_requests += 1
+            if network_stream is not None and network_stream not in self._network_streams:
+                self._network_streams.add(network_stream)
+                self.http_connections_opened += 1
+
+
+class _TracingTransport(httpx.BaseTransport):
+    """
+    Wraps the transport used for requests to the OpenAI API to open a span for each chat
+    completion and embedding request, and to count the requests and tokens used.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = 'embedding' if request.url.path.endswith('/embeddings') else 'chat'
+        with span(f'llm.{endpoint}') as llm_span:
+            response = self.transport.handle_request(request)
+            # Only read the response here if it is traced, so disabled tracing costs nothing.
+            if isinstance(llm_span, Span):
+                self._record(request, response, endpoint, llm_span)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+    @staticmethod
+    def _record(request: httpx.Request, response: httpx.Response, endpoint: str, llm_span: Span):
+        model = json.loads(request.content or b'{}').get('model', '')
+        response.read()
+        try:
+            usage = response.json().get('usage') or {}
+        except ValueError:
+            usage = {}
+
+        llm_span.set_attribute('model', model)
+        llm_span.set_attribute('status_code', response.status_code)
+
+        metrics = get_metrics()
+        metrics.counter(
+            'llm_requests_total', 'The number of requests to the LLM API.', ('endpoint', 'model', 'status_code'),
+        ).inc(endpoint=endpoint, model=model, status_code=response.status_code)
+        for token_type in ('prompt_tokens', 'completion_tokens'):
+            if token_type in usage:
+                llm_span.set_attribute(token_type, usage[token_type])
+                metrics.counter(
+                    'llm_tokens_total', 'The number of tokens used by LLM API requests.', ('endpoint', 'model', 'type'),
+                ).inc(usage[token_type], endpoint=endpoint, model=model, type=token_type)
+
+
+@cache
+def get_llm_provider() -> LLMProvider:
+    """Returns the LLM provider shared by every pipeline in this process."""
+    transport = None
+    if env.llm_backend == 'fake':
+        transport = FakeOpenAITransport(
+            chat_latency_seconds=env.fake_llm_latency_seconds,
+            embedding_latency_seconds=env.fake_embedding_latency_seconds,
+            max_concurrent_requests=env.fake_llm_max_concurrent_requests,
+            rate_limited_fraction=env.fake_llm_rate_limited_fraction,
+        )
+
+    scheduler = LLMScheduler(
+        requests_per_minute=env.llm_requests_per_minute,
+        tokens_per_minute=env.llm_tokens_per_minute,
+        initial_concurrency=env.llm_initial_concurrency,
+        max_concurrency=env.llm_max_connections,
+        latency_target_seconds=env.llm_latency_target_seconds,
+        max_retries=env.llm_max_retries,
+        retry_base_delay_seconds=env.llm_retry_base_delay_seconds,
+        retry_max_delay_seconds=env.llm_retry_max_delay_seconds,
+        shared_token_buckets=SharedTokenBuckets(
+            db_path=env.llm_rate_limits_db_path,
+            rates_per_minute={'requests': env.llm_requests_per_minute, 'tokens': env.llm_tokens_per_minute},
+            reserved_fraction=env.llm_batch_reserved_fraction,
+        ),
+    )
+    get_metrics().register_gauges('llm_scheduler', 'LLM API rate limiting and concurrency.', scheduler.stats)
+
+    llm_provider = LLMProvider(
+        max_connections=env.llm_max_connections,
+        timeout_seconds=env.llm_timeout_seconds,
+        max_retries=env.llm_max_retries,
+        transport=transport,
+        embedding_cache=get_embedding_cache() if env.embedding_cache_enabled else None,
+        scheduler=scheduler,
+    )
+    get_metrics().register_gauges('llm_provider', 'LLM client construction and connection reuse.', llm_provider.stats)
+
+    return llm_provider
@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Callable, Iterator
+
+import httpx
+
+from services.metrics import get_metrics
+from services.shared_token_buckets import SharedTokenBuckets
+
+# Responses which are retried, the API returns 429 when the rate limit is exceeded.
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class Priority(IntEnum):
+    """The priority of LLM calls, lower values are sent first."""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+_priority: ContextVar[Priority] = ContextVar('llm_priority', default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """
+    Sends the LLM calls made in this context with the priority, e.g. so batch jobs
+    give way to interactive requests. Use `with_current_span` to carry it into threads.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    A budget which refills continuously at `rate_per_second` up to `capacity`.
+    Not thread-safe, the scheduler only uses it while holding its lock.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.available = capacity
+        self._updated_at = time.monotonic()
+
+    def wait_seconds(self, amount: float) -> float:
+        """Returns how long until `amount` is available, 0 if it is available now."""
+        self._refill()
+        amount = min(amount, self.capacity)  # Otherwise a large request would never be sent.
+        return max(0.0, (amount - self.available) / self.rate_per_second)
+
+    def take(self, amount: float):
+        """Takes from the budget, which may go negative when correcting an estimate."""
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+
+class LLMScheduler:
+    """
+    A process-wide scheduler for requests to the LLM API, which keeps every pipeline step
+    in every thread within the rate limits of the API rather than each failing on its own.
+
+    Notes
+    -----
+    - Requests and (estimated) tokens are budgeted with token buckets refilled at the per-minute
+      rate limits. The estimate is corrected with the usage in the response.
+    - The rate limits apply to the API key rather than the process, so given `shared_token_buckets`
+      the budget is shared with every other process using them, see `SharedTokenBuckets`.
+    - The number of requests in flight is adapted with AIMD: it is halved on each 429, and
+      increased by one per window of requests that finish within `latency_target_seconds`.
+      Slower requests shrink it slightly, as latency grows before the API starts rejecting requests.
+    - Queued requests are sent in priority order, then in the order they were made, so
+      interactive requests go ahead of batch jobs, see `llm_priority`. With `shared_token_buckets`
+      batch requests also give way to the interactive requests of other processes.
+    - Rate limited, server error and connection error responses are retried with full jitter
+      exponential backoff, waiting at least as long as the `Retry-After` header asks.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: float,
+            tokens_per_minute: float,
+            initial_concurrency: int,
+            max_concurrency: int,
+            latency_target_seconds: float,
+            max_retries: int,
+            retry_base_delay_seconds: float,
+            retry_max_delay_seconds: float,
+            shared_token_buckets: SharedTokenBuckets | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.latency_target_seconds = latency_target_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay_seconds = retry_base_delay_seconds
+        self.retry_max_delay_seconds = retry_max_delay_seconds
+
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.concurrency = float(min(initial_concurrency, max_concurrency))
+
+        self._condition = threading.Condition()
+        self._request_bucket = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self._shared_token_buckets = shared_token_buckets
+        self._in_flight = 0
+        self._queue: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+
+    def send(self, request: httpx.Request, send: Callable[[httpx.Request], httpx.Response]) -> httpx.Response:
+        """Sends the request with `send` once there is budget for it, retrying it if it fails."""
+        priority = _priority.get()
+        estimated_tokens = _estimate_tokens(request)
+
+        for attempt in itertools.count():
+            queued_time = time.perf_counter()
+            self._acquire(priority, estimated_tokens)
+            get_metrics().histogram(
+                'llm_queue_wait_seconds', 'The time LLM API requests waited for the rate limits.', ('priority',),
+            ).observe(time.perf_counter() - queued_time, priority=priority.name.lower())
+
+            start_time = time.perf_counter()
+            try:
+                response = send(request)
+            except httpx.TransportError:
+                self._release(latency_seconds=None, is_rate_limited=False)
+                if attempt >= self.max_retries:
+                    raise
+                self._retry(attempt, retry_after_seconds=None, reason='connection error')
+                continue
+
+            latency_seconds = time.perf_counter() - start_time
+            self._release(latency_seconds, is_rate_limited=response.status_code == 429)
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                self._correct_token_estimate(response, estimated_tokens)
+                return response
+            response.close()
+            self._retry(attempt, _retry_after_seconds(response), reason=f'status {response.status_code}')
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'concurrency': self.concurrency,
+                'in_flight': self._in_flight,
+                'queued': len(self._queue),
+            }
+
+    def _acquire(self, priority: Priority, estimated_tokens: int):
+        """Waits until this request is first in the queue and there is a free slot and budget for it."""
+        ticket = (int(priority), next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                with self._condition:
+                    while self._queue[0] != ticket or self._in_flight >= int(self.concurrency):
+                        self._condition.wait()
+                    if not self._shared_token_buckets:
+                        wait_seconds = self._take_local_budget(estimated_tokens)
+                        if wait_seconds == 0:
+                            self._start()
+                            return
+                        self._condition.wait(wait_seconds)
+                        continue
+
+                # Taken without holding the lock, as it may wait for other processes, the
+                # requests queued behind this one wait for it as it is still first in the queue.
+                wait_seconds = self._shared_token_buckets.try_take({'requests': 1, 'tokens': estimated_tokens}, priority=int(priority))
+                with self._condition:
+                    if wait_seconds == 0:
+                        self._start()
+                        return
+                    self._condition.wait(wait_seconds)
+        except BaseException:
+            with self._condition:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+            raise
+
+    def _start(self):
+        """Sends the first request in the queue, must be called while holding the lock."""
+        heapq.heappop(self._queue)
+        self._in_flight += 1
+        self.requests += 1
+        # The next request in the queue may be able to go too.
+        self._condition.notify_all()
+
+    def _take_local_budget(self, estimated_tokens: int) -> float:
+        """Takes the budget for a request, returning 0 if it was taken, otherwise how long until it is available."""
+        wait_seconds = max(self._request_bucket.wait_seconds(1), self._token_bucket.wait_seconds(estimated_tokens))
+        if wait_seconds == 0:
+            self._request_bucket.take(1)
+            self._token_bucket.take(estimated_tokens)
+        return wait_seconds
+
+    def _release(self, latency_seconds: float | None, is_rate_limited: bool):
+        with self._condition:
+            self._in_flight -= 1
+            if is_rate_limited:
+                self.rate_limited += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+            elif latency_seconds is not None and latency_seconds <= self.latency_target_seconds:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            elif latency_seconds is not None:
+                self.concurrency = max(1.0, self.concurrency * 0.9)
+            self._condition.notify_all()
+
+    def _retry(self, attempt: int, retry_after_seconds: float | None, reason: str):
+        """Waits before retrying a request, with full jitter so retries from many threads spread out."""
+        delay_seconds = random.uniform(0, min(self.retry_max_delay_seconds, self.retry_base_delay_seconds * 2 ** attempt))
+        delay_seconds = max(delay_seconds, retry_after_seconds or 0.0)
+        with self._condition:
+            self.retries += 1
+        logging.warning(f'Retrying LLM API request after {reason} in {delay_seconds:.2f}s (attempt {attempt + 1}/{self.max_retries})')
+        time.sleep(delay_seconds)
+
+    def _correct_token_estimate(self, response: httpx.Response, estimated_tokens: int):
+        if response.status_code != 200:
+            return
+        try:
+            usage = json.loads(response.read()).get('usage') or {}
+        except ValueError:
+            return
+        if 'total_tokens' not in usage:
+            return
+        if self._shared_token_buckets:
+            self._shared_token_buckets.take('tokens', usage['total_tokens'] - estimated_tokens)
+            return
+        with self._condition:
+            self._token_bucket.take(usage['total_tokens'] - estimated_tokens)
+
+
+class SchedulingTransport(httpx.BaseTransport):
+    """Wraps the transport used for requests to the LLM API to send every request through the scheduler."""
+
+    def __init__(self, scheduler: LLMScheduler, transport: httpx.BaseTransport):
+        self.scheduler = scheduler
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.scheduler.send(request, self.transport.handle_request)
+
+    def close(self):
+        self.transport.close()
+
+
+def _estimate_tokens(request: httpx.Request) -> int:
+    """Estimates the tokens used by a request as about 4 bytes of prompt per token, plus any completion tokens."""
+    content = request.read()
+    try:
+        max_tokens = json.loads(content or b'{}').get('max_tokens') or 0
+    except ValueError:
+        max_tokens = 0
+    return len(content) // 4 + max_tokens
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    try:
+        return float(response.headers['retry-after'])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,142 @@
+import bisect
+import threading
+from functools import cache
+from typing import Callable
+
+# Latency buckets in seconds, from a cache hit up to a full pipeline run.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Counter:
+    """A monotonically increasing count for each combination of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _label_values(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(_label_values(self.label_names, labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(self.label_names, key)} {value}' for key, value in sorted(values.items())]
+        return lines
+
+
+class Histogram:
+    """A distribution of observed values, e.g. latencies, for each combination of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label values: the count in each bucket (plus +Inf), the sum and the count.
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = _label_values(self.label_names, labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            bucket_counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            bucket_counts[bucket_index] += 1
+            self._values[key] = (bucket_counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            values = self._values.get(_label_values(self.label_names, labels))
+        return values[2] if values else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(bucket_counts), total, count) for key, (bucket_counts, total, count) in self._values.items()}
+
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (bucket_counts, total, count) in sorted(values.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip([*map(str, self.buckets), '+Inf'], bucket_counts):
+                cumulative_count += bucket_count
+                labels = _format_labels((*self.label_names, 'le'), (*key, upper_bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative_count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    A registry of the metrics of this process which renders them in the Prometheus text format.
+
+    Notes
+    -----
+    - Metrics are created on first use, so any module can record a metric without setup.
+    - Gauge collectors are called when the metrics are rendered, so services which already
+      keep their own statistics (e.g. the caches) do not need to record them twice.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._gauge_collectors: dict[str, tuple[str, Callable[[], dict[str, float]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help_text, label_names))
+
+    def register_gauges(self, prefix: str, help_text: str, collect: Callable[[], dict[str, float]]):
+        """Registers a function returning statistics which are rendered as a `<prefix>_<name>` gauge each."""
+        with self._lock:
+            self._gauge_collectors[prefix] = (help_text, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauge_collectors = dict(self._gauge_collectors)
+
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for prefix, (help_text, collect) in gauge_collectors.items():
+            for name, value in collect().items():
+                if value is None:
+                    continue
+                lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {float(value)}']
+
+        return '\n'.join(lines) + '\n'
+
+    def _get_or_create(self, name: str, create: Callable):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = create()
+            return self._metrics[name]
+
+
+def _label_values(label_names: tuple[str, ...], labels: dict[str, str]) -> tuple[str, ...]:
+    return tuple(str(labels.get(label_name, '')) for label_name in label_names)
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...]) -> str:
+    if not label_names:
+        return ''
+    escaped_values = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in label_values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(label_names, escaped_values)) + '}'
+
+
+@cache
+def get_metrics() -> MetricsRegistry:
+    """Returns the metrics registry shared by everything in this process."""
+    return MetricsRegistry()
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from llama_index.schema import BaseNode
+from llama_index.vector_stores.types import VectorStore, VectorStoreQuery, VectorStoreQueryResult
+from llama_index.vector_stores.utils import node_to_metadata_dict, metadata_dict_to_node
+
+EMBEDDINGS_FILE_NAME = 'embeddings.npy'
+NODES_FILE_NAME = 'nodes.json'
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    A vector store which keeps the embeddings of an index as a single float32 matrix,
+    persisted as a `.npy` file which is memory-mapped when loaded.
+
+    Notes
+    -----
+    - Loading an index does not parse any embeddings, and worker processes which load the
+      same index share its pages in the OS page cache rather than each holding a copy.
+    - Embeddings are normalized when added, so the cosine similarity with a query is a single
+      matrix-vector product and the top k are selected with `argpartition`.
+    - The text and metadata of each node are stored in a JSON sidecar alongside the matrix,
+      so the index needs no separate docstore.
+    - Rows are kept in the order the nodes were added, i.e. the order they appear in the document.
+    """
+
+    stores_text: bool = True
+
+    def __init__(self, embeddings: np.ndarray | None = None, nodes: list[dict] | None = None):
+        self._embeddings = embeddings if embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+        self._nodes: list[dict] = nodes or []
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str | Path) -> 'NumpyVectorStore':
+        persist_dir = Path(persist_dir)
+        with open(persist_dir / NODES_FILE_NAME) as file:
+            nodes = json.load(file)
+        return cls(embeddings=np.load(persist_dir / EMBEDDINGS_FILE_NAME, mmap_mode='r'), nodes=nodes)
+
+    @staticmethod
+    def exists(persist_dir: str | Path) -> bool:
+        # The embeddings are written last, so an index interrupted while persisting does not exist.
+        return (Path(persist_dir) / EMBEDDINGS_FILE_NAME).exists()
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings
+
+    @property
+    def node_ids(self) -> list[str]:
+        return [node['id'] for node in self._nodes]
+
+    def size_bytes(self) -> int:
+        """Returns the size of the embeddings and node text, some of which may be shared in the page cache."""
+        return self.embeddings.nbytes + sum(len(node['metadata'].get('_node_content', '')) for node in self._nodes)
+
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        embeddings = _normalize(np.array([node.get_embedding() for node in nodes], dtype=np.float32))
+        self._embeddings = np.vstack([self._embeddings, embeddings]) if len(self._nodes) else embeddings
+        self._nodes = self._nodes + [
+            {
+                'id': node.node_id,
+                'ref_doc_id': node.ref_doc_id,
+                'metadata': node_to_metadata_dict(node, remove_text=False, flat_metadata=False),
+            }
+            for node in nodes
+        ]
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        keep = [i for i, node in enumerate(self._nodes) if node['ref_doc_id'] != ref_doc_id]
+        self._embeddings = np.array(self.embeddings[keep], dtype=np.float32)
+        self._nodes = [self._nodes[i] for i in keep]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError('Metadata filters are not supported by the NumPy vector store')
+
+        embeddings = self.embeddings
+        rows = np.arange(len(self._nodes))
+        # The index only keeps the node IDs of vector stores which don't store text, so it asks for none of them.
+        restrict_rows = bool(query.node_ids)
+        if restrict_rows:
+            node_ids = set(query.node_ids)
+            rows = np.array([i for i, node in enumerate(self._nodes) if node['id'] in node_ids], dtype=np.int64)
+        if not len(rows) or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_embedding = _normalize(np.array(query.query_embedding, dtype=np.float32))
+        similarities = (embeddings[rows] if restrict_rows else embeddings) @ query_embedding
+
+        top_k = min(query.similarity_top_k, len(rows))
+        top_positions = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top_positions = top_positions[np.argsort(-similarities[top_positions], kind='stable')]
+
+        top_nodes = [self._nodes[rows[position]] for position in top_positions]
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(node['metadata']) for node in top_nodes],
+            similarities=similarities[top_positions].tolist(),
+            ids=[node['id'] for node in top_nodes],
+        )
+
+    def persist(self, persist_path: str | Path, fs: Any = None) -> None:
+        """Persists the store to the `persist_path` directory, writing each file atomically."""
+        persist_dir = Path(persist_path)
+        persist_dir.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile('w', dir=persist_dir, delete=False, suffix='.tmp') as file:
+            json.dump(self._nodes, file)
+        os.replace(file.name, persist_dir / NODES_FILE_NAME)
+
+        with tempfile.NamedTemporaryFile('wb', dir=persist_dir, delete=False, suffix='.tmp') as file:
+            np.save(file, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        os.replace(file.name, persist_dir / EMBEDDINGS_FILE_NAME)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
@@ -0,0 +1,27 @@
+from functools import cache
+
+from env import env
+from services.llm_cache import LLMCache
+from services.metrics import get_metrics
+
+
+@cache
+def get_pdf_text_cache() -> LLMCache:
+    """
+    Returns the cache of text extracted from PDFs, keyed by the SHA-256 digest of the file.
+
+    Notes
+    -----
+    - This uses the same on-disk format and eviction as the LLM cache, in its own directory.
+    - Entries never go stale as a file with the same digest always has the same text,
+      so they are only ever evicted to keep the cache under its max size.
+    """
+    pdf_text_cache = LLMCache(
+        cache_dir=env.pdf_text_cache_dir,
+        max_size_bytes=env.pdf_text_cache_max_size_bytes,
+        max_age_seconds=float('inf'),
+        enabled=env.pdf_text_cache_enabled,
+    )
+    get_metrics().register_gauges('pdf_text_cache', 'PDF text cache statistics.', pdf_text_cache.stats)
+
+    return pdf_text_cache
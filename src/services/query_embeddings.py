@@ -0,0 +1,45 @@
+from functools import cache
+
+from llama_index.embeddings.base import Embedding
+
+from data_models.cpt_guideline import QueryEmbeddings
+from services.llm_provider import get_llm_provider
+from utils.hash_utils import sha256_text
+
+
+def embed_queries(queries: list[str]) -> QueryEmbeddings:
+    """
+    Embeds each retrieval query with the query embedding model of the LLM provider,
+    so the embeddings can be stored and looked up with `precomputed_query_embedding`.
+    """
+    llm_provider = get_llm_provider()
+    return QueryEmbeddings(
+        model=llm_provider.query_embedding_model,
+        embeddings={
+            sha256_text(query): llm_provider.embed_model.get_query_embedding(query)
+            for query in dict.fromkeys(queries)
+        },
+    )
+
+
+def precomputed_query_embedding(query_embeddings: QueryEmbeddings | None, query: str) -> Embedding | None:
+    """
+    Returns the precomputed embedding of the query, or None if it was not precomputed
+    or was embedded by a different model than the one currently used for retrieval.
+    """
+    if not query_embeddings or query_embeddings.model != get_llm_provider().query_embedding_model:
+        return None
+    return query_embeddings.embeddings.get(sha256_text(query))
+
+
+@cache
+def get_prompt_embedding(prompt: str) -> Embedding:
+    """
+    Returns the query embedding of a fixed prompt, which is embedded once per process.
+
+    Notes
+    -----
+    - This is only for the prompts which do not depend on the medical record or the guidelines,
+      e.g. the CPT code extraction prompt, as every prompt passed in is kept for the life of the process.
+    """
+    return get_llm_provider().embed_model.get_query_embedding(prompt)
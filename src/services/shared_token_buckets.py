@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
+class SharedTokenBuckets:
+    """
+    Token buckets stored in a local SQLite database, so every process on the machine (the web app
+    workers, the batch worker processes and the scripts) draws from the same rate limit budget
+    rather than each process sending up to the full rate limit.
+
+    Notes
+    -----
+    - Each bucket refills continuously at its per-minute rate up to one minute of budget.
+    - The buckets are refilled and taken from in a single write transaction, so takes made at
+      the same time by different processes never spend more than the budget.
+    - A take which has to wait records how long it waits for with its priority, and takes with a lower
+      priority (a higher value) in any process wait until then, so batch processes give way to the
+      interactive requests of the web app. Lower priority takes also leave `reserved_fraction` of each
+      budget for higher priority takes, so an interactive request rarely has to wait for a refill.
+    - Each thread reuses its own connection, as a take is made for every LLM API request.
+    - In production this could be replaced with Redis, as the processes may run on many machines.
+    """
+
+    def __init__(self, db_path: Path, rates_per_minute: dict[str, float], reserved_fraction: float):
+        self.db_path = db_path
+        self.rates_per_minute = rates_per_minute
+        self.reserved_fraction = reserved_fraction
+
+        self._local = threading.local()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._open()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    name TEXT PRIMARY KEY,
+                    available REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS waiting (
+                    priority INTEGER PRIMARY KEY,
+                    waiting_until REAL NOT NULL
+                )
+                """
+            )
+
+    def try_take(self, amounts: dict[str, float], priority: int) -> float:
+        """
+        Takes the amounts from the buckets if they are all available to this priority.
+
+        Parameters
+        ----------
+        amounts: dict[str, float]
+            The amount to take from each bucket, keyed by bucket name. An amount larger than
+            the whole budget only waits for the budget to be full.
+        priority: int
+            The priority of the take, lower values go first.
+
+        Returns
+        -------
+        float:
+            0 if the amounts were taken, otherwise the seconds to wait before trying again.
+        """
+        with self._transaction() as connection:
+            now = time.time()
+            available = self._refill(connection, now)
+
+            wait_seconds = 0.0
+            for name, amount in amounts.items():
+                capacity = self.rates_per_minute[name]
+                required = min(amount, capacity)
+                if priority > 0:
+                    required = min(required + self.reserved_fraction * capacity, capacity)
+                wait_seconds = max(wait_seconds, (required - available[name]) * 60 / capacity)
+
+            waiting_until = connection.execute(
+                'SELECT MAX(waiting_until) FROM waiting WHERE priority < ? AND waiting_until > ?',
+                (priority, now),
+            ).fetchone()[0]
+            if waiting_until:
+                wait_seconds = max(wait_seconds, waiting_until - now)
+
+            if wait_seconds > 0:
+                connection.execute(
+                    """
+                    INSERT INTO waiting (priority, waiting_until) VALUES (?, ?)
+                    ON CONFLICT (priority) DO UPDATE SET waiting_until = MAX(waiting_until, excluded.waiting_until)
+                    """,
+                    (priority, now + wait_seconds),
+                )
+                return wait_seconds
+
+            for name, amount in amounts.items():
+                available[name] -= min(amount, self.rates_per_minute[name])
+            self._save(connection, available, now)
+            return 0.0
+
+    def take(self, name: str, amount: float):
+        """Takes from a bucket straight away, which may go negative, e.g. when correcting an estimate."""
+        with self._transaction() as connection:
+            now = time.time()
+            available = self._refill(connection, now)
+            available[name] -= amount
+            self._save(connection, available, now)
+
+    def available(self) -> dict[str, float]:
+        """Returns the budget currently available in each bucket."""
+        with self._transaction() as connection:
+            return self._refill(connection, time.time())
+
+    def _refill(self, connection: sqlite3.Connection, now: float) -> dict[str, float]:
+        rows = {
+            row['name']: row
+            for row in connection.execute('SELECT name, available, updated_at FROM token_buckets').fetchall()
+        }
+        available = {}
+        for name, rate_per_minute in self.rates_per_minute.items():
+            row = rows.get(name)
+            refilled = row['available'] + max(0.0, now - row['updated_at']) * rate_per_minute / 60 if row else rate_per_minute
+            available[name] = min(rate_per_minute, refilled)
+        return available
+
+    @staticmethod
+    def _save(connection: sqlite3.Connection, available: dict[str, float], now: float):
+        connection.executemany(
+            """
+            INSERT INTO token_buckets (name, available, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET available = excluded.available, updated_at = excluded.updated_at
+            """,
+            [(name, amount, now) for name, amount in available.items()],
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        # Take the write lock before reading so two processes never spend the same budget.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of this thread, opening a new one in a forked child as connections can't be shared."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._open()
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are opened explicitly where needed.
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import Future
+from functools import cache
+from typing import Callable, TypeVar
+
+from services.metrics import get_metrics
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single call, whose result (or exception)
+    is returned to every caller, e.g. so a medical record uploaded twice at once is only processed once.
+
+    Notes
+    -----
+    - Only calls which overlap are coalesced, a call made once the first has finished runs again,
+      so completed results must be kept elsewhere, e.g. the index cache or the DB.
+    - Calls are only coalesced within this process.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
+
+    def do(self, key: str, function: Callable[[], T]) -> tuple[T, bool]:
+        """
+        Calls the function, unless a call for the same key is already in flight,
+        in which case it waits for that call and returns its result instead.
+
+        Parameters
+        ----------
+        key: str
+            Calls with the same key must return the same result.
+        function: Callable[[], T]
+            The function to call.
+
+        Returns
+        -------
+        tuple[T, bool]:
+            - The T is the result of the function, the exception it raised is raised to every caller.
+            - The bool is True if the result came from a call made by another caller.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            is_coalesced = future is not None
+            if is_coalesced:
+                self.coalesced += 1
+            else:
+                future = self._in_flight[key] = Future()
+
+        if is_coalesced:
+            return future.result(), True
+
+        try:
+            result = function()
+        except BaseException as exc:
+            self._finish(key)
+            future.set_exception(exc)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight),
+            }
+
+    def _finish(self, key: str):
+        with self._lock:
+            del self._in_flight[key]
+
+
+@cache
+def get_single_flight(name: str) -> SingleFlight:
+    """Returns the single flight for the calls called `name` (e.g. 'index'), shared by every thread in this process."""
+    single_flight = SingleFlight()
+    get_metrics().register_gauges(f'{name}_single_flight', f'Coalesced concurrent {name} call statistics.', single_flight.stats)
+
+    return single_flight
@@ -1,6 +1,11 @@
+import hashlib
+import os
+import tempfile
 from enum import Enum
+from pathlib import Path
 
 from fastapi import UploadFile
+from pydantic import BaseModel
 
 from env import env
 
@@ -15,12 +20,20 @@ class DatabaseException(Exception):
         self.msg = msg
 
 
+class StoredFile(BaseModel):
+    """A file in storage, addressed by the SHA-256 of its contents."""
+    file_path: Path
+    sha256: str
+
+
 class Storage:
     """
     A mock file storage service class that just stores files on disk.
 
     Notes
     -----
+    - Files are stored under the SHA-256 of their contents, so identical uploads are
+      stored once and uploads with the same name never overwrite each other.
     - In production this could be replaced with S3, Google Cloud Storage, etc.
     """
 
@@ -28,14 +41,51 @@ class Storage:
         self.storage_dir = env.file_storage_dir
 
         for bucket in Bucket:
-            bucket_dir = self.storage_dir / bucket.value
-            if not bucket_dir.exists():
-                bucket_dir.mkdir()
+            (self.storage_dir / bucket.value).mkdir(parents=True, exist_ok=True)
+
+    def upload(self, file: UploadFile, bucket: Bucket) -> StoredFile:
+        """
+        Streams an uploaded file into storage.
+
+        Notes
+        -----
+        - The file is copied in chunks of `env.storage_chunk_size_bytes` and hashed as it is
+          copied, so it is never fully loaded into memory.
+        - The file is written to a temporary file which is then renamed, so a partially
+          written file is never visible at its final path.
+
+        Parameters
+        ----------
+        file: UploadFile
+            The uploaded file.
+        bucket: Bucket
+            The bucket to store the file in.
+
+        Returns
+        -------
+        StoredFile
+            The path of the stored file and the SHA-256 of its contents.
+        """
+        bucket_dir = self.storage_dir / bucket.value
+        digest = hashlib.sha256()
+
+        with tempfile.NamedTemporaryFile(dir=bucket_dir, prefix='.upload-', delete=False) as temp_file:
+            try:
+                while chunk := file.file.read(env.storage_chunk_size_bytes):
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            except BaseException:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+
+        sha256 = digest.hexdigest()
+        file_path = bucket_dir / f'{sha256}{Path(file.filename or "").suffix.lower()}'
 
-    def upload(self, file: UploadFile, bucket: Bucket):
-        file_path = self.storage_dir / bucket.value / file.filename
-        contents = file.file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        if file_path.exists():
+            # The same contents have already been uploaded.
+            os.unlink(temp_file.name)
+        else:
+            os.replace(temp_file.name, file_path)
 
-        return file_path
+        return StoredFile(file_path=file_path, sha256=sha256)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, TypeVar
+from uuid import uuid4
+
+from env import env
+from services.metrics import get_metrics
+
+F = TypeVar('F', bound=Callable)
+
+_current_span: ContextVar[Span | None] = ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    A timed operation, e.g. a pipeline step or an LLM call, with attributes such as token counts.
+
+    Notes
+    -----
+    - Spans started while another span is current are its children and share its trace ID.
+    - The duration of every span is recorded in the `span_duration_seconds` histogram and
+      finished spans are logged at DEBUG level.
+    """
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid4().hex[:16]
+        self.parent: Span | None = None
+        self.trace_id: str | None = None
+        self.start_time: float | None = None
+        self.duration_seconds: float | None = None
+        self._token = None
+
+    def set_attribute(self, name: str, value: Any):
+        self.attributes[name] = value
+
+    def start(self) -> Span:
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent else uuid4().hex
+        self.start_time = time.perf_counter()
+        return self
+
+    def end(self, error: BaseException | None = None):
+        self.duration_seconds = time.perf_counter() - self.start_time
+        status = 'error' if error else 'ok'
+
+        get_metrics().histogram(
+            'span_duration_seconds',
+            'The duration of each pipeline step, LLM call and retrieval.',
+            ('span', 'status'),
+        ).observe(self.duration_seconds, span=self.name, status=status)
+
+        logging.debug(
+            f'Span {self.name} {status} in {self.duration_seconds:.3f}s '
+            f'(trace={self.trace_id} parent={self.parent.name if self.parent else None}) {self.attributes}'
+        )
+
+    def __enter__(self) -> Span:
+        self.start()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        self.end(exc_value)
+
+
+class _NoopSpan:
+    """Returned instead of a span when tracing is disabled, so instrumented code costs almost nothing."""
+
+    def set_attribute(self, name: str, value: Any):
+        pass
+
+    def start(self) -> _NoopSpan:
+        return self
+
+    def end(self, error: BaseException | None = None):
+        pass
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """
+    Returns a span to be used as a context manager around the operation being traced.
+
+    Parameters
+    ----------
+    name: str
+        The name of the operation, e.g. 'pre_authorization.index_medical_record'.
+    attributes: Any
+        Attributes of the operation, more can be added with `set_attribute`.
+
+    Returns
+    -------
+    Span | _NoopSpan
+        A no-op span if tracing is disabled.
+    """
+    if not env.tracing_enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def current_span() -> Span | _NoopSpan:
+    """Returns the innermost span which is open in this context, to add attributes to it."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator which runs the function in a span with the given name."""
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def with_current_span(function: F) -> F:
+    """
+    Wraps the function to run in the span which is current now, e.g. so the spans of functions
+    run on a thread pool are children of the span which submitted them.
+
+    Notes
+    -----
+    - The other context variables are carried over too, e.g. the priority of LLM calls.
+    - Each call runs in its own copy of the context, so the wrapped function can be called
+      from several threads at once.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,43 @@
+import hashlib
+from pathlib import Path
+
+
+def sha256_text(text: str) -> str:
+    """
+    Returns the hex SHA-256 digest of the given text.
+
+    Parameters
+    ----------
+    text: str
+        The text to hash.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def sha256_file(file_path: str | Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Returns the hex SHA-256 digest of the contents of the given file,
+    reading it in chunks so large files are never fully loaded into memory.
+
+    Parameters
+    ----------
+    file_path: str | Path
+        The file to hash.
+    chunk_size: int
+        The number of bytes read at a time.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
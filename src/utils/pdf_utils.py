@@ -0,0 +1,80 @@
+import json
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pypdf import PdfReader
+
+from env import env
+from services.pdf_text_cache import get_pdf_text_cache
+from services.tracing import span
+from utils.hash_utils import sha256_file
+
+
+def extract_pdf_pages(
+        pdf_file_path: str | Path,
+        max_workers: int | None = None,
+        pages_per_worker: int | None = None,
+) -> list[str]:
+    """
+    Extracts the text of every page of the given PDF.
+
+    Notes
+    -----
+    - The text is cached by the SHA-256 digest of the file, so a PDF is only ever parsed once.
+    - PDFs with more than `pages_per_worker` pages are split into contiguous page ranges
+      which are extracted in parallel on a process pool, as text extraction is CPU bound.
+
+    Parameters
+    ----------
+    pdf_file_path: str | Path
+        The file path of the PDF.
+    max_workers: int | None
+        The max number of worker processes, defaults to the `pdf_extraction_max_workers` setting.
+    pages_per_worker: int | None
+        The min number of pages for each worker process, defaults to the `pdf_extraction_pages_per_worker` setting.
+
+    Returns
+    -------
+    list[str]
+        The text of each page, in order.
+    """
+    max_workers = max_workers or env.pdf_extraction_max_workers
+    pages_per_worker = pages_per_worker or env.pdf_extraction_pages_per_worker
+
+    with span('pdf.extract_pages') as extract_span:
+        pdf_text_cache = get_pdf_text_cache()
+        cache_key = sha256_file(pdf_file_path)
+        cached_pages = pdf_text_cache.get(cache_key)
+        extract_span.set_attribute('pdf_text_cache_hit', cached_pages is not None)
+        if cached_pages is not None:
+            return json.loads(cached_pages)
+
+        page_count = len(PdfReader(str(pdf_file_path)).pages)
+        worker_count = min(max_workers, math.ceil(page_count / pages_per_worker))
+        extract_span.set_attribute('page_count', page_count)
+        extract_span.set_attribute('worker_count', worker_count)
+
+        if worker_count <= 1:
+            pages = _extract_page_range(str(pdf_file_path), 0, page_count)
+        else:
+            range_size = math.ceil(page_count / worker_count)
+            page_ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+            # Spawn rather than fork as the parent process may be running threads, e.g. in the web app.
+            with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context('spawn')) as executor:
+                page_range_texts = executor.map(
+                    _extract_page_range,
+                    *zip(*[(str(pdf_file_path), start, stop) for start, stop in page_ranges]),
+                )
+                pages = [page for page_range_text in page_range_texts for page in page_range_text]
+
+        pdf_text_cache.set(cache_key, json.dumps(pages))
+
+    return pages
+
+
+def _extract_page_range(pdf_file_path: str, start: int, stop: int) -> list[str]:
+    """Extracts the text of pages `start` to `stop` (exclusive), in a worker process if extracting in parallel."""
+    reader = PdfReader(pdf_file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
@@ -0,0 +1,173 @@
+from typing import Type
+
+from llama_index import VectorStoreIndex, ServiceContext, QueryBundle
+from llama_index.embeddings.base import Embedding
+from llama_index.llms import LLM
+from llama_index.program import OpenAIPydanticProgram
+from pydantic import BaseModel
+
+from services.llm_cache import get_llm_cache, llm_cache_key
+from services.llm_provider import get_llm_provider
+from services.numpy_vector_store import NumpyVectorStore
+from services.tracing import span, current_span
+
+
+def query_index(
+        index: VectorStoreIndex,
+        prompt: str,
+        output_cls: Type[BaseModel],
+        service_context: ServiceContext | None = None,
+        retrieval_query: str | None = None,
+        query_embedding: Embedding | None = None,
+) -> BaseModel:
+    """
+    Runs a RAG query with a structured output against the index, using the
+    LLM cache to skip the LLM call if the same model has already been sent
+    the same prompt with the same retrieved context.
+
+    Parameters
+    ----------
+    index: VectorStoreIndex
+        An index of the document being queried.
+    prompt: str
+        The query.
+    output_cls: Type[BaseModel]
+        The data model of the structured output.
+    service_context: ServiceContext | None
+        The service context to query with, defaults to the service context of the index.
+        This should be a service context from the LLM provider so its response synthesizer is reused.
+    retrieval_query: str | None
+        The query used to retrieve the nodes, defaults to the prompt.
+    query_embedding: Embedding | None
+        The precomputed embedding of the retrieval query, which is embedded if not given.
+
+    Returns
+    -------
+    BaseModel
+        The response as an instance of `output_cls`.
+    """
+    service_context = service_context or index.service_context
+    response_synthesizer = get_llm_provider().response_synthesizer(service_context, output_cls)
+
+    query_bundle = QueryBundle(
+        prompt,
+        custom_embedding_strs=[retrieval_query] if retrieval_query else None,
+        embedding=query_embedding,
+    )
+    with span('rag.retrieve') as retrieve_span:
+        nodes = index.as_retriever().retrieve(query_bundle)
+        retrieve_span.set_attribute('node_count', len(nodes))
+        retrieve_span.set_attribute('precomputed_query_embedding', query_embedding is not None)
+
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache_key(
+        model=service_context.llm.metadata.model_name,
+        prompt=prompt,
+        context=[node.node.get_content() for node in nodes],
+        output_class=output_cls,
+    )
+    cached_response = llm_cache.get_model(cache_key, output_cls)
+    current_span().set_attribute('llm_cache_hit', cached_response is not None)
+    if cached_response is not None:
+        return cached_response
+
+    response = response_synthesizer.synthesize(query_bundle, nodes).response
+    llm_cache.set_model(cache_key, response)
+
+    return response
+
+
+def retrieve_context(
+        index: VectorStoreIndex,
+        query: str,
+        similarity_top_k: int,
+        query_embedding: Embedding | None = None,
+) -> list[str]:
+    """
+    Retrieves the content of the nodes most relevant to the query so that
+    it can be reused for several LLM calls with `query_context`.
+
+    Parameters
+    ----------
+    index: VectorStoreIndex
+        An index of the document being queried.
+    query: str
+        The query used to retrieve the nodes.
+    similarity_top_k: int
+        The number of nodes to retrieve.
+    query_embedding: Embedding | None
+        The precomputed embedding of the query, which is embedded if not given.
+
+    Returns
+    -------
+    list[str]
+        The content of the retrieved nodes in the order they appear in the document.
+    """
+    with span('rag.retrieve') as retrieve_span:
+        nodes = index.as_retriever(similarity_top_k=similarity_top_k).retrieve(
+            QueryBundle(query, embedding=query_embedding)
+        )
+        retrieve_span.set_attribute('node_count', len(nodes))
+        retrieve_span.set_attribute('precomputed_query_embedding', query_embedding is not None)
+    # Nodes are stored in the order they appear in the document, in the docstore or the vector store.
+    node_ids = index.vector_store.node_ids if isinstance(index.vector_store, NumpyVectorStore) else index.docstore.docs
+    document_positions = {node_id: position for position, node_id in enumerate(node_ids)}
+    nodes = sorted(nodes, key=lambda node: document_positions.get(node.node_id, len(document_positions)))
+    return [node.node.get_content() for node in nodes]
+
+
+def query_context(
+        context: list[str],
+        prompt_template_str: str,
+        output_cls: Type[BaseModel],
+        llm: LLM,
+        **prompt_args: str,
+) -> BaseModel:
+    """
+    Answers a prompt with a structured output in a single LLM call using
+    context which has already been retrieved, using the LLM cache to skip
+    the LLM call if the same model has already been sent the same prompt
+    with the same context.
+
+    Parameters
+    ----------
+    context: list[str]
+        The content of the retrieved nodes.
+    prompt_template_str: str
+        The prompt template, the context is inserted in place of `{context}`.
+    output_cls: Type[BaseModel]
+        The data model of the structured output.
+    llm: LLM
+        The LLM to query.
+    prompt_args: str
+        Any other variables in the prompt template.
+
+    Returns
+    -------
+    BaseModel
+        The response as an instance of `output_cls`.
+    """
+    context_str = '\n\n'.join(context)
+
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache_key(
+        model=llm.metadata.model_name,
+        prompt=prompt_template_str.format(context='', **prompt_args),
+        context=context,
+        output_class=output_cls,
+    )
+    cached_response = llm_cache.get_model(cache_key, output_cls)
+    current_span().set_attribute('llm_cache_hit', cached_response is not None)
+    if cached_response is not None:
+        return cached_response
+
+    program = OpenAIPydanticProgram.from_defaults(
+        output_cls=output_cls,
+        prompt_template_str=prompt_template_str,
+        llm=llm,
+        verbose=False,
+    )
+    response = program(context=context_str, **prompt_args)
+    llm_cache.set_model(cache_key, response)
+
+    return response
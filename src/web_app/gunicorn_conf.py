@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for serving the web app with a worker process per CPU core, run from `src` with:
+
+    gunicorn --config web_app/gunicorn_conf.py web_app.main:app
+
+Notes
+-----
+- The app is loaded by the master process, which then preloads the pipelines, the compiled guidelines
+  and the most recent medical record indexes before forking the workers, see `web_app.warmup.preload`.
+- Each worker runs the app with Uvicorn and its own background job workers. Workers are replaced
+  after about `WEB_APP_MAX_REQUESTS` requests, and start again from the preloaded state.
+- Each worker reports its own health and load, see GET /health.
+"""
+import os
+
+from env import env
+from web_app.warmup import preload
+
+bind = env.web_app_bind
+workers = env.web_app_workers or os.cpu_count() or 1
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+max_requests = env.web_app_max_requests
+max_requests_jitter = env.web_app_max_requests_jitter
+timeout = env.web_app_worker_timeout_seconds
+graceful_timeout = env.web_app_graceful_timeout_seconds
+
+
+def on_starting(server):
+    preload(max_indexes=env.web_app_preload_indexes)
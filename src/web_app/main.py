@@ -1,10 +1,66 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 
 from web_app.routes import router
-from env import env  # noqa
+from web_app.routes.api.pre_authorization_jobs import create_pre_authorization_job_worker_pool
+from env import env
+from services.guideline_cache import get_guideline_cache
+from services.metrics import get_metrics
+from web_app.warmup import start_warmup, is_preloaded
+from web_app.worker_load import get_worker_load
+
+logging.basicConfig(level=logging.INFO)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_worker_load()
+    # Compile the guidelines for every CPT code up front so the first requests don't have to,
+    # unless they were compiled before Gunicorn forked this worker, see `gunicorn_conf.py`.
+    if not is_preloaded():
+        get_guideline_cache().warm()
+    # Background workers for the POST /pre-authorization/jobs endpoint, these
+    # also resume any jobs which were interrupted when the server last stopped.
+    job_worker_pool = create_pre_authorization_job_worker_pool()
+    job_worker_pool.start()
+    # The pipelines are imported on first use, this loads them while the server starts accepting requests.
+    if env.web_app_warmup_enabled and not is_preloaded():
+        start_warmup()
+    yield
+    # Jobs still running after the timeout are resumed by the next server once their lease expires.
+    job_worker_pool.stop(timeout=10)
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
+
+
+@app.middleware('http')
+async def record_request_metrics(request: Request, call_next):
+    # A single middleware, as Uvicorn doesn't count the requests towards the Gunicorn worker's
+    # `max_requests` through several of them, so the workers would never be replaced.
+    with get_worker_load().track_request():
+        if not env.tracing_enabled:
+            return await call_next(request)
+
+        start_time = time.perf_counter()
+        response = await call_next(request)
+        # Label by route template rather than path so job IDs etc. don't create a series each.
+        route = request.scope.get('route')
+        get_metrics().histogram(
+            'http_request_duration_seconds',
+            'The duration of each API request.',
+            ('method', 'route', 'status_code'),
+        ).observe(
+            time.perf_counter() - start_time,
+            method=request.method,
+            route=route.path if route else 'unmatched',
+            status_code=response.status_code,
+        )
+        return response
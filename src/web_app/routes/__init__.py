@@ -1,12 +1,18 @@
 from fastapi import APIRouter
 from starlette.responses import RedirectResponse
 
-from web_app.routes.api import pre_authorization_guidelines_ingest_route, pre_authorization_create_route
+from web_app.routes.api import pre_authorization_guidelines_ingest_route, pre_authorization_guidelines_bulk_ingest_route, pre_authorization_create_route, pre_authorization_stream_route, pre_authorization_jobs_route, pre_authorization_batch_create_route, metrics_route, health_route
 
 router = APIRouter()
 
 router.include_router(pre_authorization_guidelines_ingest_route)
+router.include_router(pre_authorization_guidelines_bulk_ingest_route)
 router.include_router(pre_authorization_create_route)
+router.include_router(pre_authorization_stream_route)
+router.include_router(pre_authorization_jobs_route)
+router.include_router(pre_authorization_batch_create_route)
+router.include_router(metrics_route)
+router.include_router(health_route)
 
 
 @router.get("/")
@@ -1,2 +1,8 @@
 from web_app.routes.api.pre_authorization_guidelines_create import router as pre_authorization_guidelines_ingest_route
+from web_app.routes.api.pre_authorization_guidelines_bulk_create import router as pre_authorization_guidelines_bulk_ingest_route
 from web_app.routes.api.pre_authorization_create import router as pre_authorization_create_route
+from web_app.routes.api.pre_authorization_stream import router as pre_authorization_stream_route
+from web_app.routes.api.pre_authorization_jobs import router as pre_authorization_jobs_route
+from web_app.routes.api.pre_authorization_batch_create import router as pre_authorization_batch_create_route
+from web_app.routes.api.metrics import router as metrics_route
+from web_app.routes.api.health import router as health_route
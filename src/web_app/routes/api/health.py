@@ -0,0 +1,31 @@
+import sys
+
+from fastapi import APIRouter
+
+from data_models.health import WorkerHealth
+from services.guideline_cache import get_guideline_cache
+from web_app.warmup import PIPELINE_MODULES, is_preloaded
+from web_app.worker_load import get_worker_load
+
+router = APIRouter()
+
+
+@router.get('/health')
+def health_read() -> WorkerHealth:
+    """
+    Returns the health and load of the worker process which handled the request.
+
+    Notes
+    -----
+    - When served by Gunicorn with several workers each request is handled by any one of them,
+      identified by its `pid`. Scrape GET /metrics for the same load as `web_app_worker_*` gauges.
+    - Never loads the pipelines, so the health check stays fast while a worker is warming up.
+    """
+    worker_load = get_worker_load()
+    return WorkerHealth(
+        pid=worker_load.pid,
+        preloaded=is_preloaded(),
+        pipelines_loaded=all(module in sys.modules for module in PIPELINE_MODULES),
+        guideline_cpt_codes=get_guideline_cache().stats()['cpt_codes'],
+        **worker_load.stats(),
+    )
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import get_metrics
+
+router = APIRouter()
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+def metrics_read() -> str:
+    """
+    Returns the metrics of this server process in the Prometheus text format.
+
+    Notes
+    -----
+    - Includes latency histograms for every request, pipeline step, LLM call and retrieval,
+      counts of LLM requests and tokens, and the statistics of the caches and LLM clients.
+    - Each worker process has its own metrics, so scrape each worker separately.
+    """
+    return get_metrics().render()
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+
+from data_models.job import PreAuthorizationJob
+from env import env
+from services.job_queue import get_job_queue
+from services.storage import Storage, Bucket
+from web_app.routes.api.pre_authorization_jobs import PRE_AUTHORIZATION_JOB_TYPE, to_pre_authorization_job
+
+router = APIRouter()
+
+
+@router.post('/pre-authorization/batch', status_code=202)
+def pre_authorization_batch_create(
+        medical_record_files: list[UploadFile] = File(default=[]),
+        directory: str | None = Form(default=None),
+) -> list[PreAuthorizationJob]:
+    """
+    Queues the pre-authorization pipeline to run in the background for many
+    medical records, one job per record, and returns the jobs straight away.
+
+    Notes
+    -----
+    - The jobs are run by the same workers as POST /pre-authorization/jobs, so a batch
+      never holds up the request or starts any processes in the web app. Poll
+      GET /pre-authorization/jobs/{job_id} for the status and result of each record.
+    - A failure for one record only fails the job for that record.
+    - For a backfill of a large number of records run the batch pipeline from the
+      command line instead, see `pipelines.pre_authorization.batch`.
+
+    Parameters
+    ----------
+    medical_record_files:
+        PDFs each containing a single medical record.
+    directory:
+        A directory of medical record PDFs which have already been uploaded to file storage,
+        relative to the file storage directory (e.g. 'medical_records').
+
+    Returns
+    -------
+    list[PreAuthorizationJob]:
+        The queued job for each medical record, the records in `directory` first.
+    """
+    if not medical_record_files and not directory:
+        raise HTTPException(400, detail="Either medical record files or a directory must be given")
+
+    if any(file.content_type != "application/pdf" for file in medical_record_files):
+        raise HTTPException(400, detail="Files must be PDFs")
+
+    payloads: list[dict] = []
+
+    if directory:
+        directory_path = (env.file_storage_dir / directory).resolve()
+        if not directory_path.is_relative_to(env.file_storage_dir.resolve()) or not directory_path.is_dir():
+            raise HTTPException(400, detail="Directory must be an existing directory in file storage")
+        payloads.extend(
+            {
+                'medical_record_file_path': str(file_path),
+                'medical_record_file_name': file_path.name,
+            }
+            for file_path in sorted(directory_path.glob('*.pdf'))
+        )
+
+    storage = Storage()
+    for medical_record_file in medical_record_files:
+        stored_file = storage.upload(
+            file=medical_record_file,
+            bucket=Bucket.MEDICAL_RECORDS,
+        )
+        payloads.append({
+            'medical_record_file_path': str(stored_file.file_path),
+            'medical_record_content_hash': stored_file.sha256,
+            'medical_record_file_name': medical_record_file.filename,
+        })
+
+    job_queue = get_job_queue()
+    job_ids = job_queue.enqueue_many(job_type=PRE_AUTHORIZATION_JOB_TYPE, payloads=payloads)
+
+    return [to_pre_authorization_job(job_queue.get(job_id)) for job_id in job_ids]
@@ -1,18 +1,26 @@
-from uuid import uuid4
+import functools
+from pathlib import Path
+from uuid import UUID, uuid4, uuid5
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Response
 
 from pipelines.exceptions import PipelineException
-from pipelines.pre_authorization.pipeline import pre_authorization_pipeline, PreAuthorizationDocument
-from services.db import Database, Collection
+from data_models.pre_authorization import PreAuthorizationDocument
+from services.db import Database, Collection, DatabaseException
+from services.single_flight import get_single_flight
 from services.storage import Storage, Bucket
 
 router = APIRouter()
 
+# Pre-authorizations submitted with an idempotency key are stored under a UUID derived from it.
+IDEMPOTENCY_KEY_NAMESPACE = UUID('5f0c6e43-2d1b-4f0e-9a57-3c8e1f4b7d21')
+
 
 @router.post('/pre-authorization')
 def pre_authorization_create(
+        response: Response,
         medical_record_file: UploadFile = File(...),
+        idempotency_key: str | None = Header(default=None),
 ) -> PreAuthorizationDocument:
     """
     Runs the pre-authorization pipeline for a single medical record,
@@ -23,12 +31,21 @@ def pre_authorization_create(
     - A 400 error will be returned if the guidelines for the requested
       CPT code(s) have not already been ingested by the 'cpt_guideline_ingestion'
       pipeline.
+    - Concurrent requests for the same medical record (and idempotency key) are coalesced,
+      e.g. a client retrying before the first request has responded: the pipeline runs once
+      and every request returns its result.
+    - If an `Idempotency-Key` header is sent, the result is stored under that key and a request
+      with the same key returns the stored result (with an `Idempotent-Replayed: true` header)
+      without running the pipeline again. A 422 error is returned if the key was used
+      for a different medical record.
 
     Parameters
     ----------
     medical_record_file:
         A PDF containing the medical record which requests one or more
         medical procedures identified by their CPT codes.
+    idempotency_key:
+        A unique key chosen by the client for this submission, sent again when retrying it.
 
     Returns
     -------
@@ -40,14 +57,20 @@ def pre_authorization_create(
         raise HTTPException(400, detail="File must be a PDF")
 
     storage = Storage()
-    file_path = storage.upload(
+    stored_file = storage.upload(
         file=medical_record_file,
         bucket=Bucket.MEDICAL_RECORDS,
     )
 
+    pre_authorization_id = str(uuid5(IDEMPOTENCY_KEY_NAMESPACE, idempotency_key)) if idempotency_key else str(uuid4())
+    if idempotency_key and (stored_document := _read_idempotent_result(pre_authorization_id, stored_file.sha256)):
+        response.headers['Idempotent-Replayed'] = 'true'
+        return stored_document
+
     try:
-        pre_authorization_document = pre_authorization_pipeline(
-            medical_record_file_path=file_path
+        pre_authorization_document, _ = get_single_flight('pre_authorization').do(
+            f'{stored_file.sha256}:{idempotency_key or ""}',
+            functools.partial(_run_pre_authorization, stored_file.file_path, stored_file.sha256, pre_authorization_id),
         )
     except PipelineException as exc:
         raise HTTPException(
@@ -55,11 +78,39 @@ def pre_authorization_create(
             status_code=exc.status_code,
         )
 
-    Database().create(
-        collection=Collection.PRE_AUTHORIZATIONS,
-        document=pre_authorization_document,
-        document_id=uuid4(),
-        overwrite=False,
+    return pre_authorization_document
+
+
+def _run_pre_authorization(medical_record_file_path: Path, medical_record_content_hash: str, pre_authorization_id: str) -> PreAuthorizationDocument:
+    """Runs the pipeline and stores the result in the DB, once for all the coalesced requests."""
+    from pipelines.pre_authorization.pipeline import pre_authorization_pipeline
+
+    pre_authorization_document = pre_authorization_pipeline(
+        medical_record_file_path=medical_record_file_path,
+        medical_record_content_hash=medical_record_content_hash,
     )
 
+    try:
+        Database().create(
+            collection=Collection.PRE_AUTHORIZATIONS,
+            document=pre_authorization_document,
+            document_id=pre_authorization_id,
+            overwrite=False,
+        )
+    except DatabaseException:
+        # Another worker process stored a result for the same idempotency key first, return that one.
+        return _read_idempotent_result(pre_authorization_id, medical_record_content_hash)
+
     return pre_authorization_document
+
+
+def _read_idempotent_result(pre_authorization_id: str, medical_record_content_hash: str) -> PreAuthorizationDocument | None:
+    stored_document = Database().read(
+        collection=Collection.PRE_AUTHORIZATIONS,
+        document_id=pre_authorization_id,
+        output_class=PreAuthorizationDocument,
+    )
+    if stored_document and stored_document.medical_record_content_hash not in (None, medical_record_content_hash):
+        raise HTTPException(422, detail="Idempotency key has already been used for a different medical record")
+
+    return stored_document
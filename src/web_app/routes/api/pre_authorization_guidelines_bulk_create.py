@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+
+from data_models.cpt_guideline import BulkGuidelineIngestionResults
+from env import env
+from services.storage import Storage, Bucket
+from web_app.routes.api.pre_authorization_guidelines_create import is_valid_cpt_code
+
+router = APIRouter()
+
+
+@router.post('/pre-authorization/guidelines/bulk')
+def pre_authorization_guidelines_bulk_create(
+        manifest: str = Form(...),
+        guidelines_files: list[UploadFile] = File(default=[]),
+        force: bool = Form(default=False),
+) -> BulkGuidelineIngestionResults:
+    """
+    Extracts, parses and stores the guidelines for many CPT codes concurrently.
+
+    Notes
+    -----
+    - Guidelines for a CPT code that have already been ingested from the same
+      file are skipped, unless `force` is true, and otherwise overwritten.
+    - A failure for one CPT code does not fail the request, the error is
+      returned in the result for that CPT code.
+
+    Parameters
+    ----------
+    manifest: str
+        A JSON object mapping each CPT code to its guidelines PDF, either the file name of one of
+        `guidelines_files` or a file which has already been uploaded to file storage, relative to the
+        file storage directory (e.g. 'cpt_guidelines/45378.pdf').
+    guidelines_files: list[UploadFile]
+        PDFs each containing the guidelines for a single CPT code.
+    force: bool
+        Whether to re-ingest guidelines even if their file has not changed.
+
+    Returns
+    -------
+    BulkGuidelineIngestionResults:
+        The result for each CPT code.
+    """
+    try:
+        manifest = json.loads(manifest)
+    except json.JSONDecodeError:
+        raise HTTPException(400, detail="Manifest must be a JSON object")
+    if not isinstance(manifest, dict) or not manifest:
+        raise HTTPException(400, detail="Manifest must be a JSON object mapping CPT codes to files")
+
+    invalid_cpt_codes = [cpt_code for cpt_code in manifest if not is_valid_cpt_code(cpt_code)]
+    if invalid_cpt_codes:
+        raise HTTPException(400, detail=f"Invalid CPT code(s): {', '.join(invalid_cpt_codes)}")
+
+    if any(file.content_type != "application/pdf" for file in guidelines_files):
+        raise HTTPException(400, detail="Invalid file type - must be PDF")
+
+    storage = Storage()
+    uploaded_file_paths = {
+        guidelines_file.filename: storage.upload(
+            file=guidelines_file,
+            bucket=Bucket.CPT_GUIDELINES,
+        ).file_path
+        for guidelines_file in guidelines_files
+    }
+
+    file_paths: dict[str, Path] = {}
+    for cpt_code, file_name in manifest.items():
+        if file_name in uploaded_file_paths:
+            file_paths[cpt_code] = uploaded_file_paths[file_name]
+            continue
+        file_path = (env.file_storage_dir / file_name).resolve()
+        if not file_path.is_relative_to(env.file_storage_dir.resolve()) or not file_path.is_file():
+            raise HTTPException(400, detail=f"Guidelines file for CPT code {cpt_code} must be uploaded or in file storage")
+        file_paths[cpt_code] = file_path
+
+    from pipelines.cpt_guideline_ingestion.bulk import bulk_cpt_guideline_ingestion_pipeline
+
+    return bulk_cpt_guideline_ingestion_pipeline(manifest=file_paths, force=force)
@@ -3,15 +3,16 @@ import re
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 
 from data_models.cpt_guideline import CPTGuidelineDocument
-from pipelines.cpt_guideline_ingestion.pipeline import cpt_guideline_ingestion_pipeline
 from pipelines.exceptions import PipelineException
 from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
 from services.storage import Storage, Bucket
 
 router = APIRouter()
 
 
-@router.post('/pre-authorization/guidelines')
+# The query embeddings are only used internally for retrieval.
+@router.post('/pre-authorization/guidelines', response_model_exclude={'query_embeddings'})
 def pre_authorization_guidelines_create(
         cpt_code: str = Form(...),
         guidelines_file: UploadFile = File(..., media_type='application/pdf'),
@@ -40,19 +41,22 @@ def pre_authorization_guidelines_create(
     if guidelines_file.content_type != "application/pdf":
         raise HTTPException(400, detail="Invalid file type - must be PDF")
 
-    if not _is_valid_cpt(cpt_code):
+    if not is_valid_cpt_code(cpt_code):
         raise HTTPException(400, detail="Invalid CPT code")
 
     storage = Storage()
-    file_path = storage.upload(
+    stored_file = storage.upload(
         file=guidelines_file,
         bucket=Bucket.CPT_GUIDELINES,
     )
 
+    from pipelines.cpt_guideline_ingestion.pipeline import cpt_guideline_ingestion_pipeline
+
     try:
         guideline_document = cpt_guideline_ingestion_pipeline(
-            cpt_guideline_file_path=file_path,
+            cpt_guideline_file_path=stored_file.file_path,
             cpt_code=cpt_code,
+            cpt_guideline_file_sha256=stored_file.sha256,
         )
     except PipelineException as exc:
         raise HTTPException(
@@ -66,11 +70,12 @@ def pre_authorization_guidelines_create(
         document_id=cpt_code,
         overwrite=True,
     )
+    get_guideline_cache().invalidate(cpt_code)
 
     return guideline_document
 
 
-def _is_valid_cpt(cpt_code: str) -> bool:
+def is_valid_cpt_code(cpt_code: str) -> bool:
     """
     Returns True if input is a valid CPT code.
 
@@ -0,0 +1,149 @@
+from pathlib import Path
+from uuid import UUID, uuid5
+
+from fastapi import APIRouter, UploadFile, File, HTTPException
+
+from data_models.job import Job, PreAuthorizationJob, JobStatus
+from env import env
+from pipelines.exceptions import PipelineException
+from services.db import Database, Collection
+from services.job_queue import get_job_queue, JobException, JobWorkerPool
+from services.storage import Storage, Bucket
+
+router = APIRouter()
+
+PRE_AUTHORIZATION_JOB_TYPE = 'pre_authorization'
+
+# A retried job stores its result under the same pre-authorization ID, rather than a duplicate.
+JOB_ID_NAMESPACE = UUID('b8d3a6f1-4c27-4e85-8f0d-6a91c2e7d534')
+
+
+@router.post('/pre-authorization/jobs', status_code=202)
+def pre_authorization_job_create(
+        medical_record_file: UploadFile = File(...),
+) -> PreAuthorizationJob:
+    """
+    Queues the pre-authorization pipeline to run in the background for a
+    single medical record and returns the job straight away.
+
+    Notes
+    -----
+    - Poll the GET /pre-authorization/jobs/{job_id} endpoint for the status
+      of the job and the result once it has finished.
+    - The result is also stored in the DB, as for POST /pre-authorization.
+
+    Parameters
+    ----------
+    medical_record_file:
+        A PDF containing the medical record which requests one or more
+        medical procedures identified by their CPT codes.
+
+    Returns
+    -------
+    PreAuthorizationJob:
+        The queued job.
+    """
+    if medical_record_file.content_type != "application/pdf":
+        raise HTTPException(400, detail="File must be a PDF")
+
+    storage = Storage()
+    stored_file = storage.upload(
+        file=medical_record_file,
+        bucket=Bucket.MEDICAL_RECORDS,
+    )
+
+    job_queue = get_job_queue()
+    job_id = job_queue.enqueue(
+        job_type=PRE_AUTHORIZATION_JOB_TYPE,
+        payload={
+            'medical_record_file_path': str(stored_file.file_path),
+            'medical_record_content_hash': stored_file.sha256,
+            'medical_record_file_name': medical_record_file.filename,
+        },
+    )
+
+    return to_pre_authorization_job(job_queue.get(job_id))
+
+
+@router.get('/pre-authorization/jobs/{job_id}')
+def pre_authorization_job_read(job_id: str) -> PreAuthorizationJob:
+    """
+    Returns the status of a pre-authorization job and its result once it has succeeded.
+
+    Parameters
+    ----------
+    job_id:
+        The ID returned by the POST /pre-authorization/jobs endpoint.
+
+    Returns
+    -------
+    PreAuthorizationJob:
+        The job, its `result` is populated once its status is SUCCEEDED and its
+        `error` is populated if its status is FAILED.
+    """
+    job = get_job_queue().get(job_id)
+    if not job or job.job_type != PRE_AUTHORIZATION_JOB_TYPE:
+        raise HTTPException(404, detail="Job not found")
+
+    return to_pre_authorization_job(job)
+
+
+def create_pre_authorization_job_worker_pool() -> JobWorkerPool:
+    """Returns the pool of background workers that run the queued pre-authorization jobs."""
+    return JobWorkerPool(
+        queue=get_job_queue(),
+        job_type=PRE_AUTHORIZATION_JOB_TYPE,
+        handler=_run_pre_authorization_job,
+        num_workers=env.job_workers,
+    )
+
+
+def _run_pre_authorization_job(job: Job) -> dict:
+    """
+    Runs the pre-authorization pipeline for a queued job and stores the result in the DB.
+    Nobody is waiting on the response, so LLM calls give way to interactive requests.
+    """
+    from pipelines.pre_authorization.pipeline import pre_authorization_pipeline
+    from services.llm_scheduler import llm_priority, Priority
+
+    try:
+        with llm_priority(Priority.BATCH):
+            pre_authorization_document = pre_authorization_pipeline(
+                medical_record_file_path=Path(job.payload['medical_record_file_path']),
+                medical_record_content_hash=job.payload.get('medical_record_content_hash'),
+            )
+    except PipelineException as exc:
+        raise JobException(
+            detail=exc.detail,
+            status_code=exc.status_code,
+        )
+
+    pre_authorization_id = str(uuid5(JOB_ID_NAMESPACE, job.job_id))
+    Database().create(
+        collection=Collection.PRE_AUTHORIZATIONS,
+        document=pre_authorization_document,
+        document_id=pre_authorization_id,
+        overwrite=True,
+    )
+
+    return {
+        'pre_authorization_id': pre_authorization_id,
+        'pre_authorization': pre_authorization_document.model_dump(mode='json'),
+    }
+
+
+def to_pre_authorization_job(job: Job) -> PreAuthorizationJob:
+    result = job.result if job.status == JobStatus.SUCCEEDED else {}
+    return PreAuthorizationJob(
+        job_id=job.job_id,
+        status=job.status,
+        medical_record_file_name=job.payload['medical_record_file_name'],
+        pre_authorization_id=result.get('pre_authorization_id'),
+        result=result.get('pre_authorization'),
+        error=job.error,
+        error_status_code=job.error_status_code,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
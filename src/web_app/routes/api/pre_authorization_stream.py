@@ -0,0 +1,76 @@
+from typing import Iterator
+from uuid import uuid4
+
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
+
+from data_models.pre_authorization import PreAuthorizationEvent, PreAuthorizationEventType
+from services.db import Database, Collection
+from services.storage import Storage, Bucket
+
+router = APIRouter()
+
+
+@router.post('/pre-authorization/stream', response_class=StreamingResponse)
+def pre_authorization_stream(
+        medical_record_file: UploadFile = File(...),
+) -> StreamingResponse:
+    """
+    Runs the pre-authorization pipeline for a single medical record, streaming the result
+    of each stage as a server-sent event as soon as it finishes, then stores the result in the DB.
+
+    Notes
+    -----
+    - Each event is named after its `PreAuthorizationEventType` and its data is a JSON
+      `PreAuthorizationEvent`, e.g. a `criterion_result` event is sent as each criterion is answered.
+    - The last event is `completed`, with the ID of the stored DB document, or `error`. As the
+      response has already started, errors (e.g. guidelines which have not been ingested) are
+      sent as an `error` event with their status code rather than as an HTTP error.
+
+    Parameters
+    ----------
+    medical_record_file:
+        A PDF containing the medical record which requests one or more
+        medical procedures identified by their CPT codes.
+
+    Returns
+    -------
+    StreamingResponse:
+        A `text/event-stream` of the events of the pipeline.
+    """
+    if medical_record_file.content_type != "application/pdf":
+        raise HTTPException(400, detail="File must be a PDF")
+
+    storage = Storage()
+    stored_file = storage.upload(
+        file=medical_record_file,
+        bucket=Bucket.MEDICAL_RECORDS,
+    )
+
+    def stream() -> Iterator[str]:
+        from pipelines.pre_authorization.pipeline import pre_authorization_pipeline_events
+
+        for event in pre_authorization_pipeline_events(
+                medical_record_file_path=stored_file.file_path,
+                medical_record_content_hash=stored_file.sha256,
+        ):
+            if event.event == PreAuthorizationEventType.COMPLETED:
+                event.pre_authorization_id = str(uuid4())
+                Database().create(
+                    collection=Collection.PRE_AUTHORIZATIONS,
+                    document=event.pre_authorization,
+                    document_id=event.pre_authorization_id,
+                    overwrite=False,
+                )
+            yield _server_sent_event(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        # Stop proxies from buffering the events until the response has finished.
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def _server_sent_event(event: PreAuthorizationEvent) -> str:
+    return f'event: {event.event.value}\ndata: {event.model_dump_json(exclude_none=True)}\n\n'
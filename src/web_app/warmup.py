@@ -0,0 +1,91 @@
+import gc
+import importlib
+import logging
+import threading
+import time
+
+from services.db import Database
+from services.guideline_cache import get_guideline_cache
+
+# The routes import the pipelines on first use, as they load LlamaIndex, OpenAI and pypdf,
+# which make up most of the time it takes the server to start.
+PIPELINE_MODULES = (
+    'pipelines.pre_authorization.pipeline',
+    'pipelines.cpt_guideline_ingestion.pipeline',
+    'pipelines.cpt_guideline_ingestion.bulk',
+)
+
+_is_preloaded = False
+
+
+def start_warmup() -> threading.Thread:
+    """
+    Preloads the pipelines in a background thread, so the server accepts connections straight away
+    and the first request doesn't have to wait for the imports unless it arrives before they finish.
+
+    Returns
+    -------
+    threading.Thread:
+        The daemon thread doing the warmup.
+    """
+    thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up():
+    """Imports the pipelines and constructs the LLM clients, which is otherwise done by the first request."""
+    start_time = time.perf_counter()
+    try:
+        for module in PIPELINE_MODULES:
+            importlib.import_module(module)
+        from services.llm_provider import get_llm_provider
+        get_llm_provider()
+    except Exception:
+        # The request which needs the module will raise the same error.
+        logging.exception('Failed to warm up the pipelines')
+        return
+    logging.info(f'Warmed up the pipelines in {time.perf_counter() - start_time:.2f}s ✅')
+
+
+def preload(max_indexes: int):
+    """
+    Loads the state which every request reads but doesn't modify, in the Gunicorn master process
+    before it forks the workers, so each worker starts with it rather than loading its own copy.
+
+    Notes
+    -----
+    - Loads the pipelines (and with them their prompt templates), compiles the guidelines for
+      every CPT code and loads the most recently built medical record indexes.
+    - The workers share the memory of the preloaded state until they write to it. Python writes
+      reference counts into every object it touches, so the objects are also moved out of
+      the garbage collector's generations, otherwise each collection would copy them all.
+    - Must be called before any threads are started, as only the forking thread survives a fork,
+      and closes the DB connections it opens as they can't be shared with the workers.
+
+    Parameters
+    ----------
+    max_indexes: int
+        The maximum number of medical record indexes to load, see `preload_medical_record_indexes`.
+    """
+    global _is_preloaded
+
+    start_time = time.perf_counter()
+    for module in PIPELINE_MODULES:
+        importlib.import_module(module)
+    get_guideline_cache().warm()
+
+    from pipelines.pre_authorization.pipeline_steps.index_medical_record import preload_medical_record_indexes
+    index_count = preload_medical_record_indexes(max_indexes)
+
+    Database().close_connections()
+    gc.collect()
+    gc.freeze()
+    _is_preloaded = True
+
+    logging.info(f'Preloaded the pipelines and {index_count} medical record indexes in {time.perf_counter() - start_time:.2f}s ✅')
+
+
+def is_preloaded() -> bool:
+    """Returns True if the state was loaded by `preload` before this worker was forked."""
+    return _is_preloaded
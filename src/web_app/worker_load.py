@@ -0,0 +1,59 @@
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Iterator
+
+from services.metrics import get_metrics
+
+
+class WorkerLoad:
+    """
+    The load on this web app process, each Gunicorn worker has its own.
+
+    Notes
+    -----
+    - Streaming responses count as handled once their headers have been sent.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.requests_in_flight = 0
+        self.requests_handled = 0
+
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track_request(self) -> Iterator[None]:
+        with self._lock:
+            self.requests_in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.requests_in_flight -= 1
+                self.requests_handled += 1
+
+    def stats(self) -> dict:
+        # ru_maxrss is in kilobytes on Linux.
+        max_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        with self._lock:
+            return {
+                'uptime_seconds': time.monotonic() - self._started_at,
+                'requests_in_flight': self.requests_in_flight,
+                'requests_handled': self.requests_handled,
+                'cpu_seconds': time.process_time(),
+                'max_rss_bytes': max_rss_bytes,
+            }
+
+
+@cache
+def get_worker_load() -> WorkerLoad:
+    """Returns the load on this worker process, call it once the worker has started so its uptime starts then."""
+    worker_load = WorkerLoad()
+    get_metrics().register_gauges('web_app_worker', 'The load on this web app worker process.', worker_load.stats)
+
+    return worker_load
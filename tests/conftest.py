@@ -0,0 +1,4 @@
+import os
+
+# The settings in `env.py` require an OpenAI API key, none of the tests call OpenAI.
+os.environ.setdefault('OPENAI_API_KEY', 'test')
@@ -0,0 +1,49 @@
+from benchmarks.pipeline_benchmark import run_benchmark, compare_benchmark_results, save_benchmark_results, CPT_GUIDELINE_INGESTION, PRE_AUTHORIZATION
+from data_models.benchmark import BenchmarkResults
+
+
+def test_benchmark_runs_both_pipelines_against_the_fake_backend(tmp_path):
+    """
+    Test that the benchmark runs both pipelines end to end without an OpenAI API key
+    and records the stages and LLM calls of every run.
+    """
+    results = run_benchmark(repeats=1, llm_latency_seconds=0.0, embedding_latency_seconds=0.0)
+
+    assert [run.error for run in results.runs] == [None] * 4
+    assert results.summaries[CPT_GUIDELINE_INGESTION].mean_llm_calls['chat_calls'] == 2
+    assert 'index_medical_record' in results.summaries[PRE_AUTHORIZATION].mean_stage_seconds
+    assert results.summaries[PRE_AUTHORIZATION].mean_llm_calls['structured_output_calls'] > 2
+    assert all(run.peak_memory_bytes > 0 for run in results.runs)
+
+    file_path = save_benchmark_results(results, results_dir=tmp_path)
+    assert BenchmarkResults.model_validate_json(file_path.read_text()) == results
+
+
+def test_compare_benchmark_results_flags_regressions():
+    """
+    Test that a stage which has slowed down by more than the threshold is flagged.
+    """
+    baseline = BenchmarkResults.model_validate({
+        'commit': 'baseline',
+        'created_at': '2024-01-01T00:00:00Z',
+        'settings': {},
+        'runs': [],
+        'summaries': {
+            PRE_AUTHORIZATION: {
+                'run_count': 1,
+                'error_count': 0,
+                'mean_duration_seconds': 10.0,
+                'mean_stage_seconds': {'index_medical_record': 4.0, 'are_cpt_guideline_criteria_met': 6.0},
+                'mean_llm_calls': {'chat_calls': 10},
+                'max_peak_memory_bytes': 100,
+            }
+        },
+    })
+    results = baseline.model_copy(deep=True)
+    results.summaries[PRE_AUTHORIZATION].mean_stage_seconds['are_cpt_guideline_criteria_met'] = 9.0
+
+    lines = compare_benchmark_results(baseline, results)
+
+    assert [line for line in lines if 'REGRESSION' in line] == [
+        f'{PRE_AUTHORIZATION} stage.are_cpt_guideline_criteria_met: 6.000 -> 9.000 (+50.0%) ❌ REGRESSION'
+    ]
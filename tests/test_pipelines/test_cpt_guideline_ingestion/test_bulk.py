@@ -0,0 +1,68 @@
+import importlib
+import json
+import shutil
+
+import pytest
+
+from data_models.cpt_guideline import CPTGuidelineDocument, GuidelineIngestionStatus
+from env import REPO_ROOT_DIR, env
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+
+bulk = importlib.import_module('pipelines.cpt_guideline_ingestion.bulk')
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'data/colonoscopy-guidelines.pdf'
+GUIDELINES_DOCUMENT_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+
+@pytest.fixture
+def ingested_cpt_codes(monkeypatch, tmp_path):
+    """Replaces the ingestion pipeline for a single CPT code and records each CPT code ingested."""
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', tmp_path / 'mock_nosql_db')
+    get_guideline_cache.cache_clear()
+    with open(GUIDELINES_DOCUMENT_PATH) as file:
+        guidelines_document = CPTGuidelineDocument(**json.load(file))
+
+    ingested_cpt_codes = []
+
+    def cpt_guideline_ingestion_pipeline(cpt_guideline_file_path, cpt_code, cpt_guideline_file_sha256):
+        ingested_cpt_codes.append(cpt_code)
+        if cpt_code == '99999':
+            raise RuntimeError('GPT is down')
+        return guidelines_document.model_copy(update={
+            'file_path': str(cpt_guideline_file_path),
+            'cpt_code': cpt_code,
+            'file_sha256': cpt_guideline_file_sha256,
+        })
+
+    monkeypatch.setattr(bulk, 'cpt_guideline_ingestion_pipeline', cpt_guideline_ingestion_pipeline)
+    return ingested_cpt_codes
+
+
+def test_bulk_ingestion_skips_unchanged_files(ingested_cpt_codes, tmp_path):
+    """
+    Test that every CPT code in the manifest is ingested and stored, that a failure for one
+    CPT code does not stop the others, and that unchanged files are skipped the next time.
+    """
+    shutil.copy(GUIDELINES_FILE_PATH, tmp_path / '45380.pdf')
+    manifest_file_path = tmp_path / 'manifest.json'
+    manifest_file_path.write_text(json.dumps({'45378': str(GUIDELINES_FILE_PATH), '45380': '45380.pdf', '99999': '45380.pdf'}))
+    manifest = bulk.read_manifest(manifest_file_path)
+
+    results = bulk.bulk_cpt_guideline_ingestion_pipeline(manifest)
+
+    assert [result.status for result in results.results] == [
+        GuidelineIngestionStatus.INGESTED, GuidelineIngestionStatus.INGESTED, GuidelineIngestionStatus.FAILED,
+    ]
+    assert results.results[2].error == 'RuntimeError: GPT is down'
+    stored_documents = Database().read_many(Collection.CPT_GUIDELINES, ['45378', '45380'], CPTGuidelineDocument)
+    assert [document.cpt_code for document in stored_documents.values()] == ['45378', '45380']
+
+    (tmp_path / '45380.pdf').write_bytes(b'%PDF-changed')
+    ingested_cpt_codes.clear()
+    results = bulk.bulk_cpt_guideline_ingestion_pipeline(manifest)
+
+    assert sorted(ingested_cpt_codes) == ['45380', '99999']
+    assert results.unchanged_count == 1
+    assert results.ingested_count == 1
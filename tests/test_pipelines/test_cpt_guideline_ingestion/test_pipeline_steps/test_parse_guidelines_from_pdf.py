@@ -0,0 +1,35 @@
+from pipelines.cpt_guideline_ingestion.pipeline_steps.parse_guidelines_from_pdf import (
+    merge_enumerated_bullet_points,
+    split_into_chunks,
+)
+
+
+def test_split_into_chunks_splits_at_bullet_points():
+    text = '• First criterion o Sub-criterion • Second criterion • Third criterion'
+
+    chunks = split_into_chunks(text, max_chars=40)
+
+    assert chunks == ['• First criterion o Sub-criterion ', '• Second criterion • Third criterion']
+    assert all(len(chunk) <= 40 for chunk in chunks)
+
+
+def test_merge_enumerated_bullet_points():
+    """
+    Test that the bullet points of each chunk are renumbered to follow on from the previous
+    chunk, and that a bullet point continued from the previous chunk (0.) is merged into it.
+    """
+    enumerated_chunks = [
+        '1. Xray, as indicated by one of:\n    1.1. Aged over 60\n2. CT scan, as indicated by all of:\n    2.1. Fell on',
+        '0. hard surface\n    0.1. High risk family history\n1. MRI',
+    ]
+
+    merged = merge_enumerated_bullet_points(enumerated_chunks)
+
+    assert merged == '\n'.join([
+        '1. Xray, as indicated by one of:',
+        '    1.1. Aged over 60',
+        '2. CT scan, as indicated by all of:',
+        '    2.1. Fell on hard surface',
+        '    2.2. High risk family history',
+        '3. MRI',
+    ])
@@ -0,0 +1,102 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from data_models.pre_authorization import (
+    BatchRecordResult,
+    ExitReason,
+    PreAuthorizationDocument,
+    PriorTreatmentInformation,
+)
+from env import env
+from pipelines.pre_authorization import batch
+from services.db import Database, Collection
+
+CRASHING_FILE_PATH = 'crashing-medical-record.pdf'
+
+
+class CrashingExecutor:
+    """Runs the records in this process, except the worker running `CRASHING_FILE_PATH` dies."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @staticmethod
+    def submit(function, medical_record_file_path):
+        future = Future()
+        if medical_record_file_path == CRASHING_FILE_PATH:
+            future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+        else:
+            future.set_result(function(medical_record_file_path))
+        return future
+
+
+def _run_record(medical_record_file_path):
+    return BatchRecordResult(
+        medical_record_file_path=medical_record_file_path,
+        pre_authorization_id=medical_record_file_path,
+        pre_authorization=PreAuthorizationDocument(
+            cpt_code='45378',
+            exit_reason=ExitReason.PRIOR_TREATMENT_SUCCESSFUL,
+            prior_treatment=PriorTreatmentInformation(
+                was_treatment_attempted=True,
+                evidence_of_whether_treatment_was_attempted='Canned evidence.',
+                was_treatment_successful=True,
+                evidence_of_whether_treatment_was_successful='Canned evidence.',
+            ),
+            guidelines='Canned guidelines.',
+            are_guideline_criteria_met=None,
+            guideline_criteria_results=[],
+            medical_record_file_path=medical_record_file_path,
+        ),
+        duration_seconds=0.0,
+    )
+
+
+def test_dead_worker_fails_its_records_and_keeps_the_completed_results(monkeypatch, tmp_path):
+    """Test that when a worker process dies its record is reported as failed and the records completed before it are still stored."""
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', CrashingExecutor)
+    monkeypatch.setattr(batch, '_run_record', _run_record)
+
+    results = batch.batch_pre_authorization_pipeline(
+        medical_record_file_paths=['medical-record-1.pdf', CRASHING_FILE_PATH, 'medical-record-2.pdf'],
+        max_workers=2,
+        write_batch_size=10,
+    )
+
+    assert [record_result.error for record_result in results.record_results] == [
+        None, 'BrokenProcessPool: A process in the process pool was terminated abruptly', None,
+    ]
+    assert (results.succeeded_count, results.failed_count) == (2, 1)
+    stored = Database().query(Collection.PRE_AUTHORIZATIONS, PreAuthorizationDocument)
+    assert sorted(stored.documents) == ['medical-record-1.pdf', 'medical-record-2.pdf']
+
+
+def test_interrupted_batch_stores_the_completed_results(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', CrashingExecutor)
+    monkeypatch.setattr(batch, '_run_record', _run_record)
+
+    def log_progress(record_result, completed_count, total_count, elapsed_seconds):
+        if completed_count == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, '_log_progress', log_progress)
+
+    with pytest.raises(KeyboardInterrupt):
+        batch.batch_pre_authorization_pipeline(
+            medical_record_file_paths=['medical-record-1.pdf', 'medical-record-2.pdf', 'medical-record-3.pdf'],
+            write_batch_size=10,
+        )
+
+    stored = Database().query(Collection.PRE_AUTHORIZATIONS, PreAuthorizationDocument)
+    # The futures finish in any order, the two results completed before the interruption are stored.
+    assert len(stored.documents) == 2
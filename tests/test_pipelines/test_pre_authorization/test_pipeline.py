@@ -0,0 +1,118 @@
+import importlib
+import json
+
+import pytest
+
+from data_models.cpt_guideline import CPTGuidelineDocument
+from data_models.pre_authorization import (
+    CPTGuidelineResults,
+    CriterionResult,
+    ExitReason,
+    PreAuthorizationEventType,
+    PriorTreatmentInformation,
+)
+from env import REPO_ROOT_DIR, env
+from pipelines.exceptions import PipelineException
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+
+# The pipeline module is shadowed by the function of the same name exported from `pre_authorization`.
+pipeline = importlib.import_module('pipelines.pre_authorization.pipeline')
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+
+@pytest.fixture
+def calls(monkeypatch, tmp_path):
+    """
+    Ingests the colonoscopy guidelines under two CPT codes and replaces the pipeline steps
+    for a medical record requesting both, recording the calls to each step.
+    """
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', tmp_path / 'mock_nosql_db')
+    get_guideline_cache.cache_clear()
+    with open(GUIDELINES_FILE_PATH) as file:
+        guidelines_document = CPTGuidelineDocument(**json.load(file))
+    Database().bulk_create(Collection.CPT_GUIDELINES, {
+        '45378': guidelines_document,
+        '45380': guidelines_document.model_copy(update={'cpt_code': '45380'}),
+    })
+
+    calls = []
+
+    def are_cpt_guideline_criteria_met(cpt_guideline_tree, index, on_criterion_result=None, **kwargs):
+        criterion_result = CriterionResult(criterion_id='1', criterion='Criterion', is_criterion_met=True, reason='Canned answer.')
+        if on_criterion_result:
+            on_criterion_result(criterion_result)
+        return CPTGuidelineResults(
+            are_criteria_met=True,
+            criteria_results=[criterion_result],
+        )
+
+    def step(name, result):
+        def run(*args, **kwargs):
+            calls.append(name)
+            return result(*args, **kwargs)
+        monkeypatch.setattr(pipeline, name, run)
+
+    step('index_medical_record', lambda **kwargs: 'index')
+    step('extract_requested_cpt_codes', lambda index: ['45378', '45380', '45378'])
+    step('extract_prior_treatment_information', lambda index: PriorTreatmentInformation(
+        was_treatment_attempted=False,
+        evidence_of_whether_treatment_was_attempted=None,
+        was_treatment_successful=None,
+        evidence_of_whether_treatment_was_successful=None,
+    ))
+    step('are_cpt_guideline_criteria_met', are_cpt_guideline_criteria_met)
+    return calls
+
+
+def test_every_requested_cpt_code_is_evaluated_in_one_run(calls):
+    """
+    Test that the guidelines for each distinct requested CPT code are evaluated,
+    while the record is indexed and prior treatment extracted only once.
+    """
+    document = pipeline.pre_authorization_pipeline('medical-record.pdf')
+
+    assert document.exit_reason == ExitReason.GUIDELINE_CRITERIA_EVALUATED
+    assert [result.cpt_code for result in document.cpt_code_results] == ['45378', '45380']
+    assert document.cpt_code == '45378'
+    assert document.are_guideline_criteria_met is True
+    assert calls.count('index_medical_record') == 1
+    assert calls.count('extract_prior_treatment_information') == 1
+    assert calls.count('are_cpt_guideline_criteria_met') == 2
+
+
+def test_missing_guidelines_for_any_requested_cpt_code_are_reported(calls, monkeypatch):
+    monkeypatch.setattr(pipeline, 'extract_requested_cpt_codes', lambda index: ['45378', '99999'])
+
+    with pytest.raises(PipelineException) as exc_info:
+        pipeline.pre_authorization_pipeline('medical-record.pdf')
+
+    assert exc_info.value.status_code == 400
+    assert '99999' in exc_info.value.detail
+
+
+def test_events_are_emitted_as_each_stage_finishes(calls):
+    events = list(pipeline.pre_authorization_pipeline_events('medical-record.pdf'))
+    event_types = [(event.event, event.cpt_code) for event in events]
+
+    assert event_types[:2] == [(PreAuthorizationEventType.CPT_CODES_EXTRACTED, None), (PreAuthorizationEventType.PRIOR_TREATMENT, None)]
+    assert event_types[-1] == (PreAuthorizationEventType.COMPLETED, None)
+    # CPT codes are evaluated concurrently, so only the order of the events for each CPT code is fixed.
+    for cpt_code in ['45378', '45380']:
+        assert [event_type for event_type, event_cpt_code in event_types if event_cpt_code == cpt_code] == [
+            PreAuthorizationEventType.CRITERION_RESULT,
+            PreAuthorizationEventType.CPT_CODE_RESULT,
+        ]
+    assert events[0].cpt_codes == ['45378', '45380']
+    assert [result.cpt_code for result in events[-1].pre_authorization.cpt_code_results] == ['45378', '45380']
+
+
+def test_pipeline_errors_are_emitted_as_the_last_event(calls, monkeypatch):
+    monkeypatch.setattr(pipeline, 'extract_requested_cpt_codes', lambda index: ['45378', '99999'])
+
+    events = list(pipeline.pre_authorization_pipeline_events('medical-record.pdf'))
+
+    assert events[-1].event == PreAuthorizationEventType.ERROR
+    assert events[-1].status_code == 400
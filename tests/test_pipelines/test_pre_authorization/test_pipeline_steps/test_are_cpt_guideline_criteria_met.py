@@ -0,0 +1,206 @@
+import importlib
+import json
+
+import pytest
+
+from data_models.cpt_guideline import CPTGuidelineDocument, Criterion, GuidelineDecisionTree, LogicalOperator
+from data_models.pre_authorization import CriterionResult, CriterionStatistics
+from env import REPO_ROOT_DIR, env
+from pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met import CriteriaEvaluationMode
+from services.db import Database, Collection
+from utils.hash_utils import sha256_text
+
+# The step module is shadowed by the function of the same name exported from `pipeline_steps`.
+step = importlib.import_module('pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met')
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+# Leaf answers for the colonoscopy guidelines, any leaf not listed is not met.
+ANSWERS = {
+    '1.1.1': True,
+    '1.1.2': True,
+    '1.3.1': None,
+}
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+
+
+@pytest.fixture
+def decision_tree():
+    with open(GUIDELINES_FILE_PATH) as file:
+        return CPTGuidelineDocument(**json.load(file)).decision_tree
+
+
+@pytest.fixture
+def queried_criteria(monkeypatch):
+    """Replaces the LLM query for a single leaf criterion with the canned `ANSWERS`."""
+    queried = []
+
+    def is_criterion_met(criterion, index, query_embedding=None):
+        queried.append(criterion.criterion_id)
+        return CriterionResult(
+            criterion_id=criterion.criterion_id,
+            criterion=criterion.criterion,
+            criterion_question=criterion.criterion_question,
+            is_criterion_met=ANSWERS.get(criterion.criterion_id, False),
+            reason='Canned answer.',
+        )
+
+    monkeypatch.setattr(step, '_is_criterion_met', is_criterion_met)
+    return queried
+
+
+def test_concurrent_evaluation_matches_sequential_evaluation(decision_tree, queried_criteria):
+    """
+    Test that evaluating the leaf criteria concurrently gives the same overall
+    result and the same depth-first ordering of results as evaluating them sequentially.
+    """
+    sequential = step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.SEQUENTIAL)
+    concurrent = step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.CONCURRENT, max_workers=4)
+
+    assert concurrent == sequential
+    assert concurrent.are_criteria_met is True
+    assert [result.criterion_id for result in concurrent.criteria_results] == [
+        '1.1', '1.1.1', '1.1.2', '1.2', '1.2.1', '1.2.1.1', '1.2.1.2', '1.2.2', '1.3', '1.3.1', '1.3.2',
+    ]
+
+
+def test_lazy_evaluation_skips_decided_criteria(decision_tree, queried_criteria):
+    """
+    Test that once past runs show the criteria under 1.1 are usually met and quick
+    to query, the lazy evaluation queries them first and skips the rest of the top-level OR.
+    """
+    db = Database()
+    for criterion in decision_tree.criteria[0].sub_criteria:
+        db.create(
+            collection=Collection.CRITERION_STATISTICS,
+            document=CriterionStatistics(
+                criterion_question=criterion.criterion_question,
+                evaluation_count=10,
+                met_count=9,
+                not_met_count=1,
+                total_latency_seconds=1.0,
+            ),
+            document_id=sha256_text(criterion.criterion_question),
+        )
+
+    results = step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.LAZY)
+
+    assert queried_criteria == ['1.1.1', '1.1.2']
+    assert results.are_criteria_met is True
+    assert results.llm_calls_saved == 5
+    assert [(result.criterion_id, result.was_evaluated) for result in results.criteria_results] == [
+        ('1.1', True), ('1.1.1', True), ('1.1.2', True),
+        ('1.2', False), ('1.2.1', False), ('1.2.1.1', False), ('1.2.1.2', False), ('1.2.2', False),
+        ('1.3', False), ('1.3.1', False), ('1.3.2', False),
+    ]
+
+
+def test_evaluations_are_added_to_the_criterion_statistics(decision_tree, queried_criteria):
+    """Test that the statistics of every queried leaf criterion accumulate across runs."""
+    for _ in range(2):
+        step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.CONCURRENT, max_workers=4)
+
+    statistics = step._read_criterion_statistics(step.CompiledGuidelineTree(decision_tree).leaf_criteria)
+    met_statistics = statistics[sha256_text(decision_tree.criteria[0].sub_criteria[0].criterion_question)]
+    not_met_statistics = statistics[sha256_text(decision_tree.criteria[1].sub_criteria[1].criterion_question)]
+    assert len(statistics) == 7
+    assert (met_statistics.evaluation_count, met_statistics.met_count, met_statistics.not_met_count) == (2, 2, 0)
+    assert (not_met_statistics.evaluation_count, not_met_statistics.met_count, not_met_statistics.not_met_count) == (2, 0, 2)
+    assert met_statistics.mean_latency_seconds >= 0
+
+
+def test_batched_evaluation_answers_criteria_in_batches(decision_tree, queried_criteria, monkeypatch):
+    """
+    Test that the batched evaluation answers the leaf criteria with one call per batch
+    and gives the same results as evaluating each criterion separately.
+    """
+    batches = []
+
+    def are_criteria_met(criteria, context):
+        batches.append([criterion.criterion_id for criterion in criteria])
+        return [step._is_criterion_met(criterion, index=None) for criterion in criteria]
+
+    monkeypatch.setattr(step, '_are_criteria_met', are_criteria_met)
+    monkeypatch.setattr(env, 'batched_extraction_batch_size', 3)
+
+    sequential = step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.SEQUENTIAL)
+    batched = step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=CriteriaEvaluationMode.BATCHED, context=['Medical record.'])
+
+    assert batched == sequential
+    assert sorted(batches) == [['1.1.1', '1.1.2', '1.2.1.1'], ['1.2.1.2', '1.2.2', '1.3.1'], ['1.3.2']]
+
+
+def _criterion(criterion_id: str, operator: LogicalOperator | None = None, sub_criteria: list[Criterion] | None = None) -> Criterion:
+    return Criterion(
+        criterion_id=criterion_id,
+        criterion=f'Criterion {criterion_id}.',
+        criterion_question=None if sub_criteria else f'Is criterion {criterion_id} met?',
+        sub_criteria=sub_criteria or [],
+        sub_criteria_operator=operator,
+    )
+
+
+@pytest.mark.parametrize('decision_tree, answers', [
+    # A NONE parent is met whatever the result of its sub-criterion.
+    (
+        GuidelineDecisionTree(treatment='Test', criteria_operator=LogicalOperator.AND, criteria=[
+            _criterion('1', LogicalOperator.NONE, [_criterion('1.1')]),
+            _criterion('2'),
+        ]),
+        {'1.1': False, '2': True},
+    ),
+    # An unmet criterion decides an AND even if another is unknown.
+    (
+        GuidelineDecisionTree(treatment='Test', criteria_operator=LogicalOperator.AND, criteria=[_criterion('1'), _criterion('2')]),
+        {'1': None, '2': False},
+    ),
+    # An OR is unknown if none are met and one is unknown.
+    (
+        GuidelineDecisionTree(treatment='Test', criteria_operator=LogicalOperator.OR, criteria=[_criterion('1'), _criterion('2')]),
+        {'1': None, '2': False},
+    ),
+    (
+        GuidelineDecisionTree(treatment='Test', criteria_operator=LogicalOperator.OR, criteria=[
+            _criterion('1', LogicalOperator.AND, [_criterion('1.1'), _criterion('1.2')]),
+            _criterion('2', LogicalOperator.OR, [_criterion('2.1'), _criterion('2.2', LogicalOperator.NONE, [_criterion('2.2.1')])]),
+        ]),
+        {'1.1': None, '1.2': True, '2.1': False, '2.2.1': False},
+    ),
+])
+def test_every_mode_gives_the_same_results(decision_tree, answers, monkeypatch):
+    """
+    Test that the same leaf answers give the same overall result and criterion results in every mode,
+    apart from the criteria the lazy evaluation skips as they cannot change the result.
+    """
+    def is_criterion_met(criterion, index, query_embedding=None):
+        return CriterionResult(
+            criterion_id=criterion.criterion_id,
+            criterion=criterion.criterion,
+            criterion_question=criterion.criterion_question,
+            is_criterion_met=answers[criterion.criterion_id],
+            reason='Canned answer.',
+        )
+
+    monkeypatch.setattr(step, '_is_criterion_met', is_criterion_met)
+    monkeypatch.setattr(step, '_are_criteria_met', lambda criteria, context: [is_criterion_met(criterion, index=None) for criterion in criteria])
+
+    results = {
+        mode: step.are_cpt_guideline_criteria_met(decision_tree, index=None, mode=mode, context=['Medical record.'])
+        for mode in CriteriaEvaluationMode
+    }
+
+    expected = results[CriteriaEvaluationMode.SEQUENTIAL]
+    for mode, mode_results in results.items():
+        assert mode_results.are_criteria_met == expected.are_criteria_met, mode
+        assert [result.criterion_id for result in mode_results.criteria_results] == [result.criterion_id for result in expected.criteria_results]
+        assert [
+            result for result in mode_results.criteria_results if result.was_evaluated
+        ] == [
+            expected_result for result, expected_result in zip(mode_results.criteria_results, expected.criteria_results) if result.was_evaluated
+        ], mode
+        if mode != CriteriaEvaluationMode.LAZY:
+            assert mode_results.criteria_results == expected.criteria_results, mode
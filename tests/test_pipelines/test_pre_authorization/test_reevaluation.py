@@ -0,0 +1,184 @@
+import importlib
+import json
+
+import pytest
+
+from data_models.cpt_guideline import CPTGuidelineDocument
+from data_models.pre_authorization import (
+    CPTCodeResult,
+    CriterionResult,
+    ExitReason,
+    PreAuthorizationDocument,
+    PriorTreatmentInformation,
+    ReevaluationStatus,
+)
+from env import REPO_ROOT_DIR, env
+from pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met import CriteriaEvaluationMode
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+
+# The step module is shadowed by the function of the same name exported from `pipeline_steps`.
+step = importlib.import_module('pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met')
+reevaluation = importlib.import_module('pipelines.pre_authorization.reevaluation')
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+CHANGED_CRITERION_ID = '1.1.1'
+
+
+@pytest.fixture
+def guidelines_document(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', tmp_path / 'mock_nosql_db')
+    get_guideline_cache.cache_clear()
+    with open(GUIDELINES_FILE_PATH) as file:
+        guidelines_document = CPTGuidelineDocument(**json.load(file))
+    Database().create(Collection.CPT_GUIDELINES, guidelines_document, document_id='45378')
+    return guidelines_document
+
+
+@pytest.fixture
+def queried_criteria(monkeypatch):
+    """Replaces the LLM query for a single leaf criterion and the medical record index, recording the calls."""
+    queried = []
+
+    def is_criterion_met(criterion, index, query_embedding=None):
+        queried.append(criterion.criterion_id)
+        return CriterionResult(
+            criterion_id=criterion.criterion_id,
+            criterion=criterion.criterion,
+            criterion_question=criterion.criterion_question,
+            is_criterion_met=True,
+            reason='Canned answer.',
+        )
+
+    def index_medical_record(medical_record_file_path, content_hash):
+        queried.append('index')
+        return 'index'
+
+    monkeypatch.setattr(step, '_is_criterion_met', is_criterion_met)
+    monkeypatch.setattr(reevaluation, 'index_medical_record', index_medical_record)
+    return queried
+
+
+def _store_pre_authorization(guidelines_document: CPTGuidelineDocument) -> str:
+    cpt_guideline_results = step.are_cpt_guideline_criteria_met(
+        guidelines_document.decision_tree,
+        index='index',
+        mode=CriteriaEvaluationMode.CONCURRENT,
+    )
+    cpt_code_result = CPTCodeResult(
+        cpt_code='45378',
+        guidelines=guidelines_document.guidelines,
+        are_guideline_criteria_met=cpt_guideline_results.are_criteria_met,
+        guideline_criteria_results=cpt_guideline_results.criteria_results,
+    )
+    return Database().create(Collection.PRE_AUTHORIZATIONS, PreAuthorizationDocument(
+        cpt_code='45378',
+        exit_reason=ExitReason.GUIDELINE_CRITERIA_EVALUATED,
+        prior_treatment=PriorTreatmentInformation(
+            was_treatment_attempted=False,
+            evidence_of_whether_treatment_was_attempted=None,
+            was_treatment_successful=None,
+            evidence_of_whether_treatment_was_successful=None,
+        ),
+        guidelines=cpt_code_result.guidelines,
+        are_guideline_criteria_met=cpt_code_result.are_guideline_criteria_met,
+        guideline_criteria_results=cpt_code_result.guideline_criteria_results,
+        cpt_code_results=[cpt_code_result],
+        medical_record_file_path='medical-record.pdf',
+    ))
+
+
+def _change_question(guidelines_document: CPTGuidelineDocument, criterion_id: str) -> CPTGuidelineDocument:
+    document = guidelines_document.model_copy(deep=True)
+    stack = list(document.decision_tree.criteria)
+    while stack:
+        criterion = stack.pop()
+        if criterion.criterion_id == criterion_id:
+            criterion.criterion_question = 'Has the patient had a colonoscopy in the last 5 years?'
+        stack.extend(criterion.sub_criteria)
+    return document
+
+
+def test_only_changed_criteria_are_queried(guidelines_document, queried_criteria):
+    """
+    Test that after one criterion question changes, re-evaluating a stored pre-authorization
+    only queries that criterion and stores its new result alongside the reused results.
+    """
+    pre_authorization_id = _store_pre_authorization(guidelines_document)
+    leaf_count = len(queried_criteria)
+    queried_criteria.clear()
+
+    Database().create(Collection.CPT_GUIDELINES, _change_question(guidelines_document, CHANGED_CRITERION_ID), document_id='45378', overwrite=True)
+    get_guideline_cache().invalidate('45378')
+    results = reevaluation.reevaluate_pre_authorizations(cpt_codes=['45378'])
+
+    assert queried_criteria == ['index', CHANGED_CRITERION_ID]
+    assert results.updated_count == 1
+    assert results.criteria_queried == 1
+    assert results.criteria_reused == leaf_count - 1
+
+    pre_authorization = Database().read(Collection.PRE_AUTHORIZATIONS, pre_authorization_id, PreAuthorizationDocument)
+    changed_result, = [result for result in pre_authorization.guideline_criteria_results if result.criterion_id == CHANGED_CRITERION_ID]
+    assert changed_result.criterion_question == 'Has the patient had a colonoscopy in the last 5 years?'
+    assert pre_authorization.cpt_code_results[0].guideline_criteria_results == pre_authorization.guideline_criteria_results
+
+
+def test_unchanged_guidelines_make_no_llm_calls(guidelines_document, queried_criteria):
+    _store_pre_authorization(guidelines_document)
+    queried_criteria.clear()
+
+    results = reevaluation.reevaluate_pre_authorizations()
+
+    assert queried_criteria == []
+    assert results.results[0].status == ReevaluationStatus.UNCHANGED
+    assert results.criteria_queried == 0
+
+
+def test_pre_authorizations_are_reevaluated_a_page_at_a_time(guidelines_document, queried_criteria, monkeypatch):
+    """Test that each page of pre-authorizations is re-evaluated before the next page is read, so they aren't all held in memory."""
+    pre_authorization_ids = [_store_pre_authorization(guidelines_document) for _ in range(3)]
+    events = []
+    query = Database.query
+    reevaluate_pre_authorization = reevaluation.reevaluate_pre_authorization
+
+    def recorded_query(self, *args, **kwargs):
+        events.append('read')
+        return query(self, *args, **kwargs)
+
+    def recorded_reevaluate_pre_authorization(*args, **kwargs):
+        events.append('reevaluate')
+        return reevaluate_pre_authorization(*args, **kwargs)
+
+    monkeypatch.setattr(Database, 'query', recorded_query)
+    monkeypatch.setattr(reevaluation, 'reevaluate_pre_authorization', recorded_reevaluate_pre_authorization)
+    monkeypatch.setattr(env, 'reevaluation_page_size', 1)
+
+    results = reevaluation.reevaluate_pre_authorizations(max_workers=1)
+
+    assert events == ['read', 'reevaluate'] * 3
+    assert [result.pre_authorization_id for result in results.results] == pre_authorization_ids
+
+
+def test_pre_authorization_changed_during_reevaluation_is_not_overwritten(guidelines_document, queried_criteria, monkeypatch):
+    """Test that a pre-authorization overwritten while it is being re-evaluated keeps the newer version and is reported as failed."""
+    pre_authorization_id = _store_pre_authorization(guidelines_document)
+    Database().create(Collection.CPT_GUIDELINES, _change_question(guidelines_document, CHANGED_CRITERION_ID), document_id='45378', overwrite=True)
+    get_guideline_cache().invalidate('45378')
+    reevaluate_pre_authorization = reevaluation.reevaluate_pre_authorization
+    newer_pre_authorization = None
+
+    def overwritten_reevaluate_pre_authorization(pre_authorization, mode=None):
+        nonlocal newer_pre_authorization
+        newer_pre_authorization = pre_authorization.model_copy(update={'medical_record_content_hash': 'newer'})
+        Database().create(Collection.PRE_AUTHORIZATIONS, newer_pre_authorization, document_id=pre_authorization_id, overwrite=True)
+        return reevaluate_pre_authorization(pre_authorization, mode)
+
+    monkeypatch.setattr(reevaluation, 'reevaluate_pre_authorization', overwritten_reevaluate_pre_authorization)
+
+    results = reevaluation.reevaluate_pre_authorizations()
+
+    assert results.results[0].status == ReevaluationStatus.FAILED
+    assert (results.updated_count, results.failed_count) == (0, 1)
+    assert Database().read(Collection.PRE_AUTHORIZATIONS, pre_authorization_id, PreAuthorizationDocument) == newer_pre_authorization
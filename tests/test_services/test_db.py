@@ -0,0 +1,153 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from pydantic import BaseModel
+
+from env import env
+from services.db import Database, Collection, DatabaseException
+
+
+class Document(BaseModel):
+    value: int
+    cpt_code: str | None = None
+    exit_reason: str | None = None
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', tmp_path / 'mock_nosql_db')
+    return Database()
+
+
+def test_create_read_and_update(db):
+    """
+    Test that documents can only be created once unless overwritten and only
+    updated once created.
+    """
+    document_id = db.create(Collection.PRE_AUTHORIZATIONS, document=Document(value=1))
+
+    with pytest.raises(DatabaseException):
+        db.create(Collection.PRE_AUTHORIZATIONS, document=Document(value=2), document_id=document_id)
+    with pytest.raises(DatabaseException):
+        db.update(Collection.PRE_AUTHORIZATIONS, document=Document(value=2), document_id='missing')
+
+    db.update(Collection.PRE_AUTHORIZATIONS, document={'value': 3}, document_id=document_id)
+
+    assert db.read(Collection.PRE_AUTHORIZATIONS, document_id, Document).value == 3
+    assert db.read(Collection.CPT_GUIDELINES, document_id, Document) is None
+
+
+def test_bulk_create_does_not_create_any_documents_if_one_already_exists(db):
+    """
+    Test that bulk creating documents fails without writing anything if any of
+    the documents already exist, so a retried batch never leaves a partial write.
+    """
+    db.create(Collection.PRE_AUTHORIZATIONS, document=Document(value=1), document_id='existing')
+
+    with pytest.raises(DatabaseException):
+        db.bulk_create(Collection.PRE_AUTHORIZATIONS, documents={'new': Document(value=2), 'existing': Document(value=3)})
+
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'existing', Document).value == 1
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'new', Document) is None
+
+    db.bulk_create(Collection.PRE_AUTHORIZATIONS, documents={'new': Document(value=2), 'other': {'value': 3}})
+
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'new', Document).value == 2
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'other', Document).value == 3
+
+
+def test_query_filters_on_indexed_fields_and_pages_with_a_cursor(db):
+    """
+    Test that a query only returns documents matching the filters, in creation
+    order, and that following the cursor returns every matching document once.
+    """
+    db.bulk_create(
+        Collection.PRE_AUTHORIZATIONS,
+        documents={
+            f'document-{i}': Document(value=i, cpt_code='45378' if i % 2 else '12345', exit_reason='GUIDELINE_CRITERIA_EVALUATED')
+            for i in range(7)
+        },
+    )
+
+    values, cursor = [], None
+    while True:
+        page = db.query(Collection.PRE_AUTHORIZATIONS, Document, cpt_code='45378', limit=2, cursor=cursor)
+        values.extend(document.value for document in page.documents.values())
+        if not (cursor := page.next_cursor):
+            break
+
+    assert sorted(values) == [1, 3, 5]
+    assert db.count(Collection.PRE_AUTHORIZATIONS, exit_reason='GUIDELINE_CRITERIA_EVALUATED') == 7
+    assert db.count(Collection.PRE_AUTHORIZATIONS, created_after=datetime.now(timezone.utc) + timedelta(minutes=1)) == 0
+
+
+def test_new_database_imports_json_files(monkeypatch, tmp_path):
+    """
+    Test that a new database imports the documents stored in the old JSON file layout.
+    """
+    json_dir = tmp_path / 'mock_nosql_db'
+    (json_dir / Collection.CPT_GUIDELINES.value).mkdir(parents=True)
+    (json_dir / Collection.CPT_GUIDELINES.value / '45378.json').write_text(json.dumps({'value': 1, 'cpt_code': '45378'}))
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', json_dir)
+
+    db = Database()
+
+    assert db.read(Collection.CPT_GUIDELINES, '45378', Document).value == 1
+    assert db.count(Collection.CPT_GUIDELINES, cpt_code='45378') == 1
+    assert db.import_json_files(json_dir) == 0
+
+
+def test_read_many(db):
+    """
+    Test that many documents are read at once and missing documents are None.
+    """
+    db.bulk_create(Collection.CPT_GUIDELINES, {'a': Document(value=1), 'b': Document(value=2)})
+
+    documents = db.read_many(Collection.CPT_GUIDELINES, ['b', 'missing', 'a'], Document)
+
+    assert documents == {'b': Document(value=2), 'missing': None, 'a': Document(value=1)}
+
+
+def test_bulk_increment_does_not_lose_concurrent_increments(db):
+    """
+    Test that increments made at the same time by many threads are all applied,
+    creating the documents which do not exist yet.
+    """
+    db.create(Collection.CRITERION_STATISTICS, document=Document(value=5), document_id='existing')
+
+    def increment(_):
+        Database().bulk_increment(
+            Collection.CRITERION_STATISTICS,
+            increments={'existing': {'value': 1}, 'new': {'value': 2}},
+            documents={'existing': Document(value=0), 'new': Document(value=0)},
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(increment, range(50)))
+
+    assert db.read(Collection.CRITERION_STATISTICS, 'existing', Document).value == 55
+    assert db.read(Collection.CRITERION_STATISTICS, 'new', Document).value == 100
+
+
+def test_bulk_update_if_unchanged_skips_documents_changed_since_they_were_read(db):
+    db.bulk_create(Collection.PRE_AUTHORIZATIONS, documents={'unchanged': Document(value=1), 'changed': Document(value=1)})
+    db.update(Collection.PRE_AUTHORIZATIONS, document=Document(value=2), document_id='changed')
+
+    updated_document_ids = db.bulk_update_if_unchanged(
+        Collection.PRE_AUTHORIZATIONS,
+        documents={
+            'unchanged': (Document(value=1), Document(value=10)),
+            'changed': (Document(value=1), Document(value=10)),
+            'missing': (Document(value=1), Document(value=10)),
+        },
+        output_class=Document,
+    )
+
+    assert updated_document_ids == ['unchanged']
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'unchanged', Document).value == 10
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'changed', Document).value == 2
+    assert db.read(Collection.PRE_AUTHORIZATIONS, 'missing', Document) is None
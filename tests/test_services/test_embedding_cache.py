@@ -0,0 +1,44 @@
+from llama_index import Document, VectorStoreIndex
+
+from services.embedding_cache import EmbeddingCache
+from services.fake_openai import FakeOpenAITransport
+from services.llm_provider import LLMProvider
+
+
+def test_reindexing_a_changed_record_only_embeds_changed_chunks(tmp_path):
+    """
+    Test that building an index for a record where only one page changed only embeds
+    the chunks of that page, and that repeated queries are embedded once.
+    """
+    transport = FakeOpenAITransport()
+    embedding_cache = EmbeddingCache(db_path=tmp_path / 'embeddings.sqlite3', max_entries=1000)
+    provider = LLMProvider(max_connections=1, timeout_seconds=5, max_retries=0, transport=transport, embedding_cache=embedding_cache)
+    service_context = provider.service_context()
+
+    pages = [f'Page {i}. The patient reported symptom number {i}.' for i in range(5)]
+    VectorStoreIndex.from_documents([Document(text=page) for page in pages], service_context=service_context)
+    assert transport.stats()['embedded_texts'] == 5
+
+    pages[2] = 'Page 2. The patient   reported a new symptom.'
+    index = VectorStoreIndex.from_documents([Document(text=page) for page in pages], service_context=service_context)
+    assert transport.stats()['embedded_texts'] == 6
+
+    index.as_retriever().retrieve('new symptom')
+    index.as_retriever().retrieve('new  symptom')
+    assert transport.stats()['embedded_texts'] == 7
+    assert embedding_cache.stats()['hits'] == 5
+    assert embedding_cache.stats()['hit_rate'] == 5 / 12
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    """
+    Test that a full cache evicts the least recently used embeddings until it is under 90% of its max size.
+    """
+    embedding_cache = EmbeddingCache(db_path=tmp_path / 'embeddings.sqlite3', max_entries=3)
+    embedding_cache.set_many('model', ['a', 'b', 'c'], [[0.1], [0.2], [0.3]])
+    embedding_cache.get_many('model', ['a'])
+
+    embedding_cache.set_many('model', ['d'], [[0.4]])
+
+    assert embedding_cache.get_many('model', ['a', 'b', 'c', 'd']) == [[0.1], None, None, [0.4]]
+    assert embedding_cache.stats()['evictions'] == 2
@@ -0,0 +1,28 @@
+from services.fake_openai import FakeOpenAITransport
+from services.llm_provider import LLMProvider
+
+
+def test_fake_backend_answers_deterministically():
+    """
+    Test that the fake backend answers chat, structured output and embedding
+    requests made through the LLM provider, the same way every time.
+    """
+    transport = FakeOpenAITransport(canned_arguments={'CPTCodes': {'cpt_codes': ['12345']}})
+    provider = LLMProvider(max_connections=1, timeout_seconds=5, max_retries=0, transport=transport)
+
+    response = provider.openai_client.chat.completions.create(
+        model='gpt-3.5-turbo',
+        messages=[{'role': 'user', 'content': 'Echo this'}],
+    )
+    assert response.choices[0].message.content == 'Echo this'
+
+    tool_call = provider.openai_client.chat.completions.create(
+        model='gpt-3.5-turbo',
+        messages=[{'role': 'user', 'content': 'Which CPT codes?'}],
+        tools=[{'type': 'function', 'function': {'name': 'CPTCodes', 'parameters': {}}}],
+    ).choices[0].message.tool_calls[0]
+    assert tool_call.function.arguments == '{"cpt_codes": ["12345"]}'
+
+    embeddings = provider.embed_model.get_text_embedding_batch(['colonoscopy screening', 'colonoscopy screening', 'hip'])
+    assert embeddings[0] == embeddings[1] != embeddings[2]
+    assert transport.stats() == {'chat_calls': 2, 'structured_output_calls': 1, 'embedding_calls': 1, 'embedded_texts': 3, 'rate_limited_requests': 0}
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from data_models.cpt_guideline import CPTGuidelineDocument
+from env import REPO_ROOT_DIR, env
+from services.db import Database, Collection
+from services.guideline_cache import GuidelineCache, CompiledGuidelineTree
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+
+@pytest.fixture
+def guidelines_document(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'mock_nosql_db_dir', tmp_path / 'mock_nosql_db')
+    with open(GUIDELINES_FILE_PATH) as file:
+        guidelines_document = CPTGuidelineDocument(**json.load(file))
+    Database().create(Collection.CPT_GUIDELINES, guidelines_document, document_id='45378')
+    return guidelines_document
+
+
+def test_compiled_tree_is_flattened_in_depth_first_order(guidelines_document):
+    tree = CompiledGuidelineTree(guidelines_document.decision_tree)
+
+    assert [criterion.criterion_id for criterion in tree.criteria[:3]] == ['1.1', '1.1.1', '1.1.2']
+    assert tree.parents[:3] == (-1, 0, 0)
+    assert all(tree.parents[i] < i for i in range(len(tree.criteria)))
+    assert all(not tree.criteria[i].sub_criteria for i in tree.leaves)
+
+
+def test_guideline_cache_is_invalidated_and_warmed(guidelines_document):
+    """
+    Test that cached guidelines are reused until invalidated, that missing
+    CPT codes are not cached and that warming loads every CPT code.
+    """
+    guideline_cache = GuidelineCache(max_age_seconds=60)
+
+    first = guideline_cache.get_many(['45378', '99999'])
+    second = guideline_cache.get_many(['45378'])
+
+    assert first['99999'] is None
+    assert second['45378'] is first['45378']
+    assert first['45378'].document == guidelines_document
+    assert guideline_cache.stats() == {'hits': 1, 'misses': 2, 'invalidations': 0, 'cpt_codes': 1}
+
+    guideline_cache.invalidate('45378')
+    assert guideline_cache.get_many(['45378'])['45378'] is not first['45378']
+
+    warmed_cache = GuidelineCache(max_age_seconds=60)
+    warmed_cache.warm()
+    warmed_cache.get_many(['45378'])
+    assert warmed_cache.stats()['hits'] == 1
@@ -0,0 +1,22 @@
+from services import index_cache as index_cache_module
+from services.index_cache import IndexCache
+
+
+def test_index_cache_evicts_least_recently_used_indexes(monkeypatch):
+    """
+    Test that once the estimated memory of the cached indexes exceeds the limit,
+    the least recently used indexes are evicted first.
+    """
+    monkeypatch.setattr(index_cache_module, '_estimate_index_size_bytes', lambda index: 100)
+    index_cache = IndexCache(max_size_bytes=250)
+
+    index_cache.put('a', 'index-a')
+    index_cache.put('b', 'index-b')
+    assert index_cache.get('a') == 'index-a'
+    index_cache.put('c', 'index-c')
+
+    assert index_cache.get('a') == 'index-a'
+    assert index_cache.get('b') is None
+    assert index_cache.get('c') == 'index-c'
+    assert index_cache.stats()['evictions'] == 1
+    assert index_cache.stats()['size_bytes'] == 200
@@ -0,0 +1,51 @@
+import time
+
+from data_models.job import JobStatus
+from services.job_queue import JobQueue, JobWorkerPool, JobException
+
+
+def test_job_queue_resumes_jobs_interrupted_by_a_crash(tmp_path):
+    """
+    Test that a running job whose lease has expired (because its worker crashed)
+    is claimed again, until it has been attempted the maximum number of times.
+    """
+    job_queue = JobQueue(db_path=tmp_path / 'jobs.sqlite3', lease_seconds=0, max_attempts=2)
+    job_id = job_queue.enqueue(job_type='test', payload={'x': 1})
+
+    assert job_queue.claim('test').job_id == job_id
+    time.sleep(0.01)
+    job = job_queue.claim('test')
+    assert job.job_id == job_id
+    assert job.attempts == 2
+    time.sleep(0.01)
+
+    assert job_queue.claim('test') is None
+    assert job_queue.get(job_id).status == JobStatus.FAILED
+
+
+def test_job_worker_pool_runs_queued_jobs(tmp_path):
+    job_queue = JobQueue(db_path=tmp_path / 'jobs.sqlite3', lease_seconds=60, max_attempts=3)
+
+    def handler(job):
+        if job.payload['x'] < 0:
+            raise JobException(detail='Negative', status_code=400)
+        return {'y': job.payload['x'] * 2}
+
+    succeeded_job_id = job_queue.enqueue(job_type='test', payload={'x': 2})
+    failed_job_id = job_queue.enqueue(job_type='test', payload={'x': -1})
+
+    job_worker_pool = JobWorkerPool(job_queue, job_type='test', handler=handler, num_workers=2, poll_interval_seconds=0.01)
+    job_worker_pool.start()
+    deadline = time.time() + 5
+    while time.time() < deadline and any(
+            job_queue.get(job_id).status in (JobStatus.PENDING, JobStatus.RUNNING) for job_id in (succeeded_job_id, failed_job_id)
+    ):
+        time.sleep(0.01)
+    job_worker_pool.stop()
+
+    succeeded_job = job_queue.get(succeeded_job_id)
+    assert succeeded_job.status == JobStatus.SUCCEEDED
+    assert succeeded_job.result == {'y': 4}
+    failed_job = job_queue.get(failed_job_id)
+    assert failed_job.error == 'Negative'
+    assert failed_job.error_status_code == 400
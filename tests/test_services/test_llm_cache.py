@@ -0,0 +1,83 @@
+import os
+import time
+
+from pydantic import BaseModel
+
+from services.llm_cache import LLMCache, llm_cache_key
+
+
+class Answer(BaseModel):
+    answer: bool
+    reason: str
+
+
+def test_llm_cache_round_trips_pydantic_models(tmp_path):
+    """
+    Test that a cached structured output is returned as an equal pydantic
+    model and that hits and misses are counted.
+    """
+    llm_cache = LLMCache(cache_dir=tmp_path, max_size_bytes=1024 * 1024, max_age_seconds=60)
+    key = llm_cache_key(model='gpt', prompt='Is it?', context=['chunk'], output_class=Answer)
+
+    assert llm_cache.get_model(key, Answer) is None
+    llm_cache.set_model(key, Answer(answer=True, reason='Because.'))
+
+    assert llm_cache.get_model(key, Answer) == Answer(answer=True, reason='Because.')
+    assert llm_cache.stats()['hits'] == 1
+    assert llm_cache.stats()['misses'] == 1
+
+
+def test_llm_cache_key_depends_on_retrieved_context():
+    assert llm_cache_key(model='gpt', prompt='Is it?', context=['a']) != llm_cache_key(model='gpt', prompt='Is it?', context=['b'])
+
+
+def test_llm_cache_expires_old_entries(tmp_path):
+    llm_cache = LLMCache(cache_dir=tmp_path, max_size_bytes=1024 * 1024, max_age_seconds=0)
+    llm_cache.set('key', 'value')
+    time.sleep(0.01)
+
+    assert llm_cache.get('key') is None
+    assert not list(tmp_path.glob('*/*.json'))
+
+
+def test_llm_cache_evicts_least_recently_used_entries(tmp_path):
+    """
+    Test that once the cache is full, the least recently used entries are evicted first.
+    """
+    llm_cache = LLMCache(cache_dir=tmp_path, max_size_bytes=300, max_age_seconds=60)
+    for i, key in enumerate(['a1', 'b1', 'c1']):
+        llm_cache.set(key, 'x' * 50)
+        # Space out the modification times as some file systems have a coarse resolution.
+        os.utime(llm_cache._file_path(key), (i, i))
+    llm_cache.get('a1')
+
+    llm_cache.set('d1', 'x' * 50)
+
+    assert llm_cache.get('a1') is not None
+    assert llm_cache.get('b1') is None
+    assert llm_cache.get('d1') is not None
+    assert llm_cache.stats()['evictions'] >= 1
+
+
+def test_llm_cache_counts_an_overwritten_entry_once(tmp_path):
+    llm_cache = LLMCache(cache_dir=tmp_path, max_size_bytes=1024 * 1024, max_age_seconds=60)
+    llm_cache.set('a1', 'x')
+    llm_cache.set('b1', 'x' * 50)
+    for _ in range(3):
+        llm_cache.set('b1', 'x' * 100)
+
+    assert llm_cache.stats()['size_bytes'] == sum(path.stat().st_size for path in tmp_path.glob('*/*.json'))
+
+
+def test_llm_cache_hit_evicted_while_being_read_is_returned(tmp_path, monkeypatch):
+    llm_cache = LLMCache(cache_dir=tmp_path, max_size_bytes=1024 * 1024, max_age_seconds=60)
+    llm_cache.set('key', 'value')
+
+    def utime(path, *args, **kwargs):
+        os.remove(path)  # Evicted by another process between the read and bumping its modification time.
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', utime)
+
+    assert llm_cache.get('key') == 'value'
+    assert llm_cache.stats()['hits'] == 1
@@ -0,0 +1,54 @@
+import http.server
+import threading
+
+import pytest
+
+from data_models.pre_authorization import PriorTreatmentInformation
+from services.llm_provider import LLMProvider
+
+
+class OKHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OKHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+
+
+def test_provider_reuses_clients_and_connections(server_url):
+    """
+    Test that LLMs, service contexts and response synthesizers are only constructed
+    once per configuration and that HTTP connections are kept alive between requests.
+    """
+    provider = LLMProvider(max_connections=2, timeout_seconds=5, max_retries=0)
+
+    service_context = provider.service_context(model='gpt-3.5-turbo-0613', temperature=0.0)
+    assert provider.service_context(model='gpt-3.5-turbo-0613', temperature=0.0) is service_context
+    assert provider.llm(model='gpt-3.5-turbo-0613', temperature=0.0) is service_context.llm
+    assert provider.service_context() is not service_context
+
+    response_synthesizer = provider.response_synthesizer(service_context, PriorTreatmentInformation)
+    assert provider.response_synthesizer(service_context, PriorTreatmentInformation) is response_synthesizer
+
+    for _ in range(3):
+        provider.http_client.get(server_url)
+
+    stats = provider.stats()
+    assert stats['llms_created'] == 2
+    assert stats['service_contexts_created'] == 2
+    assert stats['response_synthesizers_created'] == 1
+    assert stats['http_requests'] == 3
+    assert stats['http_connections_opened'] == 1
@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from services.fake_openai import FakeOpenAITransport
+from services.llm_provider import LLMProvider
+from services.llm_scheduler import LLMScheduler, Priority, TokenBucket, llm_priority
+from services.tracing import with_current_span
+
+
+def _scheduler(**kwargs) -> LLMScheduler:
+    settings = {
+        'requests_per_minute': 60_000,
+        'tokens_per_minute': 10_000_000,
+        'initial_concurrency': 8,
+        'max_concurrency': 8,
+        'latency_target_seconds': 10.0,
+        'max_retries': 5,
+        'retry_base_delay_seconds': 0.001,
+        'retry_max_delay_seconds': 0.01,
+        **kwargs,
+    }
+    return LLMScheduler(**settings)
+
+
+def _chat(provider: LLMProvider, content: str) -> str:
+    return provider.openai_client.chat.completions.create(
+        model='gpt-3.5-turbo',
+        messages=[{'role': 'user', 'content': content}],
+    ).choices[0].message.content
+
+
+def test_rate_limited_requests_are_retried():
+    transport = FakeOpenAITransport(rate_limited_fraction=0.5)
+    scheduler = _scheduler()
+    provider = LLMProvider(max_connections=8, timeout_seconds=5, max_retries=3, transport=transport, scheduler=scheduler)
+
+    assert [_chat(provider, f'Request {i}') for i in range(10)] == [f'Request {i}' for i in range(10)]
+    # Every other request to the API is rate limited, so all but the first request are retried once.
+    assert transport.rate_limited_requests == 9
+    assert scheduler.stats()['retries'] == 9
+
+
+def test_concurrency_backs_off_when_rate_limited():
+    """
+    Test that when the API only allows 2 requests in flight, the scheduler halves its concurrency
+    on the rate limited responses until the requests stop being rejected, and every request succeeds.
+    """
+    transport = FakeOpenAITransport(chat_latency_seconds=0.02, max_concurrent_requests=2)
+    scheduler = _scheduler(initial_concurrency=8)
+    provider = LLMProvider(max_connections=8, timeout_seconds=5, max_retries=0, transport=transport, scheduler=scheduler)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda i: _chat(provider, f'Request {i}'), range(32)))
+
+    assert responses == [f'Request {i}' for i in range(32)]
+    assert transport.rate_limited_requests > 0
+    assert scheduler.stats()['rate_limited'] == transport.rate_limited_requests
+    assert scheduler.concurrency < 8
+
+
+def test_interactive_requests_are_sent_before_batch_requests():
+    scheduler = _scheduler(initial_concurrency=1, max_concurrency=1)
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions', content=b'{}')
+    release = threading.Event()
+    sent = []
+
+    def send(name):
+        def send_request(request):
+            if name == 'first':
+                release.wait(5)
+            sent.append(name)
+            return httpx.Response(200, json={})
+        return send_request
+
+    def send_with_priority(name, priority):
+        with llm_priority(priority):
+            scheduler.send(request, send(name))
+
+    threads = [threading.Thread(target=with_current_span(send_with_priority), args=('first', Priority.INTERACTIVE))]
+    threads[0].start()
+    while scheduler.stats()['in_flight'] < 1:
+        time.sleep(0.001)
+    for name, priority in [('batch', Priority.BATCH), ('interactive', Priority.INTERACTIVE)]:
+        threads.append(threading.Thread(target=send_with_priority, args=(name, priority)))
+        threads[-1].start()
+        while scheduler.stats()['queued'] < len(threads) - 1:
+            time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sent == ['first', 'interactive', 'batch']
+
+
+def test_token_bucket_waits_for_the_budget_to_refill():
+    bucket = TokenBucket(rate_per_second=100, capacity=10)
+
+    assert bucket.wait_seconds(10) == 0
+    bucket.take(10)
+    assert 0.09 < bucket.wait_seconds(10) <= 0.1
+    # A request larger than the whole budget only waits for the budget to be full.
+    assert bucket.wait_seconds(1_000) <= 0.1
@@ -0,0 +1,45 @@
+import numpy as np
+from llama_index import Document, VectorStoreIndex, StorageContext
+
+from services.fake_openai import FakeOpenAITransport
+from services.llm_provider import LLMProvider
+from services.numpy_vector_store import NumpyVectorStore
+
+PAGES = [
+    'Patient reports rectal bleeding for the past 6 months.',
+    'Father had colorectal cancer at age 68.',
+    'Allergies: no known drug allergies.',
+    'Medications: Lisinopril 10mg daily for hypertension.',
+    'No colonoscopy has been performed in the past 10 years.',
+]
+
+
+def test_persisted_store_is_memory_mapped_and_matches_default_store(tmp_path):
+    """
+    Test that a persisted index is loaded with its embeddings memory-mapped and
+    retrieves nodes with the same similarities as LlamaIndex's default vector store.
+    """
+    provider = LLMProvider(max_connections=1, timeout_seconds=5, max_retries=0, transport=FakeOpenAITransport())
+    service_context = provider.service_context()
+    documents = [Document(text=page, id_=f'page-{i}') for i, page in enumerate(PAGES)]
+
+    vector_store = NumpyVectorStore()
+    VectorStoreIndex.from_documents(
+        documents,
+        storage_context=StorageContext.from_defaults(vector_store=vector_store),
+        service_context=service_context,
+    )
+    vector_store.persist(tmp_path)
+    default_index = VectorStoreIndex.from_documents(documents, service_context=service_context)
+
+    loaded_store = NumpyVectorStore.from_persist_dir(tmp_path)
+    index = VectorStoreIndex.from_vector_store(loaded_store, service_context=service_context)
+
+    assert isinstance(loaded_store.embeddings, np.memmap)
+    assert loaded_store.embeddings.dtype == np.float32
+    for query in ['colorectal cancer family history', 'previous colonoscopy']:
+        nodes = index.as_retriever(similarity_top_k=3).retrieve(query)
+        default_nodes = default_index.as_retriever(similarity_top_k=3).retrieve(query)
+        # Only the best match is compared, the fake embeddings of the other pages tie at zero similarity.
+        assert nodes[0].get_content() == default_nodes[0].get_content()
+        assert np.allclose([node.score for node in nodes], [node.score for node in default_nodes], atol=1e-5)
@@ -0,0 +1,103 @@
+import importlib
+import json
+
+import pytest
+from llama_index import Document, VectorStoreIndex, StorageContext
+
+from data_models.cpt_guideline import CPTGuidelineDocument
+from env import REPO_ROOT_DIR, env
+from pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met import CriteriaEvaluationMode
+from services.guideline_cache import CompiledGuidelineTree
+from services.llm_cache import get_llm_cache
+from services.llm_provider import get_llm_provider
+from services.numpy_vector_store import NumpyVectorStore
+from services.query_embeddings import get_prompt_embedding, precomputed_query_embedding
+from utils.rag_utils import retrieve_context
+
+# The step modules are shadowed by the functions of the same name exported from `pipeline_steps`.
+embed_step = importlib.import_module('pipelines.cpt_guideline_ingestion.pipeline_steps.embed_guideline_queries')
+criteria_step = importlib.import_module('pipelines.pre_authorization.pipeline_steps.are_cpt_guideline_criteria_met')
+cpt_codes_step = importlib.import_module('pipelines.pre_authorization.pipeline_steps.extract_requested_cpt_codes')
+
+GUIDELINES_FILE_PATH = REPO_ROOT_DIR / 'database/mock_nosql_db/cpt_guidelines/45378.json'
+
+PAGES = [
+    'Patient reports rectal bleeding for the past 6 months.',
+    'Father had colorectal cancer at age 68.',
+    'No colonoscopy has been performed in the past 10 years.',
+]
+
+
+@pytest.fixture
+def fake_llm_provider(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'llm_backend', 'fake')
+    monkeypatch.setattr(env, 'llm_rate_limits_db_path', tmp_path / 'llm_rate_limits.sqlite3')
+    monkeypatch.setattr(env, 'llm_cache_enabled', False)
+    monkeypatch.setattr(env, 'embedding_cache_enabled', False)
+    cached_services = [get_llm_provider, get_llm_cache, get_prompt_embedding]
+    for get_service in cached_services:
+        get_service.cache_clear()
+    yield get_llm_provider()
+    for get_service in cached_services:
+        get_service.cache_clear()
+
+
+@pytest.fixture
+def decision_tree():
+    with open(GUIDELINES_FILE_PATH) as file:
+        return CPTGuidelineDocument(**json.load(file)).decision_tree
+
+
+@pytest.fixture
+def index(fake_llm_provider):
+    vector_store = NumpyVectorStore()
+    return VectorStoreIndex.from_documents(
+        [Document(text=page) for page in PAGES],
+        storage_context=StorageContext.from_defaults(vector_store=vector_store),
+        service_context=fake_llm_provider.service_context(),
+    )
+
+
+def test_pre_authorization_makes_no_query_embedding_calls(fake_llm_provider, decision_tree, index):
+    """
+    Test that once the guideline queries are embedded at ingestion, evaluating the guidelines and
+    extracting the CPT codes retrieve with the precomputed embeddings and embed nothing.
+    """
+    query_embeddings = embed_step.embed_guideline_queries(decision_tree)
+    tree = CompiledGuidelineTree(decision_tree)
+    assert all(
+        precomputed_query_embedding(query_embeddings, query) is not None
+        for query in [*tree.leaf_retrieval_queries, tree.batched_retrieval_query]
+    )
+
+    cpt_codes_step.extract_requested_cpt_codes(index)  # Embeds the fixed prompt once for the process.
+    embedding_calls = fake_llm_provider.transport.embedding_calls
+
+    cpt_codes_step.extract_requested_cpt_codes(index)
+    for mode in [CriteriaEvaluationMode.CONCURRENT, CriteriaEvaluationMode.BATCHED]:
+        criteria_step.are_cpt_guideline_criteria_met(tree, index, mode=mode, query_embeddings=query_embeddings)
+
+    assert fake_llm_provider.transport.embedding_calls == embedding_calls
+
+
+def test_precomputed_query_embedding_retrieves_same_context(fake_llm_provider, decision_tree, index):
+    """Test that retrieving with a precomputed embedding gives the same context as embedding the query."""
+    query_embeddings = embed_step.embed_guideline_queries(decision_tree)
+    query = CompiledGuidelineTree(decision_tree).leaf_retrieval_queries[0]
+
+    assert retrieve_context(
+        index,
+        query=query,
+        similarity_top_k=2,
+        query_embedding=precomputed_query_embedding(query_embeddings, query),
+    ) == retrieve_context(index, query=query, similarity_top_k=2)
+
+
+def test_embeddings_from_another_model_are_ignored(fake_llm_provider, decision_tree):
+    query_embeddings = embed_step.embed_guideline_queries(decision_tree)
+    query = CompiledGuidelineTree(decision_tree).batched_retrieval_query
+
+    assert precomputed_query_embedding(query_embeddings, query) is not None
+    assert precomputed_query_embedding(query_embeddings.model_copy(update={'model': 'other-model'}), query) is None
+    assert precomputed_query_embedding(None, query) is None
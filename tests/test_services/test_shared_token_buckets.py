@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from env import SRC_DIR
+from services.llm_scheduler import LLMScheduler, Priority, llm_priority
+from services.shared_token_buckets import SharedTokenBuckets
+
+# Tries to take 20 requests from a budget of 30 requests per minute without waiting, printing how many were taken.
+TAKE_REQUESTS_SCRIPT = """
+import sys
+from pathlib import Path
+from services.shared_token_buckets import SharedTokenBuckets
+
+buckets = SharedTokenBuckets(Path(sys.argv[1]), rates_per_minute={'requests': 30}, reserved_fraction=0)
+print(sum(buckets.try_take({'requests': 1}, priority=0) == 0 for _ in range(20)))
+"""
+
+
+def test_processes_share_one_budget(tmp_path):
+    """Test that two processes taking from the same buckets together take no more than the budget, rather than each taking it all."""
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', TAKE_REQUESTS_SCRIPT, str(tmp_path / 'llm_rate_limits.sqlite3')],
+            cwd=SRC_DIR,
+            env={**os.environ, 'PYTHONPATH': str(SRC_DIR)},
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(2)
+    ]
+    taken = [int(process.communicate(timeout=30)[0]) for process in processes]
+
+    # 40 requests were made, the budget refills at 0.5 requests per second while they run.
+    assert 30 <= sum(taken) <= 31
+
+
+def test_batch_requests_give_way_to_waiting_interactive_requests(tmp_path):
+    """
+    Test that once an interactive request has to wait for the budget, batch requests using the
+    same buckets from another scheduler (i.e. another process) wait until after it.
+    """
+    db_path = tmp_path / 'llm_rate_limits.sqlite3'
+    web_app_buckets = SharedTokenBuckets(db_path, rates_per_minute={'requests': 60}, reserved_fraction=0)
+    batch_buckets = SharedTokenBuckets(db_path, rates_per_minute={'requests': 60}, reserved_fraction=0)
+    web_app_buckets.take('requests', 55)
+
+    # There is budget for the batch request but not for the interactive request made before it.
+    interactive_wait_seconds = web_app_buckets.try_take({'requests': 10}, priority=Priority.INTERACTIVE)
+    batch_wait_seconds = batch_buckets.try_take({'requests': 1}, priority=Priority.BATCH)
+
+    assert 4.9 < interactive_wait_seconds <= 5
+    assert batch_wait_seconds > 4.8
+    assert batch_buckets.available()['requests'] >= 5
+
+
+def test_batch_requests_leave_the_reserved_budget(tmp_path):
+    buckets = SharedTokenBuckets(tmp_path / 'llm_rate_limits.sqlite3', rates_per_minute={'requests': 60}, reserved_fraction=0.5)
+    buckets.take('requests', 30)
+
+    assert buckets.try_take({'requests': 1}, priority=Priority.BATCH) > 0
+    assert buckets.try_take({'requests': 1}, priority=Priority.INTERACTIVE) == 0
+
+
+def _scheduler(db_path) -> LLMScheduler:
+    return LLMScheduler(
+        requests_per_minute=30,
+        tokens_per_minute=10_000_000,
+        initial_concurrency=8,
+        max_concurrency=8,
+        latency_target_seconds=10.0,
+        max_retries=0,
+        retry_base_delay_seconds=0.001,
+        retry_max_delay_seconds=0.01,
+        shared_token_buckets=SharedTokenBuckets(db_path, rates_per_minute={'requests': 30, 'tokens': 10_000_000}, reserved_fraction=0),
+    )
+
+
+def test_schedulers_take_from_the_shared_buckets(tmp_path):
+    """Test that requests sent by two schedulers (e.g. in two processes) are taken from the one shared budget."""
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions', content=b'{}')
+    schedulers = [_scheduler(tmp_path / 'llm_rate_limits.sqlite3'), _scheduler(tmp_path / 'llm_rate_limits.sqlite3')]
+    with llm_priority(Priority.INTERACTIVE):
+        for _ in range(15):
+            for scheduler in schedulers:
+                scheduler.send(request, lambda request: httpx.Response(200, json={}))
+
+    assert SharedTokenBuckets(
+        tmp_path / 'llm_rate_limits.sqlite3',
+        rates_per_minute={'requests': 30},
+        reserved_fraction=0,
+    ).available()['requests'] < 1
+
+
+def test_scheduler_is_not_locked_while_another_process_holds_the_shared_buckets(tmp_path):
+    """Test that while a request waits for another process to release the shared buckets, the rest of the scheduler carries on."""
+    db_path = tmp_path / 'llm_rate_limits.sqlite3'
+    scheduler = _scheduler(db_path)
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions', content=b'{}')
+    other_process = sqlite3.connect(db_path, isolation_level=None)
+    other_process.execute('BEGIN IMMEDIATE')
+
+    thread = threading.Thread(target=scheduler.send, args=(request, lambda request: httpx.Response(200, json={})))
+    thread.start()
+    time.sleep(0.1)
+    start_time = time.perf_counter()
+    stats = scheduler.stats()
+    stats_seconds = time.perf_counter() - start_time
+    other_process.execute('COMMIT')
+    thread.join(5)
+    other_process.close()
+
+    assert stats_seconds < 0.05
+    assert stats['queued'] == 1
+    assert scheduler.stats()['requests'] == 1
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def _call_concurrently(single_flight: SingleFlight, function, callers: int) -> list:
+    """Makes the calls while the first is still running, then lets it finish."""
+    release = threading.Event()
+
+    def blocking_function():
+        release.wait(5)
+        return function()
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        futures = [executor.submit(single_flight.do, 'key', blocking_function) for _ in range(callers)]
+        while single_flight.stats()['calls'] < callers:
+            release.wait(0.001)
+        release.set()
+    return futures
+
+
+def test_concurrent_calls_share_a_single_call():
+    single_flight = SingleFlight()
+    calls = []
+
+    futures = _call_concurrently(single_flight, lambda: calls.append(1) or 'result', callers=5)
+
+    assert calls == [1]
+    assert sorted(future.result() for future in futures) == [('result', False)] + [('result', True)] * 4
+    assert single_flight.stats() == {'calls': 5, 'coalesced': 4, 'in_flight': 0}
+    # A call once the first has finished runs again.
+    assert single_flight.do('key', lambda: 'next result') == ('next result', False)
+
+
+def test_exception_is_raised_to_every_caller():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError('Failed')
+
+    futures = _call_concurrently(single_flight, fail, callers=3)
+
+    for future in futures:
+        with pytest.raises(ValueError, match='Failed'):
+            future.result()
+    assert single_flight.stats()['in_flight'] == 0
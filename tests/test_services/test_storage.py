@@ -0,0 +1,36 @@
+import hashlib
+import io
+
+import pytest
+from fastapi import UploadFile
+
+from env import env
+from services.storage import Storage, Bucket
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'file_storage_dir', tmp_path)
+    monkeypatch.setattr(env, 'storage_chunk_size_bytes', 4)
+    return Storage()
+
+
+def test_upload_stores_files_by_content_hash(storage):
+    """
+    Test that uploads are stored under the hash of their contents, so identical
+    files are stored once and different files with the same name are both kept.
+    """
+    contents = b'%PDF-1.4 medical record'
+
+    stored_file = storage.upload(UploadFile(io.BytesIO(contents), filename='record.pdf'), Bucket.MEDICAL_RECORDS)
+    duplicate_file = storage.upload(UploadFile(io.BytesIO(contents), filename='copy.PDF'), Bucket.MEDICAL_RECORDS)
+    other_file = storage.upload(UploadFile(io.BytesIO(b'other record'), filename='record.pdf'), Bucket.MEDICAL_RECORDS)
+
+    assert stored_file.sha256 == hashlib.sha256(contents).hexdigest()
+    assert stored_file.file_path.name == f'{stored_file.sha256}.pdf'
+    assert stored_file.file_path.read_bytes() == contents
+    assert duplicate_file == stored_file
+    assert other_file.file_path != stored_file.file_path
+    assert sorted(path.name for path in stored_file.file_path.parent.iterdir()) == sorted(
+        [stored_file.file_path.name, other_file.file_path.name]
+    )
@@ -0,0 +1,51 @@
+import threading
+
+from env import env
+from services import tracing
+from services.metrics import MetricsRegistry
+from services.tracing import span, current_span, traced, with_current_span
+
+
+def test_spans_are_nested_and_recorded_in_metrics(monkeypatch):
+    """
+    Test that a span opened inside another is its child, including on another thread,
+    and that the duration of each span is recorded in the metrics.
+    """
+    metrics = MetricsRegistry()
+    monkeypatch.setattr(tracing, 'get_metrics', lambda: metrics)
+    monkeypatch.setattr(env, 'tracing_enabled', True)
+    children = []
+
+    @traced('child')
+    def child():
+        children.append(current_span())
+
+    with span('parent', record='1') as parent:
+        child()
+        thread_child = with_current_span(child)
+        thread = threading.Thread(target=thread_child)
+        thread.start()
+        thread.join()
+        current_span().set_attribute('node_count', 3)
+
+    assert [child_span.parent for child_span in children] == [parent, parent]
+    assert {child_span.trace_id for child_span in children} == {parent.trace_id}
+    assert parent.attributes == {'record': '1', 'node_count': 3}
+
+    histogram = metrics.histogram('span_duration_seconds', '', ('span', 'status'))
+    assert histogram.count(span='parent', status='ok') == 1
+    assert histogram.count(span='child', status='ok') == 2
+    assert 'span_duration_seconds_bucket{span="child",status="ok",le="+Inf"} 2' in metrics.render()
+
+
+def test_spans_are_noops_when_tracing_is_disabled(monkeypatch):
+    """
+    Test that no span is created when tracing is disabled.
+    """
+    monkeypatch.setattr(env, 'tracing_enabled', False)
+
+    with span('parent') as parent:
+        parent.set_attribute('node_count', 3)
+
+    assert span('parent') is parent
+    assert current_span() is parent
@@ -0,0 +1,27 @@
+from pypdf import PdfReader
+
+from env import env, REPO_ROOT_DIR
+from services.pdf_text_cache import get_pdf_text_cache
+from utils.pdf_utils import extract_pdf_pages
+
+MEDICAL_RECORD_FILE_PATH = REPO_ROOT_DIR / 'data/medical-record-1.pdf'
+
+
+def test_extract_pdf_pages_in_parallel_and_caches_text(tmp_path, monkeypatch):
+    """
+    Test that every page is extracted in order when split across worker processes,
+    and that the text is then read from the cache.
+    """
+    monkeypatch.setattr(env, 'pdf_text_cache_dir', tmp_path)
+    get_pdf_text_cache.cache_clear()
+
+    pages = extract_pdf_pages(MEDICAL_RECORD_FILE_PATH, max_workers=2, pages_per_worker=1)
+
+    reader = PdfReader(MEDICAL_RECORD_FILE_PATH)
+    assert pages == [page.extract_text() for page in reader.pages]
+    assert len(pages) > 1
+
+    assert extract_pdf_pages(MEDICAL_RECORD_FILE_PATH) == pages
+    assert get_pdf_text_cache().stats()['hits'] == 1
+
+    get_pdf_text_cache.cache_clear()
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from env import env
+from services.guideline_cache import get_guideline_cache
+from services.job_queue import get_job_queue
+from web_app.main import app
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'job_queue_db_path', tmp_path / 'job_queue.sqlite3')
+    monkeypatch.setattr(env, 'job_workers', 0)
+    monkeypatch.setattr(env, 'web_app_warmup_enabled', False)
+    cached_services = [get_guideline_cache, get_job_queue]
+    for get_service in cached_services:
+        get_service.cache_clear()
+    with TestClient(app) as client:
+        yield client
+    for get_service in cached_services:
+        get_service.cache_clear()
+
+
+def test_health_reports_the_load_of_this_worker(client):
+    first = client.get('/health').json()
+    second = client.get('/health').json()
+
+    assert first['pid'] == os.getpid()
+    assert first['preloaded'] is False
+    assert first['guideline_cpt_codes'] == 1
+    # Each request counts itself as in flight until its response has been sent.
+    assert second['requests_in_flight'] == 1
+    assert second['requests_handled'] == first['requests_handled'] + 1
@@ -0,0 +1,104 @@
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from data_models.pre_authorization import ExitReason, PreAuthorizationDocument, PriorTreatmentInformation
+from env import REPO_ROOT_DIR, env
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+from services.job_queue import get_job_queue
+from services.single_flight import get_single_flight
+from web_app.main import app
+
+pipeline_module = importlib.import_module('pipelines.pre_authorization.pipeline')
+
+MEDICAL_RECORD_FILE_PATHS = [REPO_ROOT_DIR / 'data/medical-record-1.pdf', REPO_ROOT_DIR / 'data/medical-record-2.pdf']
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'job_queue_db_path', tmp_path / 'job_queue.sqlite3')
+    monkeypatch.setattr(env, 'file_storage_dir', tmp_path / 'file_storage')
+    monkeypatch.setattr(env, 'job_workers', 0)
+    monkeypatch.setattr(env, 'web_app_warmup_enabled', False)
+    cached_services = [get_guideline_cache, get_job_queue]
+    for get_service in cached_services:
+        get_service.cache_clear()
+    with TestClient(app) as client:
+        yield client
+    for get_service in cached_services:
+        get_service.cache_clear()
+
+
+@pytest.fixture
+def pipeline_runs(monkeypatch):
+    """Replaces the pipeline with one which waits until it is released, recording the records it ran for."""
+    runs = []
+    release = threading.Event()
+
+    def pre_authorization_pipeline(medical_record_file_path, medical_record_content_hash=None):
+        runs.append(medical_record_content_hash)
+        release.wait(5)
+        return PreAuthorizationDocument(
+            cpt_code='45378',
+            exit_reason=ExitReason.PRIOR_TREATMENT_SUCCESSFUL,
+            prior_treatment=PriorTreatmentInformation(
+                was_treatment_attempted=True,
+                evidence_of_whether_treatment_was_attempted='Canned evidence.',
+                was_treatment_successful=True,
+                evidence_of_whether_treatment_was_successful='Canned evidence.',
+            ),
+            guidelines='Canned guidelines.',
+            are_guideline_criteria_met=None,
+            guideline_criteria_results=[],
+            medical_record_file_path=str(medical_record_file_path),
+            medical_record_content_hash=medical_record_content_hash,
+        )
+
+    monkeypatch.setattr(pipeline_module, 'pre_authorization_pipeline', pre_authorization_pipeline)
+    return runs, release
+
+
+def _post(client: TestClient, medical_record_file_path, idempotency_key: str | None = None):
+    with open(medical_record_file_path, 'rb') as file:
+        return client.post(
+            '/pre-authorization',
+            files={'medical_record_file': (medical_record_file_path.name, file, 'application/pdf')},
+            headers={'Idempotency-Key': idempotency_key} if idempotency_key else {},
+        )
+
+
+def test_concurrent_submissions_of_a_record_run_the_pipeline_once(client, pipeline_runs):
+    pipeline_runs, release = pipeline_runs
+    single_flight = get_single_flight('pre_authorization')
+    coalesced_count = single_flight.stats()['coalesced']
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(_post, client, MEDICAL_RECORD_FILE_PATHS[0]) for _ in range(3)]
+        # Wait for the other requests to attach to the running pipeline.
+        while single_flight.stats()['coalesced'] < coalesced_count + 2:
+            release.wait(0.001)
+        release.set()
+
+    responses = [future.result() for future in futures]
+    assert [response.status_code for response in responses] == [200] * 3
+    assert len(pipeline_runs) == 1
+    assert Database().count(Collection.PRE_AUTHORIZATIONS) == 1
+
+
+def test_idempotency_key_returns_the_stored_result(client, pipeline_runs):
+    pipeline_runs, release = pipeline_runs
+    release.set()
+
+    first = _post(client, MEDICAL_RECORD_FILE_PATHS[0], idempotency_key='submission-1')
+    retry = _post(client, MEDICAL_RECORD_FILE_PATHS[0], idempotency_key='submission-1')
+    different_record = _post(client, MEDICAL_RECORD_FILE_PATHS[1], idempotency_key='submission-1')
+
+    assert len(pipeline_runs) == 1
+    assert retry.json() == first.json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert different_record.status_code == 422
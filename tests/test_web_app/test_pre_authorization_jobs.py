@@ -0,0 +1,93 @@
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from data_models.job import JobStatus
+from data_models.pre_authorization import ExitReason, PreAuthorizationDocument, PriorTreatmentInformation
+from env import REPO_ROOT_DIR, env
+from services.db import Database, Collection
+from services.guideline_cache import get_guideline_cache
+from services.job_queue import JobQueue, get_job_queue
+from web_app.main import app
+
+pipeline_module = importlib.import_module('pipelines.pre_authorization.pipeline')
+jobs_module = importlib.import_module('web_app.routes.api.pre_authorization_jobs')
+
+MEDICAL_RECORD_FILE_PATHS = [REPO_ROOT_DIR / 'data/medical-record-1.pdf', REPO_ROOT_DIR / 'data/medical-record-2.pdf']
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'job_queue_db_path', tmp_path / 'job_queue.sqlite3')
+    monkeypatch.setattr(env, 'file_storage_dir', tmp_path / 'file_storage')
+    monkeypatch.setattr(env, 'job_workers', 0)
+    monkeypatch.setattr(env, 'web_app_warmup_enabled', False)
+    cached_services = [get_guideline_cache, get_job_queue]
+    for get_service in cached_services:
+        get_service.cache_clear()
+    with TestClient(app) as client:
+        yield client
+    for get_service in cached_services:
+        get_service.cache_clear()
+
+
+def _pre_authorization_pipeline(medical_record_file_path, medical_record_content_hash=None):
+    return PreAuthorizationDocument(
+        cpt_code='45378',
+        exit_reason=ExitReason.PRIOR_TREATMENT_SUCCESSFUL,
+        prior_treatment=PriorTreatmentInformation(
+            was_treatment_attempted=True,
+            evidence_of_whether_treatment_was_attempted='Canned evidence.',
+            was_treatment_successful=True,
+            evidence_of_whether_treatment_was_successful='Canned evidence.',
+        ),
+        guidelines='Canned guidelines.',
+        are_guideline_criteria_met=None,
+        guideline_criteria_results=[],
+        medical_record_file_path=str(medical_record_file_path),
+        medical_record_content_hash=medical_record_content_hash,
+    )
+
+
+def test_retried_job_overwrites_its_pre_authorization(monkeypatch, tmp_path):
+    """Test that a job which runs again after its worker crashed stores its result under the same ID rather than a duplicate."""
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(pipeline_module, 'pre_authorization_pipeline', _pre_authorization_pipeline)
+    job_queue = JobQueue(db_path=tmp_path / 'jobs.sqlite3', lease_seconds=0, max_attempts=2)
+    job_queue.enqueue(
+        job_type=jobs_module.PRE_AUTHORIZATION_JOB_TYPE,
+        payload={
+            'medical_record_file_path': 'medical-record.pdf',
+            'medical_record_content_hash': 'abc',
+            'medical_record_file_name': 'medical-record.pdf',
+        },
+    )
+
+    first_result = jobs_module._run_pre_authorization_job(job_queue.claim(jobs_module.PRE_AUTHORIZATION_JOB_TYPE))
+    retried_result = jobs_module._run_pre_authorization_job(job_queue.claim(jobs_module.PRE_AUTHORIZATION_JOB_TYPE))
+
+    assert retried_result['pre_authorization_id'] == first_result['pre_authorization_id']
+    page = Database().query(Collection.PRE_AUTHORIZATIONS, PreAuthorizationDocument)
+    assert list(page.documents) == [first_result['pre_authorization_id']]
+
+
+def test_batch_queues_a_job_per_medical_record(client):
+    """Test that a batch returns straight away with a pending job for each medical record, which can then be polled."""
+    files = [open(file_path, 'rb') for file_path in MEDICAL_RECORD_FILE_PATHS]
+    try:
+        response = client.post(
+            '/pre-authorization/batch',
+            files=[('medical_record_files', (file_path.name, file, 'application/pdf')) for file_path, file in zip(MEDICAL_RECORD_FILE_PATHS, files)],
+        )
+    finally:
+        for file in files:
+            file.close()
+
+    assert response.status_code == 202
+    jobs = response.json()
+    assert [job['medical_record_file_name'] for job in jobs] == [file_path.name for file_path in MEDICAL_RECORD_FILE_PATHS]
+    assert {job['status'] for job in jobs} == {JobStatus.PENDING.value}
+    for job in jobs:
+        assert client.get(f'/pre-authorization/jobs/{job["job_id"]}').json() == job
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from env import SRC_DIR
+
+# The web app took ~3s to import when the routes imported the pipelines, it now takes <1s, most of it FastAPI.
+IMPORT_TIME_BUDGET_SECONDS = 2.0
+
+# Dependencies which are only needed once a pipeline runs, see `web_app.warmup`.
+LAZY_MODULES = ('llama_index', 'openai', 'pypdf', 'numpy')
+
+
+def _import_times(module: str) -> dict[str, float]:
+    """Imports the module in a new interpreter with `-X importtime`, returning the cumulative seconds of every module it imported."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR,
+        env={**os.environ, 'PYTHONPATH': str(SRC_DIR), 'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'test')},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.removeprefix('import time:').split('|')
+        import_times[name.strip()] = int(cumulative_us) / 1_000_000
+    return import_times
+
+
+def test_web_app_imports_within_budget():
+    import_times = _import_times('web_app.main')
+
+    slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+    assert import_times['web_app.main'] < IMPORT_TIME_BUDGET_SECONDS, f'Slowest imports: {slowest}'
+    assert not [module for module in import_times if module.split('.')[0] in LAZY_MODULES]
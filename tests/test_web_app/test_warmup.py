@@ -0,0 +1,57 @@
+import gc
+import os
+
+import pytest
+from llama_index import Document, StorageContext, VectorStoreIndex
+
+from env import env
+from services.db import Database, Collection, _get_connection_pool
+from services.guideline_cache import get_guideline_cache
+from services.index_cache import get_index_cache
+from services.llm_provider import get_llm_provider
+from services.numpy_vector_store import NumpyVectorStore
+from web_app import warmup
+
+
+@pytest.fixture
+def fake_services(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, 'db_path', tmp_path / 'db.sqlite3')
+    monkeypatch.setattr(env, 'vector_db_dir', tmp_path / 'vector_db')
+    monkeypatch.setattr(env, 'llm_backend', 'fake')
+    monkeypatch.setattr(env, 'llm_rate_limits_db_path', tmp_path / 'llm_rate_limits.sqlite3')
+    monkeypatch.setattr(env, 'embedding_cache_enabled', False)
+    monkeypatch.setattr(warmup, '_is_preloaded', False)
+    cached_services = [get_llm_provider, get_index_cache, get_guideline_cache]
+    for get_service in cached_services:
+        get_service.cache_clear()
+    yield
+    gc.unfreeze()
+    for get_service in cached_services:
+        get_service.cache_clear()
+
+
+def _build_index(content_hash: str, text: str, modified_time: float):
+    vector_store = NumpyVectorStore()
+    VectorStoreIndex.from_documents(
+        [Document(text=text)],
+        storage_context=StorageContext.from_defaults(vector_store=vector_store),
+        service_context=get_llm_provider().service_context(),
+    )
+    vector_store.persist(env.vector_db_dir / content_hash)
+    os.utime(env.vector_db_dir / content_hash, (modified_time, modified_time))
+
+
+def test_preload_loads_the_most_recent_indexes_and_closes_db_connections(fake_services):
+    _build_index('older', 'Patient reports rectal bleeding.', modified_time=1_000)
+    _build_index('newer', 'Father had colorectal cancer.', modified_time=2_000)
+
+    warmup.preload(max_indexes=1)
+
+    assert warmup.is_preloaded()
+    assert get_index_cache().get('newer') is not None
+    assert get_index_cache().get('older') is None
+    # The guidelines are imported from the mock NoSQL DB into the new DB, then compiled.
+    assert get_guideline_cache().stats()['cpt_codes'] == 1
+    assert not [connection for connection in _get_connection_pool(env.db_path)._connections.queue if connection]
+    # Connections are reopened when next used.
+    assert Database().count(Collection.CPT_GUIDELINES) == 1